@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:51:21 krylon>
+#
+# /data/code/python/sloth/agent.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.agent
+
+(c) 2026 Benjamin Walkenhorst
+
+The agent runs on a host that is managed by sloth.fleet. It reads requests
+from standard input and reports the output of the package manager and the
+exit status on standard output, using the protocol described in sloth.fleet.
+"""
+
+import sys
+from dataclasses import asdict
+from typing import BinaryIO, Final
+
+from sloth import common
+from sloth.fleet import OPERATIONS, ProtocolError, read_frame, write_frame
+from sloth.pkg import Operation, PackageManager
+
+
+def perform(pm: PackageManager, op: Operation) -> int:
+    """Perform the operation and return its exit status."""
+    match op:
+        case Operation.Refresh:
+            return pm.refresh()
+        case Operation.Upgrade:
+            return pm.upgrade(yes=True)
+        case Operation.Prefetch:
+            return pm.prefetch()
+        case Operation.Autoremove:
+            return pm.autoremove()
+        case Operation.Cleanup:
+            return pm.cleanup()
+        case Operation.Audit:
+            pm.audit()
+            return pm.last_code
+        case _:
+            raise ValueError(f"Unsupported operation: {op.name}")
+
+
+def serve(infh: BinaryIO, outfh: BinaryIO) -> int:
+    """Answer requests until the other side closes the connection."""
+    log = common.get_logger("agent")
+    pm = PackageManager.create()
+    pm.yes = True
+    pm.sink = lambda line: write_frame(outfh, {"t": "out", "l": line})
+    write_frame(outfh, {"t": "hello", "p": list(pm.platform), "v": common.APP_VERSION})
+
+    allowed: Final[set[str]] = {op.name for op in OPERATIONS.values()}
+    while True:
+        try:
+            req = read_frame(infh)
+        except ProtocolError as err:
+            log.error("Invalid request: %s", err)
+            return 1
+        if req is None:
+            return 0
+        if req["t"] != "req" or req.get("op") not in allowed:
+            write_frame(outfh, {"t": "err", "m": f"Invalid request: {req}"})
+            continue
+        op = Operation[req["op"]]
+        log.info("Perform %s", op.name)
+        try:
+            status = perform(pm, op)
+        except Exception as err:  # pylint: disable-msg=W0718
+            log.error("%s failed: %s", op.name, err)
+            write_frame(outfh, {"t": "err", "m": str(err)})
+        else:
+            exit_msg: dict = {"t": "exit", "s": status}
+            if (stats := pm.take_stats()) is not None:
+                exit_msg["r"] = asdict(stats)
+            write_frame(outfh, exit_msg)
+
+
+if __name__ == '__main__':
+    proto: Final[BinaryIO] = sys.stdout.buffer
+    # Anything that is print()ed must not end up in the protocol stream.
+    sys.stdout = sys.stderr
+    sys.exit(serve(sys.stdin.buffer, proto))
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:24:01 krylon>
+#
+# /data/code/python/sloth/aptindex.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.aptindex
+
+(c) 2026 Benjamin Walkenhorst
+
+Read the package lists that apt downloads and the database of installed
+packages that dpkg maintains directly, instead of asking apt. Both are
+plain text files made up of stanzas in RFC822 style, separated by empty
+lines:
+
+Package: emacs
+Version: 1:28.2+1-15
+Architecture: all
+Description: GNU Emacs editor (metapackage)
+
+The files are memory-mapped, and we only pick out the handful of fields we
+need, so we do not have to copy the files into memory. Large files are cut
+into pieces at stanza boundaries and parsed by several processes at once.
+"""
+
+import glob
+import logging
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import cmp_to_key
+from typing import Final, Iterator, NamedTuple, Optional
+
+from sloth import common, perf
+from sloth.pkg import Package
+
+DPKG_STATUS: Final[str] = "var/lib/dpkg/status"
+EXTENDED_STATES: Final[str] = "var/lib/apt/extended_states"
+APT_LISTS: Final[str] = "var/lib/apt/lists/*_Packages"
+
+# Files larger than this are cut into pieces to be parsed in parallel.
+CHUNK_SIZE: Final[int] = 4 * 2**20
+
+# The fields we pick out of each stanza, in the order they end up in a Record.
+FIELDS: Final[tuple[bytes, ...]] = (b"Package", b"Version", b"Architecture", b"Description", b"Status")
+
+
+# Packages are identified by name and architecture, on a multiarch system
+# the same package can be installed for several architectures.
+Key = tuple[str, str]
+
+
+class Record(NamedTuple):
+    """Record holds the fields we care about of a stanza."""
+
+    name: str
+    version: str
+    arch: str
+    desc: str
+    status: str
+
+    @property
+    def key(self) -> Key:
+        """Return the name and architecture of the package."""
+        return self.name, self.arch
+
+
+# Ordering of characters in Debian version strings, see deb-version(7).
+def _order(c: str) -> int:
+    if c == "":
+        return 0
+    if "0" <= c <= "9":
+        return 0
+    if c.isascii() and c.isalpha():
+        return ord(c)
+    if c == "~":
+        return -1
+    return ord(c) + 256
+
+
+def _verrevcmp(a: str, b: str) -> int:
+    """Compare the upstream versions or revisions of two Debian versions like dpkg does."""
+    i: int = 0
+    j: int = 0
+    while i < len(a) or j < len(b):
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac: int = _order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            bc: int = _order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+        first_diff: int = 0
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if first_diff == 0:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and a[i].isdigit():
+            return 1
+        if j < len(b) and b[j].isdigit():
+            return -1
+        if first_diff != 0:
+            return first_diff
+    return 0
+
+
+def _split_version(v: str) -> tuple[int, str, str]:
+    epoch, colon, rest = v.partition(":")
+    if colon == "":
+        epoch, rest = "0", v
+    upstream, dash, revision = rest.rpartition("-")
+    if dash == "":
+        upstream, revision = rest, ""
+    try:
+        return int(epoch), upstream, revision
+    except ValueError:
+        return 0, rest, ""
+
+
+def compare_versions(a: str, b: str) -> int:
+    """Compare two Debian version numbers.
+
+    Returns a negative number if a is older than b, zero if they are equal,
+    a positive number if a is newer than b.
+    """
+    ea, ua, ra = _split_version(a)
+    eb, ub, rb = _split_version(b)
+    if ea != eb:
+        return ea - eb
+    return _verrevcmp(ua, ub) or _verrevcmp(ra, rb)
+
+
+version_key: Final = cmp_to_key(compare_versions)
+
+
+def _field(buf: mmap.mmap, name: bytes, start: int, end: int) -> str:
+    """Return the value of a field in the stanza buf[start:end], or the empty string."""
+    key: Final[bytes] = name + b": "
+    if buf[start:start + len(key)] == key:
+        pos: int = start
+    else:
+        pos = buf.find(b"\n" + key, start, end)
+        if pos == -1:
+            return ""
+        pos += 1
+    pos += len(key)
+    eol: int = buf.find(b"\n", pos, end)
+    if eol == -1:
+        eol = end
+    return buf[pos:eol].decode("utf-8", "replace").strip()
+
+
+def parse_range(path: str, start: int, end: int) -> list[Record]:
+    """Parse the stanzas in the given part of a file.
+
+    start must be the beginning of a stanza, end the end of one, or the end of
+    the file.
+    """
+    records: list[Record] = []
+    with open(path, "rb") as fh:
+        size: Final[int] = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return records
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            end = min(end, size)
+            pos: int = start
+            while pos < end:
+                stop: int = buf.find(b"\n\n", pos, end)
+                if stop == -1:
+                    stop = end
+                if stop > pos:
+                    rec = Record(*(_field(buf, f, pos, stop) for f in FIELDS))
+                    if rec.name != "":
+                        records.append(rec)
+                pos = stop + 2
+    return records
+
+
+def split_file(path: str, chunk: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    """Cut a file into pieces of about <chunk> bytes at stanza boundaries."""
+    size: Final[int] = os.path.getsize(path)
+    if size <= chunk:
+        return [(0, size)]
+    ranges: list[tuple[int, int]] = []
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        start: int = 0
+        while start < size:
+            cut: int = buf.find(b"\n\n", start + chunk)
+            end: int = size if cut == -1 else cut + 2
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_ranges(path: str, ranges: list[tuple[int, int]]) -> list[Record]:
+    records: list[Record] = []
+    for start, end in ranges:
+        records.extend(parse_range(path, start, end))
+    return records
+
+
+class AptIndex:
+    """AptIndex holds the available and installed packages of a Debian system.
+
+    Packages are indexed by name and architecture. For each of them, we keep
+    the newest version available from the configured repositories, and the
+    version that is installed, if any.
+    """
+
+    __slots__ = [
+        "log",
+        "root",
+        "parallel",
+        "chunk",
+        "stamp",
+        "available",
+        "suites",
+        "installed",
+        "auto",
+        "keys",
+    ]
+
+    log: logging.Logger
+    root: str
+    parallel: int
+    chunk: int
+    stamp: dict[str, Optional[tuple[int, int]]]
+    available: dict[Key, Record]
+    suites: dict[Key, str]
+    installed: dict[Key, Record]
+    auto: set[Key]
+    keys: list[Key]
+
+    def __init__(self, root: Optional[str] = None, parallel: int = 0, chunk: int = CHUNK_SIZE) -> None:
+        self.log = common.get_logger("aptindex")
+        self.root = root or "/"
+        self.parallel = parallel or os.cpu_count() or 1
+        self.chunk = chunk
+        self.stamp = {}
+        self.available = {}
+        self.suites = {}
+        self.installed = {}
+        self.auto = set()
+        self.keys = []
+
+    def path(self, rel: str) -> str:
+        """Return the path of a file below our root."""
+        return os.path.join(self.root, rel)
+
+    def lists(self) -> list[str]:
+        """Return the package lists apt has downloaded."""
+        return sorted(glob.glob(self.path(APT_LISTS)))
+
+    def __stamps(self) -> dict[str, Optional[tuple[int, int]]]:
+        stamps: dict[str, Optional[tuple[int, int]]] = {}
+        for path in [self.path(DPKG_STATUS), self.path(EXTENDED_STATES), *self.lists()]:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                stamps[path] = None
+        return stamps
+
+    def is_current(self) -> bool:
+        """Return True if none of the files have changed since we loaded them."""
+        return len(self.stamp) > 0 and self.stamp == self.__stamps()
+
+    @perf.timed("aptindex.load")
+    def load(self) -> 'AptIndex':
+        """Read the package lists and the dpkg status."""
+        self.stamp = self.__stamps()
+        lists: Final[list[str]] = self.lists()
+        jobs: list[tuple[str, list[tuple[int, int]]]] = []
+        for path in lists:
+            ranges = split_file(path, self.chunk)
+            # Spread the pieces of each file over the workers.
+            step: int = max(1, len(ranges) // self.parallel)
+            jobs.extend((path, ranges[i:i + step]) for i in range(0, len(ranges), step))
+
+        results: list[list[Record]]
+        if self.parallel > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.parallel, len(jobs)),
+                                     mp_context=common.mp_context()) as pool:
+                results = list(pool.map(_parse_ranges, *zip(*jobs)))
+        else:
+            results = [_parse_ranges(path, ranges) for path, ranges in jobs]
+
+        available: dict[Key, Record] = {}
+        suites: dict[Key, str] = {}
+        for (path, _), records in zip(jobs, results):
+            suite: str = suite_of(path)
+            for rec in records:
+                old = available.get(rec.key)
+                if old is None or compare_versions(rec.version, old.version) > 0:
+                    available[rec.key] = rec
+                    suites[rec.key] = suite
+
+        status: Final[str] = self.path(DPKG_STATUS)
+        installed: dict[Key, Record] = {}
+        if os.path.exists(status):
+            for rec in parse_range(status, 0, os.path.getsize(status)):
+                # Status is "want flag state", only the state matters to us.
+                if rec.status.endswith(" installed"):
+                    installed[rec.key] = rec
+
+        auto: set[Key] = set()
+        states: Final[str] = self.path(EXTENDED_STATES)
+        if os.path.exists(states):
+            with open(states, "r", encoding="utf-8", errors="replace") as fh:
+                name: str = ""
+                arch: str = ""
+                for line in fh:
+                    if line.startswith("Package: "):
+                        name, arch = line[9:].strip(), ""
+                    elif line.startswith("Architecture: "):
+                        arch = line[14:].strip()
+                    elif line.startswith("Auto-Installed: 1"):
+                        auto.add((name, arch))
+
+        self.available = available
+        self.suites = suites
+        self.installed = installed
+        self.auto = auto
+        self.keys = sorted(available.keys() | installed.keys())
+        self.log.debug("Loaded %d available and %d installed packages from %d lists",
+                       len(available), len(installed), len(lists))
+        return self
+
+    def info(self, key: Key) -> str:
+        """Return "i" if a package is installed, "i+" if it was installed as a dependency."""
+        if key not in self.installed:
+            return ""
+        return "i+" if key in self.auto else "i"
+
+    def package(self, key: Key) -> Package:
+        """Return the Package for the given name and architecture, the candidate version if there is one."""
+        rec = self.available.get(key) or self.installed[key]
+        return Package(name=rec.name,
+                       desc=rec.desc,
+                       kind=self.suites.get(key, "now"),
+                       version=rec.version,
+                       info=self.info(key),
+                       arch=rec.arch)
+
+    def search(self, *terms: str) -> Iterator[Package]:
+        """Yield the packages whose name or description match all terms.
+
+        Like apt search, the terms are regular expressions, and the search
+        is not case sensitive. Terms that are not valid regular expressions
+        are taken literally.
+        """
+        pats: Final[list[re.Pattern]] = common.search_patterns(terms)
+        for key in self.keys:
+            rec = self.available.get(key) or self.installed[key]
+            if all(p.search(rec.name) or p.search(rec.desc) for p in pats):
+                yield self.package(key)
+
+    def installed_packages(self) -> Iterator[Package]:
+        """Yield the installed packages, with the version that is installed."""
+        for key in self.keys:
+            rec = self.installed.get(key)
+            if rec is not None:
+                cand = self.available.get(key)
+                yield Package(name=rec.name,
+                              desc=rec.desc,
+                              kind=self.suites[key] if cand is not None and cand.version == rec.version else "now",
+                              version=rec.version,
+                              info=self.info(key),
+                              arch=rec.arch)
+
+    def updates(self) -> Iterator[Package]:
+        """Yield the installed packages for which a newer version is available."""
+        for key in self.keys:
+            inst = self.installed.get(key)
+            cand = self.available.get(key)
+            if inst is not None and cand is not None and compare_versions(cand.version, inst.version) > 0:
+                yield self.package(key)
+
+
+def suite_of(path: str) -> str:
+    """Return the suite a package list belongs to, going by its name.
+
+    E.g. deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages
+    belongs to bookworm.
+    """
+    base: Final[str] = os.path.basename(path)
+    _, sep, rest = base.partition("_dists_")
+    if sep == "":
+        return ""
+    return rest.split("_", 1)[0]
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
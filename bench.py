@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:43:52 krylon>
+#
+# /data/code/python/sloth/bench.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.bench
+
+(c) 2026 Benjamin Walkenhorst
+
+Benchmark the parsers for the output of the various package managers.
+A full search returns tens of thousands of packages, so we generate outputs
+of that size, in the format of each backend, measure how fast we can parse
+them and how much memory that takes, and compare the results to a baseline:
+the one recorded earlier on the same machine with --save, if there is one,
+otherwise the one that comes with sloth. Without a baseline to compare to,
+the benchmark fails.
+
+Usage: python3 -m sloth.bench [--sizes 1000,10000] [--save] [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Final, Iterable, Iterator, NamedTuple, Optional
+
+from sloth import common, pkg
+from sloth.pkg import Package
+
+SIZES: Final[list[int]] = [1000, 10000, 100000]
+
+# The baseline that comes with sloth. The rates in it are half of what we
+# measured when we recorded it, so machines slower than ours pass as well,
+# the memory the parsers take does not depend on the machine. For a
+# tighter check, record a baseline of your own with --save.
+BASELINE: Final[str] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Syllables to build package names from, and words to build descriptions from.
+SYLLABLES: Final[list[str]] = [
+    "lib", "py", "gtk", "qt", "x", "font", "perl", "gnome", "kde", "tex",
+    "ocaml", "rust", "go", "node", "ruby", "data", "dev", "doc", "utils", "core",
+    "net", "ssl", "xml", "json", "sql", "img", "snd", "vid", "emacs", "vim",
+]
+WORDS: Final[list[str]] = [
+    "library", "for", "the", "and", "of", "development", "files", "tool", "to",
+    "a", "with", "support", "documentation", "runtime", "module", "Python",
+    "bindings", "GNU", "editor", "extensible", "fast", "parser", "plugin",
+    "server", "client", "utilities", "shared", "data", "fonts", "interface",
+]
+REPOS: Final[list[str]] = ["core", "extra", "multilib", "community"]
+ARCHS: Final[list[str]] = ["amd64", "all", "arm64"]
+
+
+def package_name(rng: random.Random, i: int) -> str:
+    """Return a plausible, unique package name."""
+    parts: list[str] = rng.sample(SYLLABLES, rng.randint(1, 3))
+    return f"{'-'.join(parts)}{i}"
+
+
+def version(rng: random.Random) -> str:
+    """Return a plausible version number, without epoch or revision."""
+    return ".".join(str(rng.randint(0, 30)) for _ in range(rng.randint(2, 4)))
+
+
+def description(rng: random.Random) -> str:
+    """Return a plausible one-line description."""
+    text: str = " ".join(rng.choices(WORDS, k=rng.randint(3, 12)))
+    return text[0].upper() + text[1:]
+
+
+def gen_apt(size: int, rng: random.Random) -> Iterator[str]:
+    """Generate the output of apt search."""
+    yield "Sorting...\n"
+    yield "Full Text Search...\n"
+    for i in range(size):
+        marker: str = rng.choice(["", "", "", "", " [installed]", " [installed,automatic]"])
+        yield f"{package_name(rng, i)}/stable {rng.randint(0, 2)}:{version(rng)}-{rng.randint(1, 9)} {rng.choice(ARCHS)}{marker}\n"
+        yield f"  {description(rng)}\n"
+        yield "\n"
+
+
+def gen_zypper_xml(size: int, rng: random.Random) -> Iterator[str]:
+    """Generate the output of zypper --xmlout search."""
+    yield "<?xml version='1.0'?>\n"
+    yield "<stream>\n"
+    yield '<message type="info">Loading repository data...</message>\n'
+    yield '<search-result version="0.0">\n'
+    yield "<solvable-list>\n"
+    for i in range(size):
+        status: str = rng.choice(["not-installed", "not-installed", "installed", "other-version"])
+        kind: str = rng.choice(["package", "package", "package", "srcpackage", "pattern"])
+        yield f'<solvable status="{status}" name="{package_name(rng, i)}" summary="{description(rng)}" kind="{kind}"/>\n'
+    yield "</solvable-list>\n"
+    yield "</search-result>\n"
+    yield "</stream>\n"
+
+
+def gen_pacman(size: int, rng: random.Random) -> Iterator[str]:
+    """Generate the output of pacman -Ss."""
+    for i in range(size):
+        marker: str = rng.choice(["", "", "", " [installed]"])
+        yield f"{rng.choice(REPOS)}/{package_name(rng, i)} {version(rng)}-{rng.randint(1, 9)}{marker}\n"
+        yield f"    {description(rng)}\n"
+
+
+def gen_pkg(size: int, rng: random.Random) -> Iterator[str]:
+    """Generate the output of pkg search on FreeBSD."""
+    for i in range(size):
+        ident: str = f"{package_name(rng, i)}-{version(rng)}_{rng.randint(0, 5)}"
+        yield f"{ident:<30} {description(rng)}\n"
+
+
+def gen_openbsd(size: int, rng: random.Random) -> Iterator[str]:
+    """Generate the output of pkg_info -Q on OpenBSD."""
+    for i in range(size):
+        flavor: str = rng.choice(["", "", "-no_x11", "-gtk3"])
+        marker: str = rng.choice(["", "", "", " (installed)"])
+        yield f"{package_name(rng, i)}-{version(rng)}p{rng.randint(0, 3)}{flavor}{marker}\n"
+
+
+Generator = Callable[[int, random.Random], Iterator[str]]
+Parser = Callable[[Iterable[str]], Iterator[Package]]
+
+BACKENDS: Final[dict[str, tuple[Generator, Parser]]] = {
+    "apt": (gen_apt, pkg.parse_apt),
+    "zypper": (gen_zypper_xml, pkg.parse_zypper_xml),
+    "pacman": (gen_pacman, pkg.parse_pacman),
+    "pkg": (gen_pkg, pkg.parse_pkg),
+    "openbsd": (gen_openbsd, pkg.parse_openbsd),
+}
+
+
+def generate(backend: str, size: int, seed: int = 42) -> list[str]:
+    """Return the output of a search for <size> packages, one line per item."""
+    gen: Final[Generator] = BACKENDS[backend][0]
+    return list(gen(size, random.Random(seed)))
+
+
+class Result(NamedTuple):
+    """Result holds the performance of one parser on one input size."""
+
+    backend: str
+    size: int
+    seconds: float
+    rate: float        # packages per second
+    throughput: float  # MiB of input per second
+    peak: int          # bytes, the parser's results included
+
+    def key(self) -> str:
+        """Return the key to identify this result in the baseline."""
+        return f"{self.backend}/{self.size}"
+
+
+def measure(backend: str, size: int, repeat: int = 3) -> Result:
+    """Measure how fast a parser is and how much memory it needs.
+
+    The time is the best of <repeat> runs. The memory is measured in a
+    separate run, because tracemalloc slows things down considerably.
+    The input is generated up front, so neither is included.
+    """
+    parser: Final[Parser] = BACKENDS[backend][1]
+    lines: Final[list[str]] = generate(backend, size)
+    nbytes: Final[int] = sum(len(line) for line in lines)
+
+    best: float = float("inf")
+    for _ in range(max(repeat, 1)):
+        start: float = time.perf_counter()
+        count: int = sum(1 for _ in parser(lines))
+        best = min(best, time.perf_counter() - start)
+        if count != size:
+            raise ValueError(f"Parser for {backend} found {count} of {size} packages")
+
+    tracemalloc.start()
+    try:
+        packages = list(parser(lines))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del packages
+
+    return Result(backend=backend,
+                  size=size,
+                  seconds=best,
+                  rate=size / best,
+                  throughput=nbytes / best / 2**20,
+                  peak=peak)
+
+
+def compare(results: Iterable[Result], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    """Compare results to the baseline and describe each regression beyond the threshold.
+
+    A result has regressed if it parses fewer packages per second than
+    (1 - threshold) times the baseline, or needs more memory than
+    (1 + threshold) times the baseline. A result the baseline does not
+    know about counts as a regression, too, we cannot tell if it is one.
+    """
+    regressions: list[str] = []
+    for r in results:
+        base = baseline.get(r.key())
+        if base is None:
+            regressions.append(f"{r.key()}: there is no baseline to compare to")
+            continue
+        if r.rate < base["rate"] * (1 - threshold):
+            regressions.append(f"{r.key()}: {r.rate:,.0f} packages/s, baseline was {base['rate']:,.0f}")
+        if r.peak > base["peak"] * (1 + threshold):
+            regressions.append(f"{r.key()}: peak memory {r.peak / 1024:,.0f} KiB, baseline was {base['peak'] / 1024:,.0f}")
+    return regressions
+
+
+def load_baseline(path: str) -> dict[str, dict[str, float]]:
+    """Load the baseline, or return an empty one if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def user_baseline() -> str:
+    """Return the path of the baseline recorded on this machine."""
+    return os.path.join(common.path.base(), "bench.json")
+
+
+def save_baseline(path: str, results: Iterable[Result]) -> None:
+    """Record the results as the new baseline, keeping results for other sizes."""
+    baseline: dict[str, dict[str, float]] = load_baseline(path)
+    for r in results:
+        baseline[r.key()] = {"rate": r.rate, "peak": r.peak}
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run the benchmarks, return 1 if any of them regressed."""
+    argp = argparse.ArgumentParser(prog="sloth.bench", description="Benchmark the package manager output parsers")
+    argp.add_argument("--sizes",
+                      default=",".join(str(s) for s in SIZES),
+                      help="Comma-separated numbers of packages to parse")
+    argp.add_argument("--backends",
+                      default=",".join(BACKENDS),
+                      help="Comma-separated backends to benchmark")
+    argp.add_argument("--repeat", type=int, default=3, help="Take the best of this many runs")
+    argp.add_argument("--baseline",
+                      help="File with the results to compare to, or to save them to. " +
+                      "By default, the one recorded on this machine, if there is one, " +
+                      "otherwise the one that comes with sloth")
+    argp.add_argument("--threshold", type=float, default=0.25, help="Tolerated regression, 0.25 means 25%%")
+    argp.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+    args = argp.parse_args(argv)
+
+    sizes: Final[list[int]] = [int(s) for s in args.sizes.split(",")]
+    backends: Final[list[str]] = args.backends.split(",")
+    for b in backends:
+        if b not in BACKENDS:
+            argp.error(f"Unknown backend {b}, use one of {', '.join(BACKENDS)}")
+
+    results: list[Result] = []
+    print(f"{'Backend':<10} {'Size':>7} {'Time':>10} {'Packages/s':>12} {'MiB/s':>8} {'Peak':>11}")
+    for b in backends:
+        for size in sizes:
+            r = measure(b, size, args.repeat)
+            results.append(r)
+            print(f"{b:<10} {size:>7} {r.seconds * 1000:>7.1f} ms {r.rate:>12,.0f} {r.throughput:>8.1f} {r.peak / 1024:>7,.0f} KiB")
+
+    if args.save:
+        path: Final[str] = args.baseline or user_baseline()
+        save_baseline(path, results)
+        print(f"Saved baseline to {path}")
+        return 0
+
+    source: Final[str] = args.baseline or (user_baseline() if os.path.exists(user_baseline()) else BASELINE)
+    baseline: Final[dict[str, dict[str, float]]] = load_baseline(source)
+    if len(baseline) == 0:
+        print(f"There is no baseline in {source}, record one with --save")
+        return 1
+    regressions: Final[list[str]] = compare(results, baseline, args.threshold)
+    for reg in regressions:
+        print(f"REGRESSION {reg}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-19 23:50:47 krylon>
+# Time-stamp: <2026-10-17 08:24:01 krylon>
 #
 # /data/code/python/sloth/common.py
 # created on 14. 12. 2023
@@ -19,9 +19,13 @@ sloth.common
 import logging
 import logging.handlers
 import os
+import re
 
 from threading import Lock
-from typing import Final
+from typing import TYPE_CHECKING, Final, Iterable
+
+if TYPE_CHECKING:
+    from multiprocessing.context import BaseContext
 
 APP_NAME: Final[str] = "Sloth"
 APP_VERSION: Final[str] = "0.4.0"
@@ -67,6 +71,18 @@ class Path:
         """Return the path of the configuration file."""
         return os.path.join(self.__base, "sloth.toml")
 
+    def spool(self) -> str:
+        """Return the path of the folder that holds operations not yet written to the database."""
+        return os.path.join(self.__base, "spool")
+
+    def refresh_lock(self) -> str:
+        """Return the path of the file that is locked while the package cache is being refreshed."""
+        return os.path.join(self.__base, "refresh.lock")
+
+    def probe_cache(self) -> str:
+        """Return the path of the file that caches the results of probing the system."""
+        return os.path.join(self.__base, "probe.json")
+
 
 path: Path = Path(os.path.expanduser(f"~/.{APP_NAME.lower()}.d"))
 
@@ -120,6 +136,34 @@ def get_logger(name: str, terminal: bool = True) -> logging.Logger:
         _cache[name] = log_obj
         return log_obj
 
+
+def mp_context() -> 'BaseContext':
+    """Return the multiprocessing context to start worker processes with.
+
+    By the time we need worker processes, other threads are running, and
+    forking a process that has threads can deadlock on a lock one of them
+    held at the time. So we start the workers from a fresh process.
+    """
+    import multiprocessing  # pylint: disable-msg=C0415
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def search_patterns(terms: Iterable[str]) -> list[re.Pattern]:
+    """Compile search terms into case-insensitive regular expressions.
+
+    Terms that are not valid regular expressions, like "c++", are taken
+    literally.
+    """
+    pats: list[re.Pattern] = []
+    for term in terms:
+        try:
+            pats.append(re.compile(term, re.I))
+        except re.error:
+            pats.append(re.compile(re.escape(term), re.I))
+    return pats
+
 # Local Variables: #
 # python-indent: 4 #
 # End: #
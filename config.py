@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-11 16:06:22 krylon>
+# Time-stamp: <2026-10-17 08:37:23 krylon>
 #
 # /data/code/python/sloth/config.py
 # created on 08. 04. 2025
@@ -17,25 +17,59 @@ sloth.config
 """
 
 
+import inspect
 import logging
-from typing import Final
+import os
+import threading
+import tomllib
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Final, Optional, Union
 
 from krylib import fexist
-from tomlkit import TOMLDocument
-from tomlkit.toml_file import TOMLFile
 
-from sloth import common
+from sloth import common, perf
 
 DEFAULT_CONFIG: Final[str] = """# Time-stamp: <2025-04-09 22:02:03 krylon>
 
 [shell]
 refresh-interval = 86400
+# Refresh in the background while the shell is running, and wait up to
+# refresh-jitter seconds longer, so many hosts do not refresh all at once.
+background-refresh = false
+refresh-jitter = 900
 say-yes = true
 remove-dependencies = true
 nice = true
 
+[timeouts]
+# How many seconds an operation may take before the package manager is
+# stopped, by the name of the operation, e.g. refresh, upgrade, or search.
+# default applies to operations that are not listed, 0 means no limit.
+default = 0
+refresh = 1800
+
+[roots]
+# chroots, jails, or container roots to operate on with the roots command
+targets = []
+parallel = 4
+
+[fleet]
+parallel = 8
+# How many seconds a host may take to perform an operation before we give
+# up on it, 0 means no limit.
+timeout = 7200
+
+[fleet.hosts]
+# Maps host names to the command that starts the agent on the host, e.g.
+# pi = ["ssh", "-T", "pi", "python3", "-m", "sloth.agent"]
+# Hosts given on the command line that are not listed here are reached via ssh.
+
 """
 
+# A hung mirror should not keep a refresh going forever.
+DEFAULT_TIMEOUTS: Final[dict[str, int]] = {"default": 0, "refresh": 1800}
+
 
 class Config:
     """Config deals with the configuration file."""
@@ -44,14 +78,13 @@ class Config:
         "path",
         "log",
         "cfg",
-        "file",
     ]
 
     path: str
     log: logging.Logger
-    cfg: TOMLDocument
-    file: TOMLFile
+    cfg: dict[str, Any]
 
+    @perf.timed("config")
     def __init__(self, path: str = "") -> None:
         if path == "":
             path = common.path.config()
@@ -60,12 +93,208 @@ class Config:
         if not fexist(path):
             with open(path, "w", encoding="utf-8") as fh:
                 fh.write(DEFAULT_CONFIG)
-        self.file = TOMLFile(self.path)
-        self.cfg = self.file.read()
+        # We only read the configuration file on startup, so the standard
+        # library's parser is good enough. tomlkit, which preserves comments and
+        # formatting, takes a lot longer to import, so we only load it to save.
+        with open(self.path, "rb") as fh:
+            self.cfg = tomllib.load(fh)
 
     def save(self) -> None:
         """Write the configuration state to disk."""
-        self.file.write(self.cfg)
+        from tomlkit.toml_file import TOMLFile  # pylint: disable-msg=C0415
+
+        file = TOMLFile(self.path)
+        doc = file.read()
+        doc.update(self.cfg)
+        file.write(doc)
+
+
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Settings:
+    """Settings holds the validated contents of the configuration file."""
+
+    refresh_interval: int = 86400
+    background_refresh: bool = False
+    refresh_jitter: int = 900
+    say_yes: bool = True
+    remove_dependencies: bool = True
+    nice: bool = True
+    timeouts: dict[str, int] = field(default_factory=lambda: dict(DEFAULT_TIMEOUTS))
+    roots: tuple[str, ...] = ()
+    roots_parallel: int = 4
+    fleet_parallel: int = 8
+    fleet_timeout: int = 7200
+    fleet_hosts: dict[str, tuple[str, ...]] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, cfg: dict[str, Any]) -> 'Settings':
+        """Validate the parsed configuration file and return the Settings.
+
+        Missing values are replaced by their defaults, values of the wrong
+        type or outside the permitted range raise a ValueError.
+        """
+        shell = _section(cfg, "shell")
+        roots = _section(cfg, "roots")
+        timeouts = _section(cfg, "timeouts")
+        fleet = _section(cfg, "fleet")
+        hosts = _section(fleet, "hosts", "fleet.")
+        for name, cmd in hosts.items():
+            if not isinstance(cmd, list) or len(cmd) == 0 or \
+               not all(isinstance(c, str) for c in cmd):
+                raise ValueError(f"fleet.hosts.{name} must be a non-empty list of strings")
+        targets = roots.get("targets", [])
+        if not isinstance(targets, list) or not all(isinstance(t, str) for t in targets):
+            raise ValueError("roots.targets must be a list of strings")
+
+        return cls(
+            refresh_interval=_value(shell, "shell", "refresh-interval", int, 86400, 0),
+            background_refresh=_value(shell, "shell", "background-refresh", bool, False),
+            refresh_jitter=_value(shell, "shell", "refresh-jitter", int, 900, 0),
+            say_yes=_value(shell, "shell", "say-yes", bool, True),
+            remove_dependencies=_value(shell, "shell", "remove-dependencies", bool, True),
+            nice=_value(shell, "shell", "nice", bool, True),
+            timeouts=DEFAULT_TIMEOUTS | {key: _value(timeouts, "timeouts", key, int, 0, 0) for key in timeouts},
+            roots=tuple(targets),
+            roots_parallel=_value(roots, "roots", "parallel", int, 4, 1),
+            fleet_parallel=_value(fleet, "fleet", "parallel", int, 8, 1),
+            fleet_timeout=_value(fleet, "fleet", "timeout", int, 7200, 0),
+            fleet_hosts={name: tuple(cmd) for name, cmd in hosts.items()},
+        )
+
+
+def _section(cfg: dict[str, Any], name: str, prefix: str = "") -> dict[str, Any]:
+    sec = cfg.get(name, {})
+    if not isinstance(sec, dict):
+        raise ValueError(f"{prefix}{name} must be a table")
+    return sec
+
+
+def _value(sec: dict[str, Any], secname: str, key: str, kind: type, default: Any, minimum: Optional[int] = None) -> Any:
+    val = sec.get(key, default)
+    # bool is a subclass of int, but we do not want to accept true as a number.
+    if not isinstance(val, kind) or (kind is int and isinstance(val, bool)):
+        raise ValueError(f"{secname}.{key} must be of type {kind.__name__}, not {type(val).__name__}")
+    if minimum is not None and val < minimum:
+        raise ValueError(f"{secname}.{key} must be at least {minimum}")
+    return val
+
+
+Subscriber = Callable[[Settings], None]
+
+
+class ConfigService:
+    """ConfigService holds the Settings for the whole process.
+
+    The configuration file is parsed once and re-read only when it has changed
+    on disk, which check() looks for. Components can subscribe to be notified
+    when the Settings change. Subscribing a bound method does not keep its
+    object alive.
+    """
+
+    __slots__ = [
+        "path",
+        "log",
+        "lock",
+        "stamp",
+        "current",
+        "subscribers",
+    ]
+
+    path: str
+    log: logging.Logger
+    lock: threading.Lock
+    stamp: Optional[tuple[int, int, int]]
+    current: Settings
+    subscribers: list[Union[weakref.WeakMethod, Subscriber]]
+
+    def __init__(self, path: str = "") -> None:
+        if path == "":
+            path = common.path.config()
+        self.path = path
+        self.log = common.get_logger("config")
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.current = Settings()
+        self.subscribers = []
+        self.check()
+
+    def __stamp(self) -> Optional[tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def settings(self) -> Settings:
+        """Return the current Settings."""
+        return self.current
+
+    def check(self) -> bool:
+        """Re-read the configuration file if it has changed since we last read it.
+
+        Returns True if the Settings have changed. If the file cannot be parsed
+        or is invalid, we log the error and keep using the previous Settings.
+        """
+        with self.lock:
+            stamp = self.__stamp()
+            if stamp is not None and stamp == self.stamp:
+                return False
+            try:
+                cfg = Config(self.path)
+                new = Settings.from_dict(cfg.cfg)
+            except (OSError, ValueError) as err:
+                # tomllib.TOMLDecodeError is a ValueError, too.
+                self.log.error("Invalid configuration in %s: %s", self.path, err)
+                self.stamp = stamp
+                return False
+            self.stamp = self.__stamp()
+            if new == self.current:
+                return False
+            self.log.debug("Configuration has changed: %s", new)
+            self.current = new
+            subscribers = list(self.subscribers)
+
+        dead: list[Union[weakref.WeakMethod, Subscriber]] = []
+        for sub in subscribers:
+            fn = sub() if isinstance(sub, weakref.WeakMethod) else sub
+            if fn is None:
+                dead.append(sub)
+                continue
+            try:
+                fn(new)
+            except Exception as err:  # pylint: disable-msg=W0718
+                self.log.error("Error notifying %s of changed settings: %s", fn, err)
+        if len(dead) > 0:
+            with self.lock:
+                self.subscribers = [s for s in self.subscribers if s not in dead]
+        return True
+
+    def subscribe(self, fn: Subscriber) -> None:
+        """Call fn with the new Settings whenever they change."""
+        with self.lock:
+            if inspect.ismethod(fn):
+                self.subscribers.append(weakref.WeakMethod(fn))
+            else:
+                self.subscribers.append(fn)
+
+
+_services: Final[dict[str, ConfigService]] = {}
+_services_lock: Final[threading.Lock] = threading.Lock()
+
+
+def service(path: str = "") -> ConfigService:
+    """Return the process-wide ConfigService for the given configuration file."""
+    if path == "":
+        path = common.path.config()
+    with _services_lock:
+        if path not in _services:
+            _services[path] = ConfigService(path)
+        return _services[path]
+
+
+def settings() -> Settings:
+    """Return the current Settings of the default ConfigService."""
+    return service().settings()
 
 # Local Variables: #
 # python-indent: 4 #
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-09 23:38:32 krylon>
+# Time-stamp: <2026-10-17 08:28:58 krylon>
 #
 # /data/code/python/sloth/database.py
 # created on 18. 12. 2023
@@ -16,18 +16,26 @@ sloth.database
 (c) 2023 Benjamin Walkenhorst
 """
 
+import atexit
+import json
 import logging
+import os
+import queue
 import sqlite3
 import threading
 import time
+import uuid
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from enum import Enum, auto
-from typing import Final, Optional
+from typing import Final, Iterable, Optional, Sequence
 
 import krylib
 
-from sloth import common
-from sloth.pkg import Operation
+from sloth import common, perf, snapshot
+from sloth.common import BLANK
+from sloth.pkg import Operation, Package, PackageTable, RunStats
+from sloth.snapshot import Entry
 
 OPEN_LOCK: Final[threading.Lock] = threading.Lock()
 
@@ -46,6 +54,146 @@ INIT_QUERIES: Final[list[str]] = [
     "CREATE INDEX idx_op_status ON operation (status)",
 ]
 
+# MIGRATIONS holds the changes to the schema that were made after the initial
+# version. Each step is applied exactly once, PRAGMA user_version records how
+# many steps a database has seen (plus one for INIT_QUERIES).
+MIGRATIONS: Final[list[list[str]]] = [
+    [
+        """
+        CREATE TABLE catalog (
+            id INTEGER PRIMARY KEY,
+            platform TEXT NOT NULL,
+            name TEXT NOT NULL,
+            version TEXT NOT NULL DEFAULT '',
+            kind TEXT NOT NULL DEFAULT '',
+            info TEXT NOT NULL DEFAULT '',
+            desc TEXT NOT NULL DEFAULT ''
+        ) STRICT
+        """,
+        "CREATE INDEX idx_catalog_platform_name ON catalog (platform, name)",
+        """
+        CREATE VIRTUAL TABLE catalog_fts USING fts5 (
+            name,
+            desc,
+            content = 'catalog',
+            content_rowid = 'id',
+            tokenize = 'unicode61'
+        )
+        """,
+    ],
+    [
+        # Operations on chroots, jails, etc. record the root they were performed on,
+        # operations on the running system leave it empty.
+        "ALTER TABLE operation ADD COLUMN root TEXT NOT NULL DEFAULT ''",
+        "CREATE INDEX idx_op_root ON operation (root, op, timestamp)",
+    ],
+    [
+        # Operations performed on other machines by the fleet runner record the
+        # host, operations on the local machine leave it empty.
+        "ALTER TABLE operation ADD COLUMN host TEXT NOT NULL DEFAULT ''",
+        "CREATE INDEX idx_op_host ON operation (host, op, timestamp)",
+    ],
+    [
+        # Records written by the OpLogger carry a unique id, so replaying the
+        # spool after a crash cannot add them twice.
+        "ALTER TABLE operation ADD COLUMN uid TEXT",
+        "CREATE UNIQUE INDEX idx_op_uid ON operation (uid) WHERE uid IS NOT NULL",
+    ],
+    [
+        # The resources used by the package manager. Older records, and
+        # operations we could not measure, leave them NULL.
+        "ALTER TABLE operation ADD COLUMN platform TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE operation ADD COLUMN duration REAL",
+        "ALTER TABLE operation ADD COLUMN utime REAL",
+        "ALTER TABLE operation ADD COLUMN stime REAL",
+        "ALTER TABLE operation ADD COLUMN maxrss INTEGER",
+        "ALTER TABLE operation ADD COLUMN out_bytes INTEGER",
+        "ALTER TABLE operation ADD COLUMN err_bytes INTEGER",
+        # Covers everything QueryID.OpStats needs, so it never touches the table.
+        """
+        CREATE INDEX idx_op_stats
+        ON operation (timestamp, op, platform, duration, status, maxrss)
+        WHERE duration IS NOT NULL
+        """,
+    ],
+    [
+        # Snapshots of the installed packages. Most of them only hold the
+        # changes since the previous snapshot of the same platform and root,
+        # every now and then, we store a complete one, the keyframe, so we
+        # never have to go back too far to piece a snapshot together.
+        # keyframe is NULL for the keyframes themselves.
+        """
+        CREATE TABLE snapshot (
+            id INTEGER PRIMARY KEY,
+            timestamp INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            root TEXT NOT NULL DEFAULT '',
+            op_uid TEXT,
+            keyframe INTEGER REFERENCES snapshot (id),
+            count INTEGER NOT NULL,
+            changes INTEGER NOT NULL
+        ) STRICT
+        """,
+        "CREATE INDEX idx_snapshot_lineage ON snapshot (platform, root, id)",
+        # A version of NULL means the package was removed.
+        """
+        CREATE TABLE snapshot_entry (
+            snapshot INTEGER NOT NULL REFERENCES snapshot (id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            arch TEXT NOT NULL,
+            version TEXT,
+            repo TEXT NOT NULL,
+            PRIMARY KEY (snapshot, name, arch)
+        ) STRICT, WITHOUT ROWID
+        """,
+    ],
+    [
+        # Results of searches the package manager performed, so asking the
+        # same question again does not cost another run. A result is only
+        # valid until the next refresh, refresh is the id of the last one
+        # before the search, or 0. used is when the result was last used,
+        # count the number of packages in it.
+        """
+        CREATE TABLE search_cache (
+            id INTEGER PRIMARY KEY,
+            platform TEXT NOT NULL,
+            query TEXT NOT NULL,
+            refresh INTEGER NOT NULL,
+            used REAL NOT NULL,
+            count INTEGER NOT NULL,
+            UNIQUE (platform, query, refresh)
+        ) STRICT
+        """,
+        "CREATE INDEX idx_search_cache_used ON search_cache (used)",
+        # The installed state is not kept, it changes more often than the
+        # results do.
+        """
+        CREATE TABLE search_cache_entry (
+            search INTEGER NOT NULL REFERENCES search_cache (id) ON DELETE CASCADE,
+            pos INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            version TEXT,
+            kind TEXT,
+            info TEXT NOT NULL DEFAULT '',
+            arch TEXT,
+            desc TEXT NOT NULL,
+            PRIMARY KEY (search, pos)
+        ) STRICT, WITHOUT ROWID
+        """,
+    ],
+]
+
+# A snapshot is stored in full if there have been this many deltas since
+# the last full one, or if its delta is larger than a fraction of the whole.
+SNAPSHOT_KEYFRAME_INTERVAL: Final[int] = 64
+SNAPSHOT_KEYFRAME_RATIO: Final[float] = 0.5
+
+# The search cache holds no more than this many packages in all. When it
+# is full, the results that were used least recently go first.
+SEARCH_CACHE_LIMIT: Final[int] = 50000
+
+DB_VERSION: Final[int] = len(MIGRATIONS) + 1
+
 
 # pylint: disable-msg=C0103
 class QueryID(Enum):
@@ -54,23 +202,81 @@ class QueryID(Enum):
     OpAdd = auto()
     OpGetRecent = auto()
     OpGetMostRecent = auto()
+    OpAddRecord = auto()
+    OpStats = auto()
+    CatalogClear = auto()
+    CatalogAdd = auto()
+    CatalogReindex = auto()
+    CatalogCount = auto()
+    CatalogSearch = auto()
+    CatalogMark = auto()
+    SnapshotAdd = auto()
+    SnapshotAddEntry = auto()
+    SnapshotLatest = auto()
+    SnapshotGet = auto()
+    SnapshotEntries = auto()
+    SnapshotDeltas = auto()
+    SnapshotList = auto()
+    SearchCacheGet = auto()
+    SearchCacheTouch = auto()
+    SearchCacheEntries = auto()
+    SearchCacheAdd = auto()
+    SearchCacheAddEntry = auto()
+    SearchCacheExpire = auto()
+    SearchCacheEvict = auto()
 
 
 db_queries: Final[dict[QueryID, str]] = {
     QueryID.OpAdd: """
-    INSERT INTO operation (op, timestamp, args, status)
-                   VALUES ( ?,         ?,    ?,      ?)
+    INSERT INTO operation (op, timestamp, args, status, root, host)
+                   VALUES ( ?,         ?,    ?,      ?,    ?,    ?)
     RETURNING id
     """,
+    QueryID.OpAddRecord: """
+    INSERT OR IGNORE INTO operation (op, timestamp, args, status, root, host, uid,
+                                     platform, duration, utime, stime, maxrss, out_bytes, err_bytes)
+                             VALUES ( ?,         ?,    ?,      ?,    ?,    ?,   ?,
+                                            ?,        ?,     ?,     ?,      ?,         ?,         ?)
+    """,
+    # Percentiles use the nearest-rank method: p50 is the smallest duration
+    # that is at least as large as half of all durations, and so on.
+    QueryID.OpStats: """
+    WITH runs AS (
+        SELECT
+            op,
+            platform,
+            duration,
+            status,
+            maxrss,
+            ROW_NUMBER() OVER (PARTITION BY op, platform ORDER BY duration) AS rank,
+            COUNT(*) OVER (PARTITION BY op, platform) AS cnt
+        FROM operation
+        WHERE timestamp >= ? AND duration IS NOT NULL
+    )
+    SELECT
+        op,
+        platform,
+        cnt,
+        MIN(CASE WHEN rank >= 0.50 * cnt THEN duration END) AS p50,
+        MIN(CASE WHEN rank >= 0.95 * cnt THEN duration END) AS p95,
+        MAX(duration),
+        AVG(status <> 0),
+        MAX(maxrss)
+    FROM runs
+    GROUP BY op, platform
+    ORDER BY op, platform
+    """,
     QueryID.OpGetRecent: """
     SELECT
         id,
         op,
         timestamp,
         args,
-        status
+        status,
+        root,
+        host
     FROM operation
-    ORDER BY timestamp DESC
+    ORDER BY timestamp DESC, id DESC
     LIMIT ?
     """,
     QueryID.OpGetMostRecent: """
@@ -80,13 +286,206 @@ db_queries: Final[dict[QueryID, str]] = {
         args,
         status
     FROM operation
-    WHERE op = ?
+    WHERE op = ? AND root = ? AND host = ''
     ORDER BY timestamp DESC
     LIMIT 1
     """,
+    QueryID.CatalogClear: "DELETE FROM catalog WHERE platform = ?",
+    QueryID.CatalogAdd: """
+    INSERT INTO catalog (platform, name, version, kind, info, desc)
+                 VALUES (       ?,    ?,       ?,    ?,    ?,    ?)
+    """,
+    QueryID.CatalogReindex: "INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild')",
+    QueryID.CatalogCount: "SELECT COUNT(id) FROM catalog WHERE platform = ?",
+    QueryID.CatalogSearch: """
+    SELECT
+        c.name,
+        c.version,
+        c.kind,
+        c.info,
+        c.desc
+    FROM catalog_fts f
+    INNER JOIN catalog c ON f.rowid = c.id
+    WHERE catalog_fts MATCH ? AND c.platform = ?
+    ORDER BY c.name = ? DESC, bm25(catalog_fts, 10.0, 1.0), c.name
+    LIMIT ?
+    """,
+    QueryID.CatalogMark: "UPDATE catalog SET info = ? WHERE platform = ? AND name = ?",
+    QueryID.SnapshotAdd: """
+    INSERT INTO snapshot (timestamp, platform, root, op_uid, keyframe, count, changes)
+                  VALUES (        ?,        ?,    ?,      ?,        ?,     ?,       ?)
+    RETURNING id
+    """,
+    QueryID.SnapshotAddEntry: """
+    INSERT INTO snapshot_entry (snapshot, name, arch, version, repo)
+                        VALUES (       ?,    ?,    ?,       ?,    ?)
+    """,
+    QueryID.SnapshotLatest: """
+    SELECT id
+    FROM snapshot
+    WHERE platform = ? AND root = ?
+    ORDER BY id DESC
+    LIMIT 1
+    """,
+    QueryID.SnapshotGet: """
+    SELECT
+        s.id,
+        s.timestamp,
+        s.platform,
+        s.root,
+        s.op_uid,
+        COALESCE(s.keyframe, s.id),
+        s.count,
+        s.changes,
+        o.op,
+        o.args
+    FROM snapshot s
+    LEFT JOIN operation o ON o.uid = s.op_uid
+    WHERE s.id = ?
+    """,
+    # The keyframe and every delta after it, up to the snapshot we want.
+    QueryID.SnapshotEntries: """
+    SELECT
+        e.name,
+        e.arch,
+        e.version,
+        e.repo
+    FROM snapshot s
+    INNER JOIN snapshot_entry e ON e.snapshot = s.id
+    WHERE s.platform = ? AND s.root = ? AND s.id BETWEEN ? AND ?
+    ORDER BY s.id
+    """,
+    QueryID.SnapshotDeltas: """
+    SELECT COUNT(*)
+    FROM snapshot
+    WHERE platform = ? AND root = ? AND keyframe = ?
+    """,
+    QueryID.SnapshotList: """
+    SELECT
+        s.id,
+        s.timestamp,
+        s.platform,
+        s.root,
+        s.op_uid,
+        COALESCE(s.keyframe, s.id),
+        s.count,
+        s.changes,
+        o.op,
+        o.args
+    FROM snapshot s
+    LEFT JOIN operation o ON o.uid = s.op_uid
+    ORDER BY s.id DESC
+    LIMIT ?
+    """,
+    QueryID.SearchCacheGet: "SELECT id FROM search_cache WHERE platform = ? AND query = ? AND refresh = ?",
+    QueryID.SearchCacheTouch: "UPDATE search_cache SET used = ? WHERE id = ?",
+    QueryID.SearchCacheEntries: """
+    SELECT
+        name,
+        version,
+        kind,
+        info,
+        arch,
+        desc
+    FROM search_cache_entry
+    WHERE search = ?
+    ORDER BY pos
+    """,
+    QueryID.SearchCacheAdd: """
+    INSERT OR REPLACE INTO search_cache (platform, query, refresh, used, count)
+                                 VALUES (       ?,     ?,       ?,    ?,     ?)
+    RETURNING id
+    """,
+    QueryID.SearchCacheAddEntry: """
+    INSERT INTO search_cache_entry (search, pos, name, version, kind, info, arch, desc)
+                            VALUES (     ?,   ?,    ?,       ?,    ?,    ?,    ?,    ?)
+    """,
+    # Results from before the last refresh are of no use anymore.
+    QueryID.SearchCacheExpire: "DELETE FROM search_cache WHERE platform = ? AND refresh <> ?",
+    # Keep the most recently used results, as many as fit into the limit.
+    QueryID.SearchCacheEvict: """
+    DELETE FROM search_cache
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT
+                id,
+                SUM(count) OVER (ORDER BY used DESC, id DESC) AS total
+            FROM search_cache
+        )
+        WHERE total > ?
+    )
+    """,
 }
 
 
+def fts_query(*terms: str) -> str:
+    """Turn the user's search terms into an FTS5 query expression.
+
+    Each term is quoted, so characters with a special meaning to FTS5 are
+    taken literally, and matched as a prefix. All terms have to match.
+    """
+    quoted: list[str] = []
+    for t in terms:
+        if t.strip() != "":
+            escaped = t.replace('"', '""')
+            quoted.append(f'"{escaped}"*')
+    return BLANK.join(quoted)
+
+
+def search_key(*terms: str, by: str = "") -> str:
+    """Return the key we cache the results of a search under.
+
+    The package managers we support search case-insensitively, and want all
+    terms to match, so neither case nor the order of the terms matter.
+    by is what was searched, e.g. the summaries, if not just the names.
+    """
+    words: Final[list[str]] = sorted({t.lower() for term in terms for t in term.split()})
+    return f"{by}:{BLANK.join(words)}"
+
+
+@dataclass(slots=True, kw_only=True)
+class OpRecord:
+    """OpRecord is an operation waiting to be written to the database."""
+
+    op: Operation
+    args: str
+    status: int
+    root: str = ""
+    host: str = ""
+    platform: str = ""
+    stats: Optional[RunStats] = None
+    timestamp: int = field(default_factory=lambda: int(time.time()))
+    uid: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def row(self) -> tuple:
+        """Return the parameters for QueryID.OpAddRecord."""
+        s: Final[RunStats] = self.stats or RunStats()
+        measured: Final[bool] = self.stats is not None
+        return (self.op.value, self.timestamp, self.args, self.status, self.root, self.host, self.uid,
+                self.platform,
+                s.wall if measured else None,
+                s.utime if measured else None,
+                s.stime if measured else None,
+                s.maxrss if measured else None,
+                s.out_bytes,
+                s.err_bytes)
+
+    def dump(self) -> str:
+        """Serialize the record for the spool file."""
+        data = asdict(self)
+        data["op"] = self.op.value
+        return json.dumps(data)
+
+    @classmethod
+    def load(cls, line: str) -> 'OpRecord':
+        """Deserialize a record from the spool file."""
+        data = json.loads(line)
+        data["op"] = Operation(data["op"])
+        if data.get("stats") is not None:
+            data["stats"] = RunStats(**data["stats"])
+        return cls(**data)
+
+
 class Database:
     """Wrapper around the database connection that provides the operations we perform."""
 
@@ -100,6 +499,7 @@ class Database:
     log: logging.Logger
     path: Final[str]
 
+    @perf.timed("db.open")
     def __init__(self, path: str = "") -> None:
         if path == "":
             path = common.path.db()
@@ -114,9 +514,12 @@ class Database:
             cur: sqlite3.Cursor = self.db.cursor()
             cur.execute("PRAGMA foreign_keys = true")
             cur.execute("PRAGMA journal_mode = WAL")
+            cur.close()
 
             if not exist:
                 self.__create_db()
+            else:
+                self.__migrate()
 
     def __create_db(self) -> None:
         """Initialize a freshly created database"""
@@ -124,6 +527,38 @@ class Database:
             for query in INIT_QUERIES:
                 cur: sqlite3.Cursor = self.db.cursor()
                 cur.execute(query)
+            for step in MIGRATIONS:
+                for query in step:
+                    cur = self.db.cursor()
+                    cur.execute(query)
+            self.db.execute(f"PRAGMA user_version = {DB_VERSION}")
+
+    def __migrate(self) -> None:
+        """Bring the schema of an existing database up to date."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("PRAGMA user_version")
+        # Databases created before we started tracking the schema version
+        # report 0, but they do have the initial schema.
+        version: int = max(cur.fetchone()[0], 1)
+        if version >= DB_VERSION:
+            return
+        self.log.info("Migrate database schema from version %d to %d",
+                      version,
+                      DB_VERSION)
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for step in MIGRATIONS[version-1:]:
+                for query in step:
+                    cur.execute(query)
+            cur.execute(f"PRAGMA user_version = {DB_VERSION}")
+            cur.execute("COMMIT")
+        except sqlite3.Error:
+            cur.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        self.db.close()
 
     def __enter__(self) -> None:
         self.db.__enter__()
@@ -131,14 +566,33 @@ class Database:
     def __exit__(self, ex_type, ex_val, traceback):
         return self.db.__exit__(ex_type, ex_val, traceback)
 
-    def op_add(self, op: Operation, args: str, status: int) -> int:
-        """Log an operation performed to the database."""
+    def op_add(self, op: Operation, args: str, status: int, root: str = "", host: str = "") -> int:
+        """Log an operation performed to the database.
+
+        root names the chroot, jail, etc. the operation was performed on,
+        host the machine, both are empty for the running system.
+        """
         cur: sqlite3.Cursor = self.db.cursor()
         cur.execute(db_queries[QueryID.OpAdd],
-                    (op.value, int(time.time()), args, status))
+                    (op.value, int(time.time()), args, status, root, host))
         row = cur.fetchone()
         return row[0]
 
+    def op_add_records(self, records: list[OpRecord]) -> None:
+        """Write several operations to the database in a single transaction.
+
+        Records that are already in the database are skipped.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.executemany(db_queries[QueryID.OpAddRecord],
+                            (r.row() for r in records))
+            cur.execute("COMMIT")
+        except:  # noqa: B001,E722 pylint: disable-msg=W0702
+            cur.execute("ROLLBACK")
+            raise
+
     def op_get_recent(self, limit: int = -1) -> list[dict]:
         """Fetch the <limit> most recent recorded operations from the database."""
         cur: sqlite3.Cursor = self.db.cursor()
@@ -150,15 +604,35 @@ class Database:
                 "op": Operation(row[1]),
                 "timestamp": datetime.fromtimestamp(row[2]),
                 "args": row[3],
-                "status": row[4]
+                "status": row[4],
+                "root": row[5],
+                "host": row[6],
             }
             operations.append(op)
         return operations
 
-    def op_get_most_recent(self, op: Operation) -> Optional[dict]:
+    def op_stats(self, since: datetime) -> list[dict]:
+        """Summarize the duration and failure rate of operations since the given time.
+
+        Returns one dict per Operation and platform, durations are in seconds.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.OpStats], (int(since.timestamp()), ))
+        return [{
+            "op": Operation(row[0]),
+            "platform": row[1],
+            "count": row[2],
+            "p50": row[3],
+            "p95": row[4],
+            "max": row[5],
+            "failure_rate": row[6],
+            "maxrss": row[7],
+        } for row in cur]
+
+    def op_get_most_recent(self, op: Operation, root: str = "") -> Optional[dict]:
         """Get the most recent instance of the given Operation."""
         cur: sqlite3.Cursor = self.db.cursor()
-        cur.execute(db_queries[QueryID.OpGetMostRecent], (op.value, ))
+        cur.execute(db_queries[QueryID.OpGetMostRecent], (op.value, root))
         row = cur.fetchone()
         if row is not None:
             return {
@@ -167,9 +641,439 @@ class Database:
                 "timestamp": datetime.fromtimestamp(row[1]),
                 "args": row[2],
                 "status": row[3],
+                "root": root,
+                "host": "",
             }
         return None
 
+    def catalog_refill(self, platform: str, packages: Iterable[Package]) -> int:
+        """Replace the catalog of the given platform with <packages>.
+
+        Returns the number of packages that were added.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(db_queries[QueryID.CatalogClear], (platform, ))
+            cur.executemany(db_queries[QueryID.CatalogAdd],
+                            ((platform,
+                              p.name,
+                              p.version or "",
+                              p.kind or "",
+                              p.info or "",
+                              p.desc or "") for p in packages))
+            cur.execute(db_queries[QueryID.CatalogCount], (platform, ))
+            cnt: int = cur.fetchone()[0]
+            cur.execute(db_queries[QueryID.CatalogReindex])
+            cur.execute("COMMIT")
+        except:  # noqa: B001,E722 pylint: disable-msg=W0702
+            cur.execute("ROLLBACK")
+            raise
+        self.log.debug("Catalog for %s now holds %d packages",
+                       platform,
+                       cnt)
+        return cnt
+
+    def catalog_count(self, platform: str) -> int:
+        """Return the number of packages in the catalog for the given platform."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.CatalogCount], (platform, ))
+        row = cur.fetchone()
+        return row[0]
+
+    def catalog_search(self, platform: str, *terms: str, limit: int = -1) -> PackageTable:
+        """Search the catalog for packages whose name or description match all terms.
+
+        An exact match on the name comes first, after that, matches in the name
+        are ranked higher than matches in the description.
+        """
+        query: Final[str] = fts_query(*terms)
+        if query == "":
+            return PackageTable()
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.CatalogSearch],
+                    (query, platform, BLANK.join(terms), limit))
+        return PackageTable(Package(name=row[0],
+                                    version=row[1] or None,
+                                    kind=row[2],
+                                    info=row[3],
+                                    desc=row[4]) for row in cur)
+
+    def catalog_mark(self, platform: str, info: str, *names: str) -> None:
+        """Set the info field (i.e. the installed state) of the named packages."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.executemany(db_queries[QueryID.CatalogMark],
+                        ((info, platform, n) for n in names))
+
+    def snapshot_add(self, platform: str, entries: list[Entry], root: str = "", op_uid: Optional[str] = None) -> int:
+        """Record the installed packages, return the id of the snapshot.
+
+        If nothing has changed since the last snapshot of the same platform
+        and root, no new snapshot is created, and we return the id of the
+        last one.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(db_queries[QueryID.SnapshotLatest], (platform, root))
+            row = cur.fetchone()
+            keyframe: Optional[int] = None
+            changes: list[Entry] = entries
+            if row is not None:
+                latest: Final[dict] = self.__snapshot_get(cur, row[0])
+                changes = snapshot.delta(self.__snapshot_entries(cur, latest), entries)
+                if len(changes) == 0:
+                    cur.execute("COMMIT")
+                    return latest["id"]
+                cur.execute(db_queries[QueryID.SnapshotDeltas], (platform, root, latest["keyframe"]))
+                deltas: int = cur.fetchone()[0]
+                if deltas + 1 < SNAPSHOT_KEYFRAME_INTERVAL and \
+                   len(changes) < len(entries) * SNAPSHOT_KEYFRAME_RATIO:
+                    keyframe = latest["keyframe"]
+                else:
+                    changes = entries
+            cur.execute(db_queries[QueryID.SnapshotAdd],
+                        (int(time.time()), platform, root, op_uid, keyframe, len(entries), len(changes)))
+            sid: int = cur.fetchone()[0]
+            cur.executemany(db_queries[QueryID.SnapshotAddEntry],
+                            ((sid, e.name, e.arch, e.version, e.repo) for e in changes))
+            cur.execute("COMMIT")
+        except:  # noqa: B001,E722 pylint: disable-msg=W0702
+            cur.execute("ROLLBACK")
+            raise
+        self.log.debug("Snapshot %d of %s holds %d packages, %d changes",
+                       sid, platform, len(entries), len(changes))
+        return sid
+
+    def __snapshot_get(self, cur: sqlite3.Cursor, sid: int) -> dict:
+        cur.execute(db_queries[QueryID.SnapshotGet], (sid, ))
+        row = cur.fetchone()
+        if row is None:
+            return {}
+        return self.__snapshot_dict(row)
+
+    @staticmethod
+    def __snapshot_dict(row: tuple) -> dict:
+        return {
+            "id": row[0],
+            "timestamp": datetime.fromtimestamp(row[1]),
+            "platform": row[2],
+            "root": row[3],
+            "op_uid": row[4],
+            "keyframe": row[5],
+            "count": row[6],
+            "changes": row[7],
+            "op": None if row[8] is None else Operation(row[8]),
+            "args": row[9] or "",
+        }
+
+    def __snapshot_entries(self, cur: sqlite3.Cursor, info: dict) -> list[Entry]:
+        cur.execute(db_queries[QueryID.SnapshotEntries],
+                    (info["platform"], info["root"], info["keyframe"], info["id"]))
+        state: dict[snapshot.Key, Entry] = {}
+        snapshot.apply(state, (Entry(*row) for row in cur.fetchall()))
+        return sorted(state.values())
+
+    def snapshot_latest(self, platform: str, root: str = "") -> Optional[int]:
+        """Return the id of the most recent snapshot of the given platform and root, or None if there is none."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.SnapshotLatest], (platform, root))
+        row = cur.fetchone()
+        return None if row is None else row[0]
+
+    def snapshot_get(self, sid: int) -> Optional[dict]:
+        """Return the details of a snapshot, or None if there is no such snapshot."""
+        info: Final[dict] = self.__snapshot_get(self.db.cursor(), sid)
+        return info or None
+
+    def snapshot_entries(self, sid: int) -> list[Entry]:
+        """Return the packages that were installed at the time of a snapshot."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        info: Final[dict] = self.__snapshot_get(cur, sid)
+        if not info:
+            raise KeyError(f"There is no snapshot {sid}")
+        return self.__snapshot_entries(cur, info)
+
+    def snapshot_list(self, limit: int = -1) -> list[dict]:
+        """Return the <limit> most recent snapshots, newest first."""
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.SnapshotList], (limit, ))
+        return [self.__snapshot_dict(row) for row in cur.fetchall()]
+
+    def search_cache_get(self, platform: str, query: str, refresh: int) -> Optional[PackageTable]:
+        """Return the cached results of a search, or None if we have none.
+
+        refresh is the id of the most recent refresh, results from before it
+        do not count.
+        """
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute(db_queries[QueryID.SearchCacheGet], (platform, query, refresh))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        cur.execute(db_queries[QueryID.SearchCacheTouch], (time.time(), row[0]))
+        cur.execute(db_queries[QueryID.SearchCacheEntries], (row[0], ))
+        return PackageTable(Package(name=r[0],
+                                    version=r[1],
+                                    kind=r[2],
+                                    info=r[3],
+                                    arch=r[4],
+                                    desc=r[5]) for r in cur.fetchall())
+
+    def search_cache_put(self, platform: str, query: str, refresh: int, packages: Sequence[Package],
+                         limit: int = SEARCH_CACHE_LIMIT) -> bool:
+        """Store the results of a search, return True if they were stored.
+
+        Results from before the most recent refresh are dropped, and if the
+        cache holds more than limit packages, the results that were used least
+        recently go until it does not. A result that is larger than the limit
+        on its own is not stored at all.
+        """
+        if len(packages) > limit:
+            return False
+        cur: sqlite3.Cursor = self.db.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(db_queries[QueryID.SearchCacheExpire], (platform, refresh))
+            cur.execute(db_queries[QueryID.SearchCacheAdd],
+                        (platform, query, refresh, time.time(), len(packages)))
+            sid: Final[int] = cur.fetchone()[0]
+            cur.executemany(db_queries[QueryID.SearchCacheAddEntry],
+                            ((sid,
+                              pos,
+                              p.name,
+                              p.version,
+                              p.kind,
+                              p.info or "",
+                              p.arch,
+                              p.desc or "") for pos, p in enumerate(packages)))
+            cur.execute(db_queries[QueryID.SearchCacheEvict], (limit, ))
+            cur.execute("COMMIT")
+        except:  # noqa: B001,E722 pylint: disable-msg=W0702
+            cur.execute("ROLLBACK")
+            raise
+        return True
+
+
+class OpLogger:
+    """OpLogger writes operations to the database in the background.
+
+    Package manager operations can take a long time, and we do not want to hold
+    on to the database while they run. So instead of writing to the database
+    directly, operations are queued and written by a dedicated thread, which
+    gathers whatever has piled up into one short transaction.
+    Until it is written, each record is kept in a spool file, so it survives
+    a crash. Spool files left behind by processes that are no longer running
+    are replayed on startup.
+    """
+
+    __slots__ = [
+        "log",
+        "path",
+        "spool_dir",
+        "spool",
+        "batch_size",
+        "linger",
+        "lock",
+        "outstanding",
+        "queue",
+        "writer",
+    ]
+
+    log: logging.Logger
+    path: str
+    spool_dir: str
+    spool: str
+    batch_size: int
+    linger: float
+    lock: threading.Lock
+    outstanding: int
+    queue: queue.Queue
+    writer: threading.Thread
+
+    def __init__(self, path: str = "", spool_dir: str = "", batch_size: int = 64, linger: float = 0.05) -> None:
+        if path == "":
+            path = common.path.db()
+        if spool_dir == "":
+            spool_dir = common.path.spool()
+        self.log = common.get_logger("oplog")
+        self.path = path
+        self.spool_dir = spool_dir
+        self.spool = os.path.join(spool_dir, f"{os.getpid()}.spool")
+        self.batch_size = batch_size
+        self.linger = linger
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.queue = queue.Queue()
+        os.makedirs(spool_dir, exist_ok=True)
+        self.writer = threading.Thread(target=self.__run,
+                                       name="oplog",
+                                       daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def log_op(self, op: Operation, args: str, status: int, **kwargs) -> OpRecord:
+        """Queue an operation to be written to the database.
+
+        Keyword arguments are passed on to OpRecord, e.g. root, host, platform,
+        and stats.
+        """
+        rec = OpRecord(op=op, args=args, status=status, **kwargs)
+        with self.lock:
+            with open(self.spool, "a", encoding="utf-8") as fh:
+                fh.write(rec.dump() + "\n")
+                fh.flush()
+                os.fsync(fh.fileno())
+            self.outstanding += 1
+        self.queue.put(rec)
+        return rec
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued operations have been handled by the writer, or timeout seconds have passed.
+
+        Return True if there are no queued operations left. If the writer
+        thread is gone, we do not wait at all.
+        """
+        deadline: Final[Optional[float]] = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0:
+                if not self.writer.is_alive():
+                    self.log.error("The writer thread is gone, %d operations are left in the spool",
+                                   self.queue.unfinished_tasks)
+                    return False
+                wait: float = 0.5
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                # We wake up now and then to check on the writer.
+                self.queue.all_tasks_done.wait(wait)
+        return True
+
+    def close(self) -> None:
+        """Write all queued operations and stop the writer thread."""
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+    def __open(self) -> Optional[Database]:
+        """Open the database, return None if that fails."""
+        try:
+            db: Final[Database] = Database(self.path)
+        except Exception as err:  # pylint: disable-msg=W0718
+            self.log.error("Cannot open the database %s: %s", self.path, err)
+            return None
+        try:
+            self.__replay(db)
+        except Exception as err:  # pylint: disable-msg=W0718
+            self.log.error("Failed to replay abandoned spool files: %s", err)
+        return db
+
+    def __run(self) -> None:
+        db: Optional[Database] = self.__open()
+        # Records we failed to write, we try again with the next batch. They
+        # stay in the spool until they are written, so if we never get to
+        # write them, the next process will.
+        failed: list[OpRecord] = []
+        while True:
+            rec = self.queue.get()
+            batch: list[OpRecord] = []
+            stop: bool = rec is None
+            taken: int = 1
+            try:
+                if rec is not None:
+                    batch.append(rec)
+                while not stop and len(batch) < self.batch_size:
+                    try:
+                        rec = self.queue.get(timeout=self.linger)
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if rec is None:
+                        stop = True
+                    else:
+                        batch.append(rec)
+                if db is None:
+                    db = self.__open()
+                if db is not None and len(failed) + len(batch) > 0:
+                    failed = self.__write(db, failed + batch)
+                else:
+                    failed.extend(batch)
+            except Exception as err:  # pylint: disable-msg=W0718
+                self.log.error("Failed to write %d operations: %s", len(batch), err)
+                failed.extend(batch)
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+            if stop:
+                if len(failed) > 0:
+                    self.log.error("%d operations could not be written, they are left in %s",
+                                   len(failed),
+                                   self.spool)
+                return
+
+    def __write(self, db: Database, batch: list[OpRecord]) -> list[OpRecord]:
+        """Write a batch of records, retrying for a while if the database is busy.
+
+        Return the records that could not be written.
+        """
+        delay: float = 0.1
+        for _ in range(5):
+            try:
+                db.op_add_records(batch)
+                break
+            except sqlite3.OperationalError as err:
+                self.log.debug("Cannot write operations, retrying: %s", err)
+                time.sleep(delay)
+                delay *= 2
+        else:
+            self.log.error("Failed to write %d operations to the database, will try again later", len(batch))
+            return batch
+
+        with self.lock:
+            self.outstanding -= len(batch)
+            if self.outstanding == 0:
+                try:
+                    os.unlink(self.spool)
+                except FileNotFoundError:
+                    pass
+        return []
+
+    def __replay(self, db: Database) -> None:
+        """Write the records from spool files abandoned by crashed processes."""
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".spool"):
+                continue
+            try:
+                pid = int(name.removesuffix(".spool"))
+                if pid == os.getpid():
+                    continue
+                os.kill(pid, 0)
+                continue  # Still running, that is not ours to replay.
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+
+            spool: str = os.path.join(self.spool_dir, name)
+            records: list[OpRecord] = []
+            with open(spool, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        records.append(OpRecord.load(line))
+                    except (ValueError, TypeError, KeyError):
+                        # Probably the last line, cut off by the crash.
+                        self.log.debug("Skip invalid line in %s: %s", spool, line)
+            self.log.info("Replay %d operations from %s", len(records), spool)
+            try:
+                db.op_add_records(records)
+            except sqlite3.Error as err:
+                self.log.error("Failed to replay %s: %s", spool, err)
+                continue
+            os.unlink(spool)
+
 # Local Variables: #
 # python-indent: 4 #
 # End: #
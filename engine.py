@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:38:56 krylon>
+#
+# /data/code/python/sloth/engine.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.engine
+
+(c) 2026 Benjamin Walkenhorst
+
+The engine runs the package manager. It is built on asyncio, so it can read
+standard output and standard error at the same time, and give up on a
+command that takes too long. The functions without the async prefix wrap it
+for the synchronous code in sloth.pkg. Each call has an event loop of its
+own, so several threads can run commands side by side, which is how
+PackageManager.run_roots operates on several roots at once.
+
+Commands whose output we read run in a process group of their own. When one
+runs out of time, or we are interrupted, the whole group gets SIGTERM, and
+SIGKILL if it does not go away within GRACE seconds, so the package manager
+does not keep running behind our back, nor do its helpers, e.g. the
+download methods of apt. Commands that talk to the terminal stay in our
+process group, so they can read from it; Ctrl-C reaches them anyway.
+
+Importing asyncio takes a while, so sloth.pkg only imports this module when
+it runs a command.
+"""
+
+import asyncio
+import codecs
+import io
+import os
+import signal
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Final, Iterator, Optional, Sequence
+
+from sloth import common
+
+# How long a process gets to exit after SIGTERM, before we send SIGKILL.
+GRACE: Final[float] = 5.0
+# How much output we read at once.
+CHUNK: Final[int] = 1 << 16
+
+Sink = Callable[[str], None]
+
+
+@dataclass(slots=True, kw_only=True)
+class Result:
+    """Result is the outcome of running a command.
+
+    The output is only kept if it was captured, the sizes are known if it
+    passed through our hands at all.
+    """
+
+    code: int
+    stdout: Optional[str] = None
+    stderr: Optional[str] = None
+    out_bytes: Optional[int] = None
+    err_bytes: Optional[int] = None
+    timed_out: bool = False
+
+
+class Decoder:
+    """Decoder turns chunks of output into lines, the way text mode does: newlines are translated, broken UTF-8 is replaced."""
+
+    __slots__ = ["dec", "rest", "size"]
+
+    dec: io.IncrementalNewlineDecoder
+    rest: str
+    size: int
+
+    def __init__(self) -> None:
+        self.dec = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("replace"),
+                                                translate=True)
+        self.rest = ""
+        self.size = 0
+
+    def feed(self, chunk: bytes, final: bool = False) -> list[str]:
+        """Return the complete lines, with their newline, the chunk finishes."""
+        self.size += len(chunk)
+        text: Final[str] = self.rest + self.dec.decode(chunk, final)
+        lines: Final[list[str]] = text.splitlines(keepends=True)
+        if not final and len(lines) > 0 and not lines[-1].endswith("\n"):
+            self.rest = lines.pop()
+        else:
+            self.rest = ""
+        return lines
+
+
+def _signal(proc: asyncio.subprocess.Process, sig: int, group: bool) -> None:
+    try:
+        if group:
+            try:
+                os.killpg(proc.pid, sig)
+                return
+            except PermissionError:
+                # Some members of the group run as root, e.g. behind sudo,
+                # the leader passes the signal on to them.
+                pass
+        proc.send_signal(sig)
+    except ProcessLookupError:
+        pass
+
+
+async def stop(proc: asyncio.subprocess.Process, group: bool) -> None:
+    """Terminate a process, or its whole process group, and wait for it."""
+    if proc.returncode is not None:
+        return
+    log = common.get_logger("engine")
+    log.debug("Terminate process %d", proc.pid)
+    _signal(proc, signal.SIGTERM, group)
+    try:
+        await asyncio.wait_for(proc.wait(), GRACE)
+    except TimeoutError:
+        log.warning("Process %d did not exit after SIGTERM, killing it", proc.pid)
+        _signal(proc, signal.SIGKILL, group)
+        await proc.wait()
+
+
+async def _drain(stream: Optional[asyncio.StreamReader], sink: Optional[Sink], keep: bool) -> tuple[str, int]:
+    """Read a stream until it ends, pass each line to sink, return the text if we keep it, and its size."""
+    assert stream is not None
+    dec: Final[Decoder] = Decoder()
+    parts: list[str] = []
+    while chunk := await stream.read(CHUNK):
+        for line in dec.feed(chunk):
+            if sink is not None:
+                sink(line.rstrip("\n"))
+            if keep:
+                parts.append(line)
+    for line in dec.feed(b"", True):
+        if sink is not None:
+            sink(line.rstrip("\n"))
+        if keep:
+            parts.append(line)
+    return "".join(parts), dec.size
+
+
+async def run_async(cmd: Sequence[str],
+                    capture: bool = False,
+                    sink: Optional[Sink] = None,
+                    env: Optional[dict[str, str]] = None,
+                    timeout: Optional[float] = None) -> Result:
+    """Run a command and wait for it to finish, or for timeout seconds to pass.
+
+    With capture, standard output and standard error are collected and
+    returned. With a sink, both are passed to it line by line. Otherwise,
+    the command uses our terminal.
+    If the coroutine is cancelled, the command is terminated.
+    """
+    piped: Final[bool] = capture or sink is not None
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL if piped else None,
+        stdout=asyncio.subprocess.PIPE if piped else None,
+        stderr=(asyncio.subprocess.STDOUT if sink is not None else asyncio.subprocess.PIPE) if piped else None,
+        env=env,
+        start_new_session=piped)
+
+    async def complete() -> tuple[tuple[str, int], tuple[str, int]]:
+        out: tuple[str, int] = ("", 0)
+        err: tuple[str, int] = ("", 0)
+        if sink is not None:
+            out = await _drain(proc.stdout, sink, False)
+        elif capture:
+            out, err = await asyncio.gather(_drain(proc.stdout, None, True),
+                                            _drain(proc.stderr, None, True))
+        await proc.wait()
+        return out, err
+
+    try:
+        out, err = await asyncio.wait_for(complete(), timeout)
+    except TimeoutError:
+        common.get_logger("engine").error("%s did not finish within %.0f seconds", cmd[0], timeout)
+        await stop(proc, piped)
+        assert proc.returncode is not None
+        return Result(code=proc.returncode, timed_out=True)
+    except asyncio.CancelledError:
+        await stop(proc, piped)
+        raise
+
+    assert proc.returncode is not None
+    if sink is not None:
+        return Result(code=proc.returncode, out_bytes=out[1])
+    if capture:
+        return Result(code=proc.returncode,
+                      stdout=out[0],
+                      stderr=err[0],
+                      out_bytes=out[1],
+                      err_bytes=err[1])
+    return Result(code=proc.returncode)
+
+
+def run(cmd: Sequence[str], **kwargs) -> Result:
+    """Run a command and wait for it to finish. See run_async for the keyword arguments.
+
+    On Ctrl-C, the command is terminated before KeyboardInterrupt is raised.
+    """
+    return asyncio.run(run_async(cmd, **kwargs))
+
+
+def lines(cmd: Sequence[str],
+          result: list[Result],
+          env: Optional[dict[str, str]] = None,
+          timeout: Optional[float] = None) -> Iterator[str]:
+    """Run a command and yield its standard output line by line, while it is running.
+
+    Standard error is collected on the side. Once the command has exited,
+    its Result is appended to result. If the caller stops early, or the
+    command takes longer than timeout seconds, it is terminated.
+    The event loop only runs while we wait for output, so each call has
+    one of its own, and the command is read in chunks rather than lines.
+    """
+    loop: Final[asyncio.AbstractEventLoop] = asyncio.new_event_loop()
+    proc: Optional[asyncio.subprocess.Process] = None
+    timed_out: bool = False
+    dec: Final[Decoder] = Decoder()
+    try:
+        proc = loop.run_until_complete(asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            start_new_session=True))
+        assert proc.stdout is not None
+        errors = loop.create_task(_drain(proc.stderr, None, True))
+        deadline: Final[Optional[float]] = None if timeout is None else loop.time() + timeout
+
+        def until(step: Coroutine[Any, Any, Any]) -> Any:
+            """Run step until it completes, or the deadline passes, which raises TimeoutError."""
+            remaining: Final[Optional[float]] = None if deadline is None else max(deadline - loop.time(), 0)
+            return loop.run_until_complete(asyncio.wait_for(step, remaining))
+
+        while True:
+            try:
+                chunk: bytes = until(proc.stdout.read(CHUNK))
+                if not chunk:
+                    # Closing its output does not mean the command has
+                    # exited, we wait for it, rather than cut it short.
+                    until(proc.wait())
+            except TimeoutError:
+                common.get_logger("engine").error("%s did not finish within %.0f seconds", cmd[0], timeout)
+                timed_out = True
+                break
+            if not chunk:
+                yield from dec.feed(b"", True)
+                break
+            yield from dec.feed(chunk)
+    finally:
+        if proc is not None:
+            # The command is still running if it ran out of time, if the
+            # caller stopped early, or if we were interrupted.
+            if proc.returncode is None:
+                loop.run_until_complete(stop(proc, True))
+            loop.run_until_complete(proc.wait())
+            stderr, err_size = loop.run_until_complete(errors)
+            assert proc.returncode is not None
+            result.append(Result(code=proc.returncode,
+                                 stderr=stderr,
+                                 out_bytes=dec.size,
+                                 err_bytes=err_size,
+                                 timed_out=timed_out))
+        # E.g. a read that was interrupted by Ctrl-C.
+        pending: Final = asyncio.all_tasks(loop)
+        if len(pending) > 0:
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
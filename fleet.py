@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:37:23 krylon>
+#
+# /data/code/python/sloth/fleet.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.fleet
+
+(c) 2026 Benjamin Walkenhorst
+
+Drive the package managers of many machines at once. On each host, we start
+an agent (see sloth.agent) through some transport that connects to its
+standard input and output, usually ssh, and talk to it using a simple framed
+protocol.
+
+Each frame consists of a four byte length in network byte order, followed by
+a JSON object of that length, encoded in UTF-8. The key "t" holds the type of
+the frame:
+
+- hello: sent by the agent on startup, carries platform and version
+- req:   sent by the runner, asks the agent to perform operation "op"
+- out:   a line "l" of output from the package manager
+- exit:  the operation has finished with exit status "s", "r" holds the
+         resources the package manager used (see sloth.pkg.RunStats)
+- err:   the agent could not perform the operation, "m" says why
+"""
+
+import asyncio
+import json
+import logging
+import struct
+from typing import BinaryIO, Callable, Final, Optional
+
+from sloth import common
+from sloth.database import OpLogger
+from sloth.pkg import Operation, RunStats
+
+HEADER: Final[struct.Struct] = struct.Struct("!I")
+MAX_FRAME: Final[int] = 16 * 2**20
+
+# After it has reported, an agent exits when we close its input. If it has
+# not done so after this many seconds, we kill it.
+GRACE: Final[float] = 10.0
+
+# The operations a fleet can perform.
+OPERATIONS: Final[dict[str, Operation]] = {
+    "refresh": Operation.Refresh,
+    "upgrade": Operation.Upgrade,
+    "prefetch": Operation.Prefetch,
+    "audit": Operation.Audit,
+    "autoremove": Operation.Autoremove,
+    "clean": Operation.Cleanup,
+}
+
+
+class ProtocolError(Exception):
+    """ProtocolError indicates the other side sent something we do not understand."""
+
+
+def encode_frame(msg: dict) -> bytes:
+    """Serialize a message into a frame."""
+    body: Final[bytes] = json.dumps(msg, separators=(",", ":")).encode("utf-8")
+    if len(body) > MAX_FRAME:
+        raise ProtocolError(f"Frame is too large: {len(body)} bytes")
+    return HEADER.pack(len(body)) + body
+
+
+def decode_frame(body: bytes) -> dict:
+    """Deserialize the body of a frame."""
+    try:
+        msg = json.loads(body.decode("utf-8"))
+    except ValueError as err:
+        raise ProtocolError(f"Invalid frame: {err}") from err
+    if not isinstance(msg, dict) or "t" not in msg:
+        raise ProtocolError(f"Invalid frame: {body[:64]!r}")
+    return msg
+
+
+def _check_size(header: bytes) -> int:
+    size: int = HEADER.unpack(header)[0]
+    if size > MAX_FRAME:
+        raise ProtocolError(f"Frame is too large: {size} bytes")
+    return size
+
+
+def read_frame(fh: BinaryIO) -> Optional[dict]:
+    """Read one frame from a file. Return None at EOF."""
+    header: bytes = fh.read(HEADER.size)
+    if len(header) == 0:
+        return None
+    if len(header) < HEADER.size:
+        raise ProtocolError("Unexpected EOF in frame header")
+    size: Final[int] = _check_size(header)
+    body: bytes = fh.read(size)
+    if len(body) < size:
+        raise ProtocolError("Unexpected EOF in frame body")
+    return decode_frame(body)
+
+
+def write_frame(fh: BinaryIO, msg: dict) -> None:
+    """Write one frame to a file."""
+    fh.write(encode_frame(msg))
+    fh.flush()
+
+
+async def read_frame_async(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Read one frame from an asyncio stream. Return None at EOF."""
+    try:
+        header: bytes = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as err:
+        if len(err.partial) == 0:
+            return None
+        raise ProtocolError("Unexpected EOF in frame header") from err
+    size: Final[int] = _check_size(header)
+    try:
+        body: bytes = await reader.readexactly(size)
+    except asyncio.IncompleteReadError as err:
+        raise ProtocolError("Unexpected EOF in frame body") from err
+    return decode_frame(body)
+
+
+def agent_command(host: str) -> list[str]:
+    """Return the default command to start an agent on the given host."""
+    return ["ssh", "-T", host, "python3", "-m", "sloth.agent"]
+
+
+# A progress callback receives the host and a line of output.
+Progress = Callable[[str, str], None]
+
+
+class Fleet:
+    """Fleet performs operations on many hosts concurrently."""
+
+    __slots__ = [
+        "log",
+        "oplog",
+        "hosts",
+        "parallel",
+        "progress",
+        "platforms",
+        "stats",
+        "timeout",
+    ]
+
+    log: logging.Logger
+    oplog: OpLogger
+    hosts: dict[str, list[str]]
+    parallel: int
+    progress: Optional[Progress]
+    platforms: dict[str, tuple[str, ...]]
+    stats: dict[str, RunStats]
+    timeout: float
+
+    def __init__(self,
+                 oplog: OpLogger,
+                 hosts: dict[str, list[str]],
+                 parallel: int = 8,
+                 progress: Optional[Progress] = None,
+                 timeout: float = 0) -> None:
+        """Create a Fleet.
+
+        hosts maps the name of each host to the command that starts the agent
+        on it. parallel limits how many hosts we talk to at the same time.
+        timeout is the number of seconds an agent may take to perform the
+        operation, 0 means no limit.
+        """
+        self.log = common.get_logger("fleet")
+        self.oplog = oplog
+        self.hosts = hosts
+        self.parallel = max(parallel, 1)
+        self.progress = progress
+        self.platforms = {}
+        self.stats = {}
+        self.timeout = timeout
+
+    def run(self, op: Operation, args: str = "") -> dict[str, int]:
+        """Perform an operation on all hosts. See run_async."""
+        return asyncio.run(self.run_async(op, args))
+
+    async def run_async(self, op: Operation, args: str = "") -> dict[str, int]:
+        """Perform an operation on all hosts.
+
+        The result of each host is recorded in the database as soon as it
+        is available. Returns a dictionary that maps each host to the exit
+        status of the operation, or -1 if the agent could not be reached or
+        failed to perform it.
+        """
+        sem = asyncio.Semaphore(self.parallel)
+
+        async def limited(host: str) -> tuple[str, int]:
+            async with sem:
+                status = await self._run_host(host, op, args)
+            platform: Final[tuple[str, ...]] = self.platforms.get(host, ())
+            self.oplog.log_op(op, args, status,
+                              host=host,
+                              platform=platform[0] if platform else "",
+                              stats=self.stats.get(host))
+            return host, status
+
+        results = await asyncio.gather(*(limited(h) for h in self.hosts))
+        return dict(results)
+
+    def _report(self, host: str, line: str) -> None:
+        if self.progress is not None:
+            self.progress(host, line)
+
+    async def _run_host(self, host: str, op: Operation, args: str) -> int:
+        """Talk to the agent on a single host."""
+        cmd: Final[list[str]] = self.hosts[host]
+        self.log.debug("Start agent on %s: %s", host, " ".join(cmd))
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd,
+                                                        stdin=asyncio.subprocess.PIPE,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+        except OSError as err:
+            self.log.error("Cannot start agent on %s: %s", host, err)
+            return -1
+
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        assert proc.stderr is not None
+
+        async def drain_stderr(stream: asyncio.StreamReader) -> None:
+            async for line in stream:
+                self._report(host, line.decode("utf-8", "replace").rstrip("\n"))
+
+        stderr_task = asyncio.create_task(drain_stderr(proc.stderr))
+        status: int = -1
+        # Whether the agent has reported, and may exit on its own.
+        done: bool = False
+        try:
+            proc.stdin.write(encode_frame({"t": "req", "op": op.name, "a": args}))
+            await proc.stdin.drain()
+            status, done = await asyncio.wait_for(self._exchange(host, proc.stdout), self.timeout or None)
+        except TimeoutError:
+            self.log.error("Agent on %s did not finish within %d seconds", host, self.timeout)
+        except (ProtocolError, OSError) as err:
+            self.log.error("Error talking to agent on %s: %s", host, err)
+            status = -1
+        finally:
+            if not proc.stdin.is_closing():
+                proc.stdin.close()
+            await self._finish(proc, proc.stdout, done)
+            await stderr_task
+
+        return status
+
+    async def _exchange(self, host: str, stdout: asyncio.StreamReader) -> tuple[int, bool]:
+        """Read the agent's messages until it reports.
+
+        Returns the exit status, and whether the agent has reported.
+        """
+        while (msg := await read_frame_async(stdout)) is not None:
+            match msg["t"]:
+                case "hello":
+                    self.platforms[host] = tuple(msg.get("p", ()))
+                case "out":
+                    self._report(host, msg.get("l", ""))
+                case "exit":
+                    if isinstance(msg.get("r"), dict):
+                        try:
+                            self.stats[host] = RunStats(**msg["r"])
+                        except TypeError:
+                            self.log.debug("Invalid resource usage from %s: %s", host, msg["r"])
+                    return int(msg.get("s", -1)), True
+                case "err":
+                    self.log.error("Agent on %s failed: %s", host, msg.get("m"))
+                    return -1, True
+                case _:
+                    raise ProtocolError(f"Unexpected frame type {msg['t']}")
+        self.log.error("Agent on %s hung up before the operation finished", host)
+        return -1, False
+
+    async def _finish(self, proc: asyncio.subprocess.Process, stdout: asyncio.StreamReader, done: bool) -> None:
+        """Wait for the agent to exit, kill it if it has not reported or takes too long.
+
+        Whatever the agent still writes is thrown away, so it cannot get
+        stuck on a full pipe.
+        """
+        async def discard() -> None:
+            while await stdout.read(65536):
+                pass
+
+        drain: Final[asyncio.Task] = asyncio.create_task(discard())
+        try:
+            await asyncio.wait_for(proc.wait(), GRACE if done else 0)
+        except TimeoutError:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+        await drain
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:50:08 krylon>
+#
+# /data/code/python/sloth/manifest.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.manifest
+
+(c) 2026 Benjamin Walkenhorst
+
+A manifest is a list of packages, exported on one machine and imported on
+another to install the same set of packages there. It is a text file with
+one package per line: name, architecture, and version, separated by tabs.
+Lines starting with # are comments, the first few of them tell where and
+when the manifest was written.
+
+Installing a few thousand packages in one go will not work, the command
+line would exceed ARG_MAX, and a single name the package manager does not
+know would make the whole thing fail. So we install in batches that fit
+the command line, and if a batch fails, we split it in half and try again,
+until we have narrowed it down to the names that fail on their own.
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Final, Iterable, Iterator, Sequence
+
+from sloth import common
+from sloth.common import DATE_FMT_NICE
+from sloth.snapshot import Entry
+
+HEADER: Final[str] = "# sloth manifest 1"
+SEP: Final[str] = "\t"
+
+# Even if the command line had room for more, we do not ask the package
+# manager to install more than this many packages at once. Resolving the
+# dependencies of a huge batch takes a while, and if it fails, we have more
+# to bisect.
+MAX_BATCH: Final[int] = 512
+
+
+def write(path: str, platform: str, entries: Iterable[Entry]) -> int:
+    """Write a manifest, return the number of packages in it.
+
+    The file is replaced atomically, so an interrupted export does not leave a
+    truncated manifest behind.
+    """
+    tmp: Final[str] = f"{path}.tmp"
+    cnt: int = 0
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(f"{HEADER}\n")
+        fh.write(f"# platform: {platform}\n")
+        fh.write(f"# exported: {datetime.now().strftime(DATE_FMT_NICE)}\n")
+        for e in entries:
+            fh.write(f"{e.name}{SEP}{e.arch}{SEP}{e.version or ''}\n")
+            cnt += 1
+    os.replace(tmp, path)
+    return cnt
+
+
+def read(path: str) -> tuple[dict[str, str], list[Entry]]:
+    """Read a manifest, return the fields from its header and the packages.
+
+    Raise ValueError if the file is not a manifest.
+    """
+    header: Final[dict[str, str]] = {}
+    entries: Final[list[Entry]] = []
+    with open(path, "r", encoding="utf-8") as fh:
+        if fh.readline().rstrip("\n") != HEADER:
+            raise ValueError(f"{path} is not a sloth manifest")
+        for num, line in enumerate(fh, 2):
+            line = line.rstrip("\n")
+            if line.startswith("#"):
+                key, sep, val = line[1:].partition(":")
+                if sep != "":
+                    header[key.strip()] = val.strip()
+                continue
+            if line.strip() == "":
+                continue
+            fields = line.split(SEP)
+            if fields[0] == "" or len(fields) > 3:
+                raise ValueError(f"Invalid line {num} in {path}: {line!r}")
+            fields.extend([""] * (3 - len(fields)))
+            entries.append(Entry(name=fields[0], arch=fields[1], version=fields[2], repo=""))
+    return header, entries
+
+
+def arg_cost(arg: str) -> int:
+    """Return how much of ARG_MAX an argument takes up: its bytes, the terminating NUL, and the pointer to it."""
+    return len(arg.encode("utf-8")) + 1 + 8
+
+
+def arg_space(prefix: Sequence[str]) -> int:
+    """Return how many bytes of arguments can follow prefix on a command line.
+
+    The environment counts against ARG_MAX as well, as does the command
+    itself. We leave some room, in case sudo or the like adds to either.
+    """
+    try:
+        limit: int = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        limit = -1
+    if limit <= 0:
+        # The smallest value POSIX allows.
+        limit = 4096
+    used: int = sum(arg_cost(f"{k}={v}") for k, v in os.environ.items())
+    used += sum(arg_cost(a) for a in prefix)
+    return max(limit - used - 2048, 0)
+
+
+def batches(names: Sequence[str], space: int, limit: int = MAX_BATCH) -> Iterator[list[str]]:
+    """Split names into batches that fit into space bytes, and hold no more than limit names each.
+
+    Raise ValueError if a single name does not fit.
+    """
+    batch: list[str] = []
+    size: int = 0
+    for name in names:
+        cost: int = arg_cost(name)
+        if cost > space:
+            raise ValueError(f"{name[:32]}... does not fit on a command line")
+        if len(batch) > 0 and (size + cost > space or len(batch) >= limit):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(name)
+        size += cost
+    if len(batch) > 0:
+        yield batch
+
+
+def install_batched(install: Callable[[list[str]], int],
+                    names: Sequence[str],
+                    space: int,
+                    limit: int = MAX_BATCH) -> list[str]:
+    """Install names in batches, return the names that could not be installed.
+
+    install is called with each batch and returns the exit code of the
+    package manager. A batch that fails is split in half, and both halves
+    are tried again, so a bad name costs about log2(batch size) extra calls,
+    and does not keep the rest of its batch from being installed.
+    """
+    log: Final[logging.Logger] = common.get_logger("manifest")
+    failed: Final[list[str]] = []
+
+    def attempt(batch: list[str]) -> None:
+        code: Final[int] = install(batch)
+        if code == 0:
+            return
+        if len(batch) == 1:
+            log.error("Failed to install %s: exit code %d", batch[0], code)
+            failed.append(batch[0])
+            return
+        log.debug("Installing a batch of %d packages failed, splitting it in half", len(batch))
+        half: Final[int] = len(batch) // 2
+        attempt(batch[:half])
+        attempt(batch[half:])
+
+    for batch in batches(names, space, limit):
+        attempt(batch)
+    return failed
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:24:41 krylon>
+#
+# /data/code/python/sloth/pacmandb.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.pacmandb
+
+(c) 2026 Benjamin Walkenhorst
+
+Read pacman's databases directly, instead of asking pacman. Each sync
+database (/var/lib/pacman/sync/<repo>.db) is a compressed tar archive with
+one directory per package, the local database (/var/lib/pacman/local) is a
+plain directory of the same shape. The file we care about is the desc file
+in each package's directory, which consists of sections like these:
+
+%NAME%
+emacs
+
+%VERSION%
+29.4-3
+
+The contents of each database are cached, keyed by the file's mtime and
+size, so after a pacman -Sy we only read the repositories that have
+actually changed.
+"""
+
+import bz2
+import glob
+import gzip
+import logging
+import lzma
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import cmp_to_key
+from typing import Callable, Final, Iterator, NamedTuple, Optional
+
+from sloth import common, perf
+from sloth.pkg import Package
+
+DB_PATH: Final[str] = "var/lib/pacman"
+CONF_PATH: Final[str] = "etc/pacman.conf"
+
+# pacman.conf only tells us about repositories, not about the databases.
+REPO_PAT: Final[re.Pattern] = re.compile(r"^\s*\[([^\]]+)\]")
+
+# The reason for installing a package, from the local desc file.
+REASON_EXPLICIT: Final[str] = "0"
+REASON_DEPEND: Final[str] = "1"
+
+# Sync databases are tar archives, usually compressed with gzip.
+MAGIC: Final[list[tuple[bytes, Callable[[bytes], bytes]]]] = [
+    (b"\x1f\x8b", gzip.decompress),
+    (b"BZh", bz2.decompress),
+    (b"\xfd7zXZ\x00", lzma.decompress),
+]
+
+Stamp = tuple[int, int]
+
+
+class Record(NamedTuple):
+    """Record holds the fields we care about of a desc file."""
+
+    name: str
+    version: str
+    desc: str
+    reason: str
+    arch: str
+
+
+def parse_desc(text: str) -> Optional[Record]:
+    """Parse the contents of a desc file, return None if it has no name."""
+    fields: dict[str, str] = {}
+    for section in text.split("\n\n"):
+        key, _, value = section.strip("\n").partition("\n")
+        fields[key] = value
+    name: Final[str] = fields.get("%NAME%", "")
+    if name == "":
+        return None
+    return Record(name=name,
+                  version=fields.get("%VERSION%", ""),
+                  desc=fields.get("%DESC%", ""),
+                  reason=fields.get("%REASON%", REASON_EXPLICIT),
+                  arch=fields.get("%ARCH%", ""))
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompress a sync database, going by its magic number.
+
+    Raises ValueError if it is compressed with something the standard
+    library does not support, e.g. zstd.
+    """
+    for magic, method in MAGIC:
+        if data.startswith(magic):
+            return method(data)
+    if data[257:262] == b"ustar":
+        return data
+    raise ValueError(f"Unsupported compression, magic number {data[:4]!r}")
+
+
+def _pax_path(data: bytes) -> Optional[bytes]:
+    """Return the path from a pax extended header, if there is one."""
+    pos: int = 0
+    while pos < len(data):
+        space: int = data.find(b" ", pos)
+        if space == -1:
+            break
+        length: int = int(data[pos:space])
+        key, _, value = data[space + 1:pos + length - 1].partition(b"=")
+        if key == b"path":
+            return value
+        pos += length
+    return None
+
+
+def walk_tar(data: bytes) -> Iterator[tuple[str, bytes]]:
+    """Yield the name and contents of each regular file in an uncompressed tar archive.
+
+    Sync databases contain thousands of tiny files, which the tarfile module
+    handles rather slowly, so we walk the headers ourselves.
+    """
+    pos: int = 0
+    longname: Optional[bytes] = None
+    while pos + 512 <= len(data):
+        # The archive ends with blocks of zeroes, which have no checksum.
+        if data[pos + 148:pos + 156].strip(b"\0 ") == b"":
+            break
+        name: bytes = data[pos:pos + 100].split(b"\0", 1)[0]
+        size: int = int(data[pos + 124:pos + 136].split(b"\0", 1)[0].strip() or b"0", 8)
+        kind: bytes = data[pos + 156:pos + 157]
+        # GNU tar puts other things where POSIX tar keeps the prefix.
+        if data[pos + 257:pos + 263] == b"ustar\0":
+            prefix: bytes = data[pos + 345:pos + 500].split(b"\0", 1)[0]
+            if prefix != b"":
+                name = prefix + b"/" + name
+        start: int = pos + 512
+        pos = start + (size + 511) // 512 * 512
+        if kind == b"L":
+            longname = data[start:start + size].split(b"\0", 1)[0]
+        elif kind == b"x":
+            longname = _pax_path(data[start:start + size]) or longname
+        elif kind in (b"0", b"\0"):
+            if longname is not None:
+                name, longname = longname, None
+            yield name.decode("utf-8", "replace"), data[start:start + size]
+        else:
+            longname = None
+
+
+def read_sync(path: str) -> list[Record]:
+    """Read the desc files from a sync database."""
+    with open(path, "rb") as fh:
+        data: Final[bytes] = decompress(fh.read())
+    records: list[Record] = []
+    for name, content in walk_tar(data):
+        if name.endswith("/desc"):
+            rec = parse_desc(content.decode("utf-8", "replace"))
+            if rec is not None:
+                records.append(rec)
+    return records
+
+
+def read_local(path: str) -> list[Record]:
+    """Read the desc files from the local database."""
+    records: list[Record] = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, "desc"), "r", encoding="utf-8", errors="replace") as fh:
+                    rec = parse_desc(fh.read())
+            except FileNotFoundError:
+                continue
+            if rec is not None:
+                records.append(rec)
+    return records
+
+
+def _isalnum(c: str) -> bool:
+    return c.isascii() and c.isalnum()
+
+
+def _isalpha(c: str) -> bool:
+    return c.isascii() and c.isalpha()
+
+
+def _isdigit(c: str) -> bool:
+    return c.isascii() and c.isdigit()
+
+
+def rpmvercmp(a: str, b: str) -> int:
+    """Compare two version strings the way libalpm does. Returns -1, 0, or 1."""
+    if a == b:
+        return 0
+    i: int = 0
+    j: int = 0
+    while i < len(a) and j < len(b):
+        si, sj = i, j
+        while i < len(a) and not _isalnum(a[i]):
+            i += 1
+        while j < len(b) and not _isalnum(b[j]):
+            j += 1
+        if i >= len(a) or j >= len(b):
+            break
+        # A longer separator wins, i.e. 1..0 is newer than 1.0
+        if i - si != j - sj:
+            return -1 if i - si < j - sj else 1
+
+        si, sj = i, j
+        isnum: bool = _isdigit(a[i])
+        match = _isdigit if isnum else _isalpha
+        while i < len(a) and match(a[i]):
+            i += 1
+        while j < len(b) and match(b[j]):
+            j += 1
+        if j == sj:
+            # The segments differ in type, numbers are newer than letters.
+            return 1 if isnum else -1
+        seg_a: str = a[si:i]
+        seg_b: str = b[sj:j]
+        if isnum:
+            seg_a = seg_a.lstrip("0")
+            seg_b = seg_b.lstrip("0")
+            if len(seg_a) != len(seg_b):
+                return 1 if len(seg_a) > len(seg_b) else -1
+        if seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+
+    if i >= len(a) and j >= len(b):
+        return 0
+    # Whatever is left over makes a version newer, unless it starts with a
+    # letter: 1.0alpha is older than 1.0
+    if (i >= len(a) and not _isalpha(b[j])) or (i < len(a) and _isalpha(a[i])):
+        return -1
+    return 1
+
+
+def _split_version(v: str) -> tuple[str, str, Optional[str]]:
+    """Split a version into epoch, version, and release."""
+    digits: int = 0
+    while digits < len(v) and _isdigit(v[digits]):
+        digits += 1
+    epoch: str = "0"
+    if digits < len(v) and v[digits] == ":":
+        epoch = v[:digits] or "0"
+        v = v[digits + 1:]
+    version, dash, release = v.rpartition("-")
+    if dash == "":
+        return epoch, v, None
+    return epoch, version, release
+
+
+def vercmp(a: str, b: str) -> int:
+    """Compare two package versions like pacman's vercmp.
+
+    Returns -1 if a is older than b, 0 if they are equal, 1 if a is newer.
+    The release is only compared if both versions have one.
+    """
+    if a == b:
+        return 0
+    ea, va, ra = _split_version(a)
+    eb, vb, rb = _split_version(b)
+    ret: int = rpmvercmp(ea, eb)
+    if ret == 0:
+        ret = rpmvercmp(va, vb)
+        if ret == 0 and ra is not None and rb is not None:
+            ret = rpmvercmp(ra, rb)
+    return ret
+
+
+version_key: Final = cmp_to_key(vercmp)
+
+
+class PacmanDB:
+    """PacmanDB holds the contents of pacman's sync databases and the local database.
+
+    Each database is read only if it has changed since we read it last. We
+    keep the repositories in the order pacman.conf lists them, because, like
+    pacman, we take a package from the first repository that has it.
+    """
+
+    __slots__ = [
+        "log",
+        "root",
+        "parallel",
+        "stamps",
+        "repos",
+        "sync",
+        "local",
+        "unreadable",
+    ]
+
+    log: logging.Logger
+    root: str
+    parallel: int
+    stamps: dict[str, Optional[Stamp]]
+    repos: list[str]
+    sync: dict[str, dict[str, Record]]
+    local: dict[str, Record]
+    unreadable: set[str]
+
+    def __init__(self, root: Optional[str] = None, parallel: int = 0) -> None:
+        self.log = common.get_logger("pacmandb")
+        self.root = root or "/"
+        self.parallel = parallel or os.cpu_count() or 1
+        self.stamps = {}
+        self.repos = []
+        self.sync = {}
+        self.local = {}
+        self.unreadable = set()
+
+    def path(self, *rel: str) -> str:
+        """Return the path of a file below our root."""
+        return os.path.join(self.root, *rel)
+
+    def sync_path(self, repo: str) -> str:
+        """Return the path of a repository's sync database."""
+        return self.path(DB_PATH, "sync", f"{repo}.db")
+
+    def databases(self) -> list[str]:
+        """Return the names of the sync databases, in the order pacman uses them."""
+        found: Final[dict[str, str]] = {
+            os.path.basename(p)[:-3]: p for p in glob.glob(self.path(DB_PATH, "sync", "*.db"))
+        }
+        order: list[str] = []
+        try:
+            with open(self.path(CONF_PATH), "r", encoding="utf-8", errors="replace") as fh:
+                for line in fh:
+                    m = REPO_PAT.match(line)
+                    if m is not None and m[1] in found and m[1] not in order:
+                        order.append(m[1])
+        except FileNotFoundError:
+            pass
+        order.extend(sorted(found.keys() - set(order)))
+        return order
+
+    def __stamp(self, path: str) -> Optional[Stamp]:
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def __current(self) -> dict[str, Optional[Stamp]]:
+        stamps: dict[str, Optional[Stamp]] = {
+            self.sync_path(repo): None for repo in self.databases()
+        }
+        # Installing or removing a package adds or removes a directory.
+        stamps[self.path(DB_PATH, "local")] = None
+        for path in stamps:
+            stamps[path] = self.__stamp(path)
+        return stamps
+
+    def is_current(self) -> bool:
+        """Return True if none of the databases have changed since we read them."""
+        return len(self.stamps) > 0 and self.stamps == self.__current()
+
+    @perf.timed("pacmandb.load")
+    def load(self) -> 'PacmanDB':
+        """Read the databases that have changed since the last call."""
+        current: Final[dict[str, Optional[Stamp]]] = self.__current()
+        repos: Final[list[str]] = self.databases()
+        stale: Final[list[str]] = [r for r in repos
+                                   if self.stamps.get(self.sync_path(r)) != current[self.sync_path(r)]]
+        paths: Final[list[str]] = [self.sync_path(r) for r in stale]
+
+        results: list[Optional[list[Record]]]
+        if self.parallel > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.parallel, len(paths)),
+                                     mp_context=common.mp_context()) as pool:
+                results = list(pool.map(_read_sync, paths))
+        else:
+            results = [_read_sync(p) for p in paths]
+
+        sync: dict[str, dict[str, Record]] = {r: self.sync[r] for r in repos if r in self.sync}
+        for repo, records in zip(stale, results):
+            if records is None:
+                self.log.error("Cannot read the sync database for %s", repo)
+                self.unreadable.add(repo)
+                sync.pop(repo, None)
+                continue
+            self.unreadable.discard(repo)
+            sync[repo] = {rec.name: rec for rec in records}
+        self.unreadable &= set(repos)
+
+        local_dir: Final[str] = self.path(DB_PATH, "local")
+        if current[local_dir] is None:
+            self.local = {}
+        elif self.stamps.get(local_dir) != current[local_dir]:
+            self.local = {rec.name: rec for rec in read_local(local_dir)}
+
+        self.repos = repos
+        self.sync = sync
+        self.stamps = current
+        self.log.debug("Read %d of %d sync databases, %d packages are installed",
+                       len(stale), len(repos), len(self.local))
+        return self
+
+    def info(self, name: str) -> str:
+        """Return "i" if a package is installed, "i+" if it was installed as a dependency."""
+        rec = self.local.get(name)
+        if rec is None:
+            return ""
+        return "i+" if rec.reason == REASON_DEPEND else "i"
+
+    def candidate(self, name: str) -> Optional[tuple[str, Record]]:
+        """Return the repository and Record pacman would install a package from."""
+        for repo in self.repos:
+            rec = self.sync.get(repo, {}).get(name)
+            if rec is not None:
+                return repo, rec
+        return None
+
+    def search(self, *terms: str) -> Iterator[Package]:
+        """Yield the packages whose name or description match all terms.
+
+        Like pacman -Ss, the terms are regular expressions, the search is not
+        case sensitive, and a package is listed once for every repository
+        that has it. Terms that are not valid regular expressions are taken
+        literally.
+        """
+        pats: Final[list[re.Pattern]] = common.search_patterns(terms)
+        for repo in self.repos:
+            packages = self.sync.get(repo, {})
+            for name in sorted(packages):
+                rec = packages[name]
+                if all(p.search(name) or p.search(rec.desc) for p in pats):
+                    yield Package(name=name,
+                                  desc=rec.desc,
+                                  kind=repo,
+                                  version=rec.version,
+                                  info=self.info(name))
+
+    def installed_packages(self) -> Iterator[Package]:
+        """Yield the installed packages, with the version that is installed."""
+        for name in sorted(self.local):
+            rec = self.local[name]
+            found = self.candidate(name)
+            yield Package(name=name,
+                          desc=rec.desc,
+                          kind="local" if found is None else found[0],
+                          version=rec.version,
+                          info=self.info(name),
+                          arch=rec.arch)
+
+    def updates(self) -> Iterator[Package]:
+        """Yield the installed packages pacman -Syu would upgrade, like pacman -Qu."""
+        for name in sorted(self.local):
+            found = self.candidate(name)
+            if found is None:
+                continue
+            repo, rec = found
+            if vercmp(rec.version, self.local[name].version) > 0:
+                yield Package(name=name,
+                              desc=rec.desc,
+                              kind=repo,
+                              version=rec.version,
+                              info=self.info(name))
+
+
+def _read_sync(path: str) -> Optional[list[Record]]:
+    try:
+        return read_sync(path)
+    except (OSError, ValueError, EOFError, zlib.error, lzma.LZMAError):
+        return None
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
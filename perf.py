@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:22:28 krylon>
+#
+# /data/code/python/sloth/perf.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.perf
+
+(c) 2026 Benjamin Walkenhorst
+
+Find out where the time goes. When profiling is enabled, we record spans
+around the phases of a command, e.g. probing the system, loading the
+configuration, running the package manager, or parsing its output.
+Spans may be nested, each span's own time excludes the time spent in the
+spans nested inside it, so the own times of all phases add up.
+
+When profiling is disabled, which is the default, spans cost about as much
+as a function call.
+"""
+
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Final, Iterable, Iterator, NamedTuple, Optional, TypeVar
+
+T = TypeVar("T")
+
+_enabled: bool = False
+_profiler: Optional[Any] = None
+_lock: Final[threading.Lock] = threading.Lock()
+# name -> [calls, total ns, own ns]
+_phases: dict[str, list[int]] = {}
+_local: Final[threading.local] = threading.local()
+
+
+class Phase(NamedTuple):
+    """Phase is the time spent in all spans of the same name."""
+
+    name: str
+    calls: int
+    total: float
+    own: float
+
+
+def enabled() -> bool:
+    """Return True if profiling is enabled."""
+    return _enabled
+
+
+def enable(cprofile: bool = False) -> None:
+    """Start recording spans, and optionally run cProfile, too."""
+    global _enabled, _profiler  # pylint: disable-msg=W0603
+    _enabled = True
+    if cprofile and _profiler is None:
+        import cProfile  # pylint: disable-msg=C0415
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def disable() -> None:
+    """Stop recording spans and forget what was recorded."""
+    global _enabled, _profiler  # pylint: disable-msg=W0603
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler = None
+    reset()
+
+
+def reset() -> None:
+    """Forget the spans recorded so far."""
+    with _lock:
+        _phases.clear()
+
+
+def _stack() -> list[int]:
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _record(name: str, elapsed: int, nested: int) -> None:
+    with _lock:
+        phase = _phases.get(name)
+        if phase is None:
+            _phases[name] = [1, elapsed, elapsed - nested]
+        else:
+            phase[0] += 1
+            phase[1] += elapsed
+            phase[2] += elapsed - nested
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the time spent in the body of the with statement."""
+    if not _enabled:
+        yield
+        return
+    stack: Final[list[int]] = _stack()
+    stack.append(0)
+    start: Final[int] = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        elapsed: int = time.perf_counter_ns() - start
+        nested: int = stack.pop()
+        if len(stack) > 0:
+            stack[-1] += elapsed
+        _record(name, elapsed, nested)
+
+
+def timed(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Return a decorator that records a span around each call of the function."""
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs) -> T:
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, items: Iterable[T]) -> Iterable[T]:
+    """Record the time it takes to produce the items of an iterator.
+
+    This is meant for generators, where the actual work happens while the
+    consumer iterates over them, not when they are created.
+    """
+    if not _enabled:
+        return items
+    return _timed_iter(name, iter(items))
+
+
+def _timed_iter(name: str, items: Iterator[T]) -> Iterator[T]:
+    while True:
+        with span(name):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        yield item
+
+
+def report() -> list[Phase]:
+    """Return the recorded phases, the ones with the largest own time first."""
+    with _lock:
+        phases = [Phase(name, p[0], p[1] / 1e9, p[2] / 1e9) for name, p in _phases.items()]
+    phases.sort(key=lambda p: p.own, reverse=True)
+    return phases
+
+
+def format_report(phases: Optional[list[Phase]] = None) -> str:
+    """Return the recorded phases as a table."""
+    if phases is None:
+        phases = report()
+    lines: list[str] = [f"{'Phase':<24} {'Calls':>7} {'Total':>11} {'Own':>11} {'Share':>6}"]
+    own: Final[float] = sum(p.own for p in phases) or 1.0
+    for p in phases:
+        lines.append(f"{p.name:<24} {p.calls:>7} {p.total * 1000:>8.1f} ms {p.own * 1000:>8.1f} ms {p.own / own:>6.1%}")
+    return "\n".join(lines)
+
+
+def dump_cprofile(folder: str) -> Optional[str]:
+    """Write what cProfile has recorded so far to a file in folder and start over.
+
+    Returns the path of the file, or None if cProfile is not running.
+    The file can be examined with the pstats module, or tools like snakeviz.
+    """
+    if _profiler is None:
+        return None
+    _profiler.disable()
+    path: Final[str] = os.path.join(folder, datetime.now().strftime("profile-%Y%m%d-%H%M%S-%f.pstats"))
+    _profiler.dump_stats(path)
+    _profiler.clear()
+    _profiler.enable()
+    return path
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
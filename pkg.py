@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-20 00:58:00 krylon>
+# Time-stamp: <2026-10-17 08:41:53 krylon>
 #
 # /data/code/python/sloth/pkg.py
 # created on 18. 12. 2023
@@ -18,21 +18,34 @@ sloth.pkg
 
 import logging
 import os
-import re
-import subprocess
+import copy
+import resource
+import shutil
+import sqlite3
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Final, Optional
+from functools import cache
+from typing import (TYPE_CHECKING, Any, Callable, ClassVar, Final, Iterable,
+                    Iterator, Optional, Sequence)
+from xml.etree import ElementTree
 
-from sloth import common, probe
-from sloth.config import Config
+from sloth import common, config, perf, probe
 from sloth.common import BLANK
 
-try:
-    import dnf
-except ModuleNotFoundError:
-    pass
+# The readers for the package databases need Package, so they can only be
+# imported once this module is loaded. Each is only needed on one platform,
+# anyway.
+if TYPE_CHECKING:
+    from sloth.aptindex import AptIndex
+    from sloth.pacmandb import PacmanDB
+    from sloth.pkgdb import PkgDB
+    from sloth.snapshot import Plan
 
 
 # pylint: disable-msg=C0103
@@ -49,6 +62,8 @@ class Operation(Enum):
     Autoremove = auto()
     Audit = auto()
     Search = auto()
+    Rollback = auto()
+    Prefetch = auto()
 
 
 @dataclass(slots=True, kw_only=True)
@@ -60,12 +75,320 @@ class Package:
     kind: Optional[str] = None
     version: Optional[str] = None
     info: Optional[str] = None
+    arch: Optional[str] = None
 
     def __hash__(self):
-        base = f"{self.name} -- {self.desc}"
-        if self.version is not None:
-            base += f" {self.version}"
-        return hash(base)
+        # Strings cache their hash, so this costs little more than a tuple.
+        return hash((self.name, self.desc, self.version))
+
+
+class Codes:
+    """Codes is a column of strings with few distinct values, e.g. architectures or repositories.
+
+    Each value is stored once, the column holds the position of each row's
+    value in the list of values.
+    """
+
+    __slots__ = ["values", "index", "codes"]
+
+    values: list[Optional[str]]
+    index: dict[Optional[str], int]
+    codes: array
+
+    def __init__(self) -> None:
+        self.values = [None]
+        self.index = {None: 0}
+        self.codes = array("I")
+
+    def code(self, value: Optional[str]) -> int:
+        """Return the code of a value, adding it if we have not seen it before."""
+        c: Optional[int] = self.index.get(value)
+        if c is None:
+            c = len(self.values)
+            self.values.append(value)
+            self.index[value] = c
+        return c
+
+    def append(self, value: Optional[str]) -> None:
+        """Add a row."""
+        self.codes.append(self.code(value))
+
+    def __getitem__(self, idx: int) -> Optional[str]:
+        return self.values[self.codes[idx]]
+
+    def __setitem__(self, idx: int, value: Optional[str]) -> None:
+        self.codes[idx] = self.code(value)
+
+    def take(self, rows: Iterable[int]) -> 'Codes':
+        """Return a column that holds the given rows."""
+        col: Final[Codes] = Codes()
+        col.values = self.values
+        col.index = self.index
+        col.codes = array("I", (self.codes[i] for i in rows))
+        return col
+
+
+class PackageTable(Sequence[Package]):
+    """PackageTable holds a list of packages by column rather than by row.
+
+    Large results, like the packages available from all repositories, take
+    a fraction of the memory a list of Packages takes: names and versions
+    are interned, so the same string is only kept once, however often it
+    occurs, fields with few distinct values, like the architecture or the
+    repository, are stored as arrays of small integers, and the hash of
+    each row is computed once, when it is added.
+
+    Indexing and iterating yield Packages, which are built on the fly, so
+    changing them does not change the table, set_info and overlay do.
+    Filtering and sorting work on the columns and return the positions of
+    the rows, take turns those into a new table.
+    """
+
+    __slots__ = [
+        "names",
+        "descs",
+        "versions",
+        "kinds",
+        "infos",
+        "archs",
+        "hashes",
+        "keys",
+        "index",
+    ]
+
+    names: list[str]
+    descs: list[str]
+    versions: list[Optional[str]]
+    kinds: Codes
+    infos: Codes
+    archs: Codes
+    hashes: array
+    # The lower case name and description of each row, for where(). They
+    # are only computed when they are needed.
+    keys: Optional[list[str]]
+    # The rows by their hash, for find(), also computed when needed.
+    index: Optional[dict[int, list[int]]]
+
+    def __init__(self, packages: Iterable[Package] = ()) -> None:
+        self.names = []
+        self.descs = []
+        self.versions = []
+        self.kinds = Codes()
+        self.infos = Codes()
+        self.archs = Codes()
+        self.hashes = array("q")
+        self.keys = None
+        self.index = None
+        self.extend(packages)
+
+    def append(self, p: Package) -> None:
+        """Add a package to the table."""
+        name: Final[str] = sys.intern(p.name)
+        version: Final[Optional[str]] = None if p.version is None else sys.intern(p.version)
+        self.names.append(name)
+        self.descs.append(p.desc)
+        self.versions.append(version)
+        self.kinds.append(p.kind)
+        self.infos.append(p.info)
+        self.archs.append(p.arch)
+        h: Final[int] = hash((name, p.desc, version))
+        if self.index is not None:
+            self.index.setdefault(h, []).append(len(self.hashes))
+        self.hashes.append(h)
+        if self.keys is not None:
+            self.keys.append(f"{name} {p.desc}".lower())
+
+    def extend(self, packages: Iterable[Package]) -> None:
+        """Add several packages to the table."""
+        for p in packages:
+            self.append(p)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __bool__(self) -> bool:
+        return len(self.names) > 0
+
+    def __getitem__(self, idx):  # type: ignore[override]
+        if isinstance(idx, slice):
+            return self.take(range(len(self.names))[idx])
+        return Package(name=self.names[idx],
+                       desc=self.descs[idx],
+                       kind=self.kinds[idx],
+                       version=self.versions[idx],
+                       info=self.infos[idx],
+                       arch=self.archs[idx])
+
+    def __iter__(self) -> Iterator[Package]:
+        for i in range(len(self.names)):
+            yield self[i]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, PackageTable):
+            return self.hashes == other.hashes and list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"<PackageTable of {len(self)} packages>"
+
+    def __contains__(self, p: object) -> bool:
+        return isinstance(p, Package) and self.find(p) >= 0
+
+    def find(self, p: Package) -> int:
+        """Return the position of a package with the same name, description and version as p, or -1."""
+        if self.index is None:
+            index: dict[int, list[int]] = {}
+            for i, h in enumerate(self.hashes):
+                index.setdefault(h, []).append(i)
+            self.index = index
+        for idx in self.index.get(hash(p), ()):
+            if self.names[idx] == p.name and self.descs[idx] == p.desc and self.versions[idx] == p.version:
+                return idx
+        return -1
+
+    def set_info(self, idx: int, info: Optional[str]) -> None:
+        """Change the info field, i.e. the installed state, of a row."""
+        self.infos[idx] = info
+
+    def overlay(self, installed: set[str]) -> None:
+        """Mark the packages whose names are in installed as installed, and all others as not installed.
+
+        Rows that were marked before keep their mark, e.g. "i+" for
+        packages that were installed as dependencies.
+        """
+        for i, name in enumerate(self.names):
+            if name in installed:
+                if not self.infos[i]:
+                    self.infos[i] = "i"
+            elif self.infos[i]:
+                self.infos[i] = ""
+
+    def installed(self) -> list[int]:
+        """Return the rows that are marked as installed."""
+        values: Final[list[Optional[str]]] = self.infos.values
+        return [i for i, c in enumerate(self.infos.codes) if values[c]]
+
+    def where(self, *words: str, rows: Optional[Sequence[int]] = None) -> list[int]:
+        """Return the rows whose name or description contain all words, ignoring case.
+
+        If rows are given, only those are looked at.
+        """
+        if self.keys is None:
+            self.keys = [f"{n} {d}".lower() for n, d in zip(self.names, self.descs)]
+        keys: Final[list[str]] = self.keys
+        needles: Final[list[str]] = [w.lower() for w in words]
+        if rows is None:
+            rows = range(len(keys))
+        if len(needles) == 1:
+            w: Final[str] = needles[0]
+            return [i for i in rows if w in keys[i]]
+        return [i for i in rows if all(n in keys[i] for n in needles)]
+
+    def argsort(self, by: str = "name", reverse: bool = False) -> list[int]:
+        """Return the rows ordered by a column: name, version, kind, info or arch, ties are broken by name."""
+        names: Final[list[str]] = self.names
+        match by:
+            case "name":
+                return sorted(range(len(names)), key=names.__getitem__, reverse=reverse)
+            case "version":
+                versions: Final[list[Optional[str]]] = self.versions
+                return sorted(range(len(names)), key=lambda i: (versions[i] or "", names[i]), reverse=reverse)
+            case "kind" | "info" | "arch":
+                col: Final[Codes] = getattr(self, f"{by}s")
+                # Sort the distinct values once, then the rows by their rank.
+                order: Final[list[int]] = sorted(range(len(col.values)), key=lambda c: col.values[c] or "")
+                rank: Final[list[int]] = [0] * len(order)
+                for r, c in enumerate(order):
+                    rank[c] = r
+                codes: Final[array] = col.codes
+                return sorted(range(len(names)), key=lambda i: (rank[codes[i]], names[i]), reverse=reverse)
+            case _:
+                raise ValueError(f"Cannot sort by {by}")
+
+    def take(self, rows: Iterable[int]) -> 'PackageTable':
+        """Return a table that holds the given rows, in the given order."""
+        rows = list(rows)
+        t: Final[PackageTable] = PackageTable()
+        t.names = [self.names[i] for i in rows]
+        t.descs = [self.descs[i] for i in rows]
+        t.versions = [self.versions[i] for i in rows]
+        t.kinds = self.kinds.take(rows)
+        t.infos = self.infos.take(rows)
+        t.archs = self.archs.take(rows)
+        t.hashes = array("q", (self.hashes[i] for i in rows))
+        if self.keys is not None:
+            t.keys = [self.keys[i] for i in rows]
+        return t
+
+    def sorted(self, by: str = "name", reverse: bool = False) -> 'PackageTable':
+        """Return a copy of the table, ordered by a column."""
+        return self.take(self.argsort(by, reverse))
+
+
+@dataclass(slots=True, kw_only=True)
+class RunStats:
+    """RunStats holds the resources the package manager used to perform an operation.
+
+    Times are in seconds, maxrss is in KiB. The byte counts are None if the
+    output went straight to the terminal, so we never saw it.
+    """
+
+    wall: float = 0.0
+    utime: float = 0.0
+    stime: float = 0.0
+    maxrss: int = 0
+    out_bytes: Optional[int] = None
+    err_bytes: Optional[int] = None
+
+    def __add__(self, other: 'RunStats') -> 'RunStats':
+        def add(a: Optional[int], b: Optional[int]) -> Optional[int]:
+            if a is None:
+                return b
+            if b is None:
+                return a
+            return a + b
+
+        return RunStats(wall=self.wall + other.wall,
+                        utime=self.utime + other.utime,
+                        stime=self.stime + other.stime,
+                        maxrss=max(self.maxrss, other.maxrss),
+                        out_bytes=add(self.out_bytes, other.out_bytes),
+                        err_bytes=add(self.err_bytes, other.err_bytes))
+
+
+def c_locale() -> dict[str, str]:
+    """Return an environment that makes programs talk like in the C locale.
+
+    Only the messages are switched to the C locale, the character set stays
+    the same, so descriptions that are not plain ASCII come out intact.
+    """
+    env: Final[dict[str, str]] = dict(os.environ)
+    ctype: Final[str] = env.pop("LC_ALL", "") or env.get("LC_CTYPE", "") or env.get("LANG", "")
+    if ctype != "":
+        env["LC_CTYPE"] = ctype
+    env["LC_MESSAGES"] = "C"
+    env.pop("LANGUAGE", None)
+    return env
+
+
+# A snapshot of the clock and the resource usage of our child processes.
+Usage = tuple[float, resource.struct_rusage]
+
+
+@cache
+def idle_priority() -> list[str]:
+    """Return the prefix that runs a command with the lowest CPU and, where possible, I/O priority."""
+    cmd: list[str] = ["nice", "-n", "19"]
+    if shutil.which("ionice") is not None:
+        cmd.extend(["ionice", "-c", "3"])
+    return cmd
+
+
+def usage() -> Usage:
+    """Take a snapshot of the clock and the resource usage of our children."""
+    return time.perf_counter(), resource.getrusage(resource.RUSAGE_CHILDREN)
 
 
 class PackageManager(ABC):
@@ -78,6 +401,13 @@ class PackageManager(ABC):
         "output",
         "nice",
         "yes",
+        "root",
+        "batch",
+        "last_code",
+        "stats",
+        "sink",
+        "timeouts",
+        "__weakref__",
     ]
 
     platform: probe.Platform
@@ -86,52 +416,185 @@ class PackageManager(ABC):
     output: tuple[str, str]
     nice: bool
     yes: bool
-
-    def __init__(self) -> None:
-        self.platform = probe.guess_os()
+    root: Optional[str]
+    batch: bool
+    last_code: int
+    stats: Optional[RunStats]
+    sink: Optional[Callable[[str], None]]
+    timeouts: dict[str, int]
+    # The Parser for the output of searches, backends that search by
+    # running the package manager set it.
+    parser: ClassVar[type['Parser']]
+    # Whether install can be told which version of a package to install.
+    pin_versions: ClassVar[bool] = True
+    # Whether installed marks the packages that were installed as
+    # dependencies with "i+", so they can be told from the ones the user
+    # asked for.
+    marks_dependencies: ClassVar[bool] = False
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        info: Final[probe.Probe] = probe.probe()
+        self.platform = info.platform
         self.log = common.get_logger("PackageManager")
         self.log.debug("Running on %s", self.platform.name)
         self.output = ('', '')
+        self.sudo = None
+        self.root = root
+        self.batch = False
+        self.last_code = 0
+        self.stats = None
+        self.sink = None
 
         if not self.is_root():
-            self.sudo = probe.find_sudo()
+            self.sudo = info.sudo
             if self.sudo is not None:
                 self.log.debug("Using %s to run commands with elevated privileges.",
                                self.sudo)
             else:
                 self.log.warning("We are not running as root, and neither sudo nor doas was found.")
 
-        self.__process_config()
+        svc = config.service()
+        self._apply_settings(svc.settings())
+        svc.subscribe(self._apply_settings)
 
-    def __process_config(self):
-        cfg = Config()
-        try:
-            self.nice = cfg.cfg["shell"]["nice"]
-            self.yes = cfg.cfg["shell"]["say-yes"]
-        except:  # noqa: B001,E722 pylint: disable-msg=W0702
-            self.nice = False
-            self.yes = False
+    def _apply_settings(self, settings: config.Settings) -> None:
+        """Pick up the (possibly changed) settings from the configuration file."""
+        self.nice = settings.nice
+        self.timeouts = settings.timeouts
+        if not self.batch:
+            self.yes = settings.say_yes
 
     @classmethod
-    def create(cls) -> 'PackageManager':
-        """Return the appropriate PackageManager for the current system"""
-        system = probe.guess_os()
+    def create(cls, root: Optional[str] = None) -> 'PackageManager':
+        """Return the appropriate PackageManager for the current system
+
+        If root is given, the PackageManager operates on the chroot, jail, or
+        container root it names instead of the running system.
+        """
+        info: Final[probe.Probe] = probe.probe()
+        system: Final[probe.Platform] = info.platform
         match system[0].lower():
             case "debian" | "ubuntu":
-                return APT()
+                return APT(root)
             case "opensuse-tumbleweed" | "opensuse-leap" | "opensuse":
-                return Zypper()
+                return Zypper(root)
             case "arch":
-                return Pacman()
+                return Pacman(root)
             case "fedora" | "rocky":
-                return DNF()
+                return DNF(root)
             case "freebsd":
-                return FreeBSD()
+                return FreeBSD(root)
             case "openbsd":
-                return OpenBSD()
+                return OpenBSD(root)
             case _:
+                # Derivatives we do not know by name usually come with the
+                # package manager of their parent distro.
+                for name, backend in (("apt", APT),
+                                      ("zypper", Zypper),
+                                      ("pacman", Pacman),
+                                      ("dnf", DNF)):
+                    if name in info.managers:
+                        return backend(root)
                 raise RuntimeError(f"Unsupported platform: {system[0]}")
 
+    def detach(self) -> 'PackageManager':
+        """Return a copy of this PackageManager that can be used from another thread.
+
+        The copy runs in batch mode, i.e. it captures the output of the
+        package manager and does not ask any questions, so several of them
+        can run side by side. Backends that keep state, e.g. open databases,
+        start the copy without it.
+        """
+        pm = copy.copy(self)
+        pm.batch = True
+        pm.yes = True
+        pm.output = ('', '')
+        pm.last_code = 0
+        pm.stats = None
+        return pm
+
+    def for_root(self, root: str) -> 'PackageManager':
+        """Return a detached copy of this PackageManager that operates on <root>."""
+        pm = self.detach()
+        pm.root = root
+        pm.root_args()  # Fail early if the backend does not support roots.
+        return pm
+
+    def warm_up(self) -> None:
+        """Start loading whatever the backend needs to answer queries quickly.
+
+        This is called when an interactive session starts, most backends do
+        not need to do anything.
+        """
+
+    def invalidate(self) -> None:
+        """Forget any state that is outdated after a refresh, install, or remove."""
+
+    def root_args(self) -> list[str]:
+        """Return the arguments that make the package manager operate on self.root."""
+        if self.root is None:
+            return []
+        raise ValueError(f"{self.__class__.__name__} does not support operating on a different root")
+
+    def take_stats(self) -> Optional[RunStats]:
+        """Return the resources used since the last call, and start counting anew."""
+        stats, self.stats = self.stats, None
+        return stats
+
+    def run_roots(self,
+                  op: Operation,
+                  roots: Sequence[str],
+                  parallel: int = 4,
+                  stats: Optional[dict[str, RunStats]] = None) -> dict[str, int]:
+        """Perform an operation on several roots, at most <parallel> at a time.
+
+        Supported operations are Refresh, Upgrade, Prefetch, and Audit.
+        Returns a dictionary that maps each root to the exit status of the
+        operation, or -1 if it could not be performed at all.
+        If stats is given, the resources used for each root are stored in it.
+        Since all roots are handled by the same process, the CPU times and
+        the memory usage are blurred when they run in parallel.
+        """
+        def perform(root: str) -> int:
+            pm = self.for_root(root)
+            try:
+                match op:
+                    case Operation.Refresh:
+                        return pm.refresh()
+                    case Operation.Upgrade:
+                        return pm.upgrade(yes=True)
+                    case Operation.Prefetch:
+                        return pm.prefetch()
+                    case Operation.Audit:
+                        pm.audit()
+                        return pm.last_code
+                    case _:
+                        raise ValueError(f"Operation {op.name} is not supported on multiple roots")
+            finally:
+                if stats is not None and pm.stats is not None:
+                    stats[root] = pm.stats
+
+        results: dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=max(parallel, 1),
+                                thread_name_prefix="root") as pool:
+            futures = {pool.submit(perform, r): r for r in roots}
+            for fut in as_completed(futures):
+                root = futures[fut]
+                try:
+                    results[root] = fut.result()
+                except Exception as err:  # pylint: disable-msg=W0718
+                    self.log.error("%s on %s failed: %s",
+                                   op.name,
+                                   root,
+                                   err)
+                    results[root] = -1
+                else:
+                    self.log.info("%s on %s finished with status %d",
+                                  op.name,
+                                  root,
+                                  results[root])
+        return results
+
     @abstractmethod
     def pkg_cmd(self, op: Optional[Operation] = None) -> list[str]:
         """Return the command to execute the package manager."""
@@ -157,8 +620,25 @@ class PackageManager(ABC):
         """Install any pending updates."""
 
     @abstractmethod
-    def search(self, *arg, **kwargs) -> list[Package]:
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
+        """Search for available packages, yielding each one as soon as it is found."""
+
+    def search(self, *args, **kwargs) -> PackageTable:
         """Search for available packages."""
+        return PackageTable(self.search_iter(*args, **kwargs))
+
+    def catalog(self) -> Iterator[Package]:
+        """Return all packages available from the configured repositories.
+
+        This is used to fill the local package catalog after a refresh.
+        By default, we run a search that matches everything, backends
+        where this does not work, need to override this method.
+        """
+        return self.search_iter(*self.catalog_query())
+
+    def catalog_query(self) -> list[str]:
+        """Return the search arguments that match all available packages."""
+        return []
 
     @abstractmethod
     def autoremove(self, *args, **kwargs) -> int:
@@ -169,23 +649,86 @@ class PackageManager(ABC):
         """Clean up downloaded packages."""
 
     @abstractmethod
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
 
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates without installing them. Not supported by all backends.
+
+        Prefetching runs with the lowest priority we can get, so it can go
+        on in the background without getting in anybody's way.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} cannot download updates ahead of time")
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages. Not supported by all backends."""
+        raise NotImplementedError(f"{self.__class__.__name__} cannot list installed packages")
+
+    def updates(self) -> PackageTable:
+        """Return the installed packages a newer version is available for. Not supported by all backends."""
+        raise NotImplementedError(f"{self.__class__.__name__} cannot list pending updates")
+
+    def patches(self) -> PackageTable:
+        """Return the patches that are not installed, yet. Not supported by all backends."""
+        raise NotImplementedError(f"{self.__class__.__name__} does not know about patches")
+
+    def compare_versions(self, a: str, b: str) -> int:
+        """Compare two versions, return a negative number if a is older than b, zero if they are equal.
+
+        By default, versions are compared like rpm does, which pacman
+        does as well, backends that do it differently override this.
+        """
+        from sloth import pacmandb  # pylint: disable-msg=C0415
+        return pacmandb.vercmp(a, b)
+
+    def version_spec(self, name: str, version: str) -> str:
+        """Return the argument that tells install to install a specific version of a package."""
+        if not self.pin_versions:
+            return name
+        return f"{name}={version}"
+
+    def rollback(self, plan: 'Plan') -> int:
+        """Carry out a Plan to return to an earlier snapshot.
+
+        By default, this takes one call to remove packages and one to
+        install the rest in the versions the Plan asks for. Backends that
+        can do both at once, override this.
+        """
+        code: int = 0
+        if len(plan.remove) > 0:
+            code = self.remove(*(c.name for c in plan.remove))
+            if code != 0:
+                return code
+        changes = plan.install
+        if self.pin_versions:
+            changes = changes + plan.downgrade
+        elif len(plan.downgrade) > 0:
+            self.log.warning("%s cannot install older versions, not downgrading %s",
+                             self.__class__.__name__,
+                             ", ".join(c.name for c in plan.downgrade))
+        if len(changes) > 0:
+            assert all(c.new is not None for c in changes)
+            code = self.install(*(self.version_spec(c.name, c.new) for c in changes))  # type: ignore
+        return code
+
+    def arg_space(self) -> int:
+        """Return how many bytes of package names fit on the command line of a single install."""
+        from sloth import manifest  # pylint: disable-msg=C0415
+        prefix: Final[list[str]] = ["nice"] + self.pkg_cmd(Operation.Install) + self.root_args()
+        # Leave room for the subcommand and its flags.
+        return max(manifest.arg_space(prefix) - 256, 0)
+
     def is_root(self) -> bool:
         """Return true if we are running with root privileges."""
         return os.geteuid() == 0
 
-    def _run(self, cmd: list[str], capture: bool = False, **kwargs) -> tuple[bool, int]:
-        """Execute the given command."""
-        prefix: list[str] = []
-        if "op" in kwargs:
-            prefix = self.pkg_cmd(kwargs["op"])
-        else:
-            prefix = self.pkg_cmd()
-        cmd = prefix + cmd
+    def _command(self, cmd: list[str], op: Optional[Operation] = None) -> list[str]:
+        """Prepend the package manager (and nice, if requested) to cmd."""
+        cmd = self.pkg_cmd(op) + self.root_args() + cmd
 
-        if self.nice:
+        if op == Operation.Prefetch:
+            cmd = idle_priority() + cmd
+        elif self.nice:
             cmd = ["nice"] + cmd
 
         try:
@@ -195,37 +738,273 @@ class PackageManager(ABC):
             self.log.error("TypeError: %s\n%s\n",
                            err,
                            cmd)
+        return cmd
 
-        proc = subprocess.run(cmd,
-                              capture_output=capture,
-                              text=True,
-                              check=False,
-                              encoding="utf-8")
+    def _record(self, before: Usage, out_bytes: Optional[int], err_bytes: Optional[int]) -> None:
+        """Add the resources used since <before> to self.stats."""
+        now, after = usage()
+        run = RunStats(wall=now - before[0],
+                       utime=after.ru_utime - before[1].ru_utime,
+                       stime=after.ru_stime - before[1].ru_stime,
+                       # This is the largest resident set of any child we
+                       # have waited for so far, not just this one.
+                       maxrss=after.ru_maxrss,
+                       out_bytes=out_bytes,
+                       err_bytes=err_bytes)
+        self.stats = run if self.stats is None else self.stats + run
+
+    def timeout(self, op: Optional[Operation]) -> Optional[float]:
+        """Return how many seconds the package manager gets for op, None if there is no limit."""
+        default: Final[int] = self.timeouts.get("default", 0)
+        limit: Final[int] = default if op is None else self.timeouts.get(op.name.lower(), default)
+        return float(limit) if limit > 0 else None
+
+    @perf.timed("run")
+    def _run(self, cmd: list[str], capture: bool = False, **kwargs) -> tuple[bool, int]:
+        """Execute the given command.
 
+        If the command takes longer than the timeout configured for the
+        operation, which the keyword argument timeout overrides, it is
+        terminated, as it is if we are interrupted.
+        The keyword argument ok lists the exit codes that mean success, for
+        package managers that do not stick to 0.
+        """
+        from sloth import engine  # pylint: disable-msg=C0415
+        op: Final[Optional[Operation]] = kwargs.get("op")
+        ok: Final[Sequence[int]] = kwargs.get("ok", (0, ))
+        cmd = self._command(cmd, op)
+        timeout: Final[Optional[float]] = kwargs.get("timeout", self.timeout(op))
+        if self.sink is not None and not capture:
+            return self._run_to_sink(cmd, timeout, ok)
+        capture = capture or self.batch
+
+        before: Final[Usage] = usage()
+        res: Final[engine.Result] = engine.run(cmd, capture=capture, timeout=timeout)
+
+        self.last_code = res.code
         if capture:
-            self.output = (proc.stdout, proc.stderr)
+            self.output = (res.stdout or "", res.stderr or "")
+        self._record(before, res.out_bytes, res.err_bytes)
 
-        if proc.returncode != 0:
+        if res.code not in ok:
+            cmdstr: Final[str] = BLANK.join(cmd)
+            self.log.error("Error running command '%s':\n%s",
+                           cmdstr,
+                           res.stderr or "")
+            return (False, res.code)
+
+        return (True, res.code)
+
+    def _run_to_sink(self, cmd: list[str], timeout: Optional[float] = None, ok: Sequence[int] = (0, )) -> tuple[bool, int]:
+        """Execute the given command, passing its output to self.sink line by line."""
+        from sloth import engine  # pylint: disable-msg=C0415
+        assert self.sink is not None
+        before: Final[Usage] = usage()
+        res: Final[engine.Result] = engine.run(cmd, sink=self.sink, timeout=timeout)
+
+        self.last_code = res.code
+        # Standard error is part of the output we passed on.
+        self._record(before, res.out_bytes, None)
+        if res.code not in ok:
+            self.log.error("Error running command '%s'",
+                           BLANK.join(cmd))
+            return (False, res.code)
+        return (True, res.code)
+
+    def _stream(self, cmd: list[str], **kwargs) -> Iterator[str]:
+        """Execute the given command and yield its output line by line.
+
+        Unlike _run, we do not wait for the command to finish before we hand
+        its output to the caller. Standard error is collected on the side and
+        ends up in self.output[1] once the command has exited. If the caller
+        stops consuming the output early, or the command runs out of time,
+        the command is terminated.
+        The command runs with its messages in the C locale, so we can parse
+        them no matter which language the user prefers.
+        """
+        from sloth import engine  # pylint: disable-msg=C0415
+        op: Final[Optional[Operation]] = kwargs.get("op")
+        cmd = self._command(cmd, op)
+        before: Final[Usage] = usage()
+        results: Final[list[engine.Result]] = []
+
+        yield from perf.timed_iter("run", engine.lines(cmd,
+                                                       results,
+                                                       env=c_locale(),
+                                                       timeout=kwargs.get("timeout", self.timeout(op))))
+
+        res: Final[engine.Result] = results[0]
+        self.output = ("", res.stderr or "")
+        self.last_code = res.code
+        self._record(before, res.out_bytes, res.err_bytes)
+        if res.code != 0:
             cmdstr: Final[str] = BLANK.join(cmd)
             self.log.error("Error running command '%s':\n%s",
                            cmdstr,
-                           proc.stderr)
-            return (False, proc.returncode)
+                           self.output[1])
+
+
+class Parser(ABC):
+    """Parser turns the output of a package manager into Packages, one line at a time.
+
+    Each backend has its own Parser, a small state machine that looks at
+    each line exactly once and only uses plain string operations on it, so
+    parsing takes linear time, whatever the package manager prints.
+    A Parser yields each Package as soon as it is complete, and it can be
+    reused once parse has returned.
+    """
+
+    __slots__: list[str] = []
+
+    def reset(self) -> None:
+        """Prepare for a new run of the package manager."""
+
+    @abstractmethod
+    def feed(self, line: str) -> Optional[Package]:
+        """Look at the next line, without its newline, and return a Package if one is complete."""
+
+    def finish(self) -> Optional[Package]:
+        """Return the last Package, if the end of the output completed it."""
+        return None
+
+    def parse(self, lines: Iterable[str]) -> Iterator[Package]:
+        """Parse the output of the package manager."""
+        self.reset()
+        for line in lines:
+            p = self.feed(line.rstrip("\r\n"))
+            if p is not None:
+                yield p
+        p = self.finish()
+        if p is not None:
+            yield p
+
+
+# The markers apt search uses for installed packages, in the C locale and,
+# because older versions of sloth ran apt in the user's locale, in German.
+APT_INSTALLED: Final[frozenset[str]] = frozenset({"installed", "installiert"})
+APT_AUTOMATIC: Final[frozenset[str]] = frozenset({"automatic", "automatisch"})
+
+
+def apt_info(markers: str) -> str:
+    """Return the info for the markers apt prints after the architecture.
+
+    E.g. "[installed,automatic]" or "[installed,upgradable to: 1.2-3]".
+    """
+    flags: Final[set[str]] = {f.strip().split(" ")[0] for f in markers.strip("[] ").lower().split(",")}
+    if flags.isdisjoint(APT_INSTALLED):
+        return ""
+    if flags.isdisjoint(APT_AUTOMATIC):
+        return "i"
+    return "i+"
 
-        return (True, proc.returncode)
 
+class AptParser(Parser):
+    """AptParser understands the output of apt search.
 
-aptPat: Final[re.Pattern] = re.compile(r"""
-^ ([^/\n]+) / (\S+) \s+         # Newline, package name, slash, branch
-(\S+) \s+ \w+ \s*               # Version, arch
-(?:\[ ( [^]]+ ) \] | ) $        # Installed, and if so, as a dependency?
-\s+ ([^\n]+) $                  # Description
-""",
-                                       re.X | re.M | re.S)
+    Each package is a line "name/suite version arch [markers]", followed by
+    an indented description and an empty line:
+
+    emacs/stable,now 1:28.2+1-15 all [installed]
+      GNU Emacs editor (metapackage)
+    """
+
+    __slots__ = ["pending"]
+
+    pending: Optional[Package]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending = None
+
+    def reset(self) -> None:
+        self.pending = None
+
+    def feed(self, line: str) -> Optional[Package]:
+        if line == "":
+            return self.finish()
+        if line[0].isspace():
+            # The description completes the package, any further lines of it
+            # (apt search --full) are ignored.
+            p, self.pending = self.pending, None
+            if p is not None:
+                p.desc = line.strip()
+            return p
+
+        done: Final[Optional[Package]] = self.pending
+        self.pending = None
+        fields: Final[list[str]] = line.split(None, 3)
+        name, slash, suite = fields[0].partition("/")
+        # Lines like "Sorting..." have no slash in their first word.
+        if slash == "" or len(fields) < 3:
+            return done
+        self.pending = Package(name=name,
+                               desc="",
+                               kind=suite,
+                               version=fields[1],
+                               info=apt_info(fields[3]) if len(fields) > 3 else "")
+        return done
+
+    def finish(self) -> Optional[Package]:
+        p, self.pending = self.pending, None
+        return p
+
+
+def parse_apt(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of apt search."""
+    return AptParser().parse(lines)
 
 
 class APT(PackageManager):
-    """APT is a frontend for the APT package manager used on Debian and derivatives."""
+    """APT is a frontend for the APT package manager used on Debian and derivatives.
+
+    Searches, and the lists of installed packages and pending updates, are
+    answered from apt's package lists and dpkg's status file, which we read
+    ourselves (see sloth.aptindex). We only run apt search if there are no
+    package lists.
+    """
+
+    __slots__ = [
+        "index",
+    ]
+
+    parser: ClassVar[type[Parser]] = AptParser
+    marks_dependencies: ClassVar[bool] = True
+    index: Optional['AptIndex']
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        super().__init__(root)
+        self.index = None
+
+    def detach(self) -> 'PackageManager':
+        """Return a copy of this PackageManager that can be used from another thread."""
+        pm = super().detach()
+        assert isinstance(pm, APT)
+        pm.index = None
+        return pm
+
+    def invalidate(self) -> None:
+        """Forget the package index."""
+        self.index = None
+
+    def _index(self) -> Optional['AptIndex']:
+        """Return the package index, (re-)loading it if it is missing or outdated.
+
+        Returns None if apt has not downloaded any package lists.
+        """
+        from sloth.aptindex import \
+            AptIndex  # pylint: disable-msg=C0415
+        index = self.index
+        if index is not None and index.is_current():
+            return index
+        index = AptIndex(self.root)
+        if len(index.lists()) == 0:
+            return None
+        try:
+            self.index = index.load()
+        except (OSError, ValueError) as err:
+            self.log.error("Cannot read the package lists: %s", err)
+            return None
+        return self.index
 
     def pkg_cmd(self, _op: Optional[Operation] = None) -> list[str]:
         """Return the command to execute the package manager."""
@@ -233,10 +1012,18 @@ class APT(PackageManager):
             return [self.sudo, "apt"]
         return ["apt"]
 
+    def root_args(self) -> list[str]:
+        """Return the arguments that make apt operate on self.root."""
+        if self.root is None:
+            return []
+        # Dir relocates apt's own state, dpkg needs to be told separately.
+        return ["-o", f"Dir={self.root}",
+                "-o", f"DPkg::Chroot-Directory={self.root}"]
+
     def refresh(self, **kwargs) -> int:
         """Update the local list of packages."""
         cmd = ["update"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Refresh)
         return code
 
     def upgrade(self, **kwargs) -> int:
@@ -244,7 +1031,13 @@ class APT(PackageManager):
         cmd = ["full-upgrade"]
         if self.yes or "yes" in kwargs:
             cmd.append("-y")
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Upgrade)
+        return code
+
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates without installing them."""
+        cmd = ["full-upgrade", "--download-only", "-y"]
+        _, code = self._run(cmd, op=Operation.Prefetch)
         return code
 
     def install(self, *args, **kwargs) -> int:
@@ -256,7 +1049,7 @@ class APT(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Install)
         return code
 
     def remove(self, *args, **kwargs) -> int:
@@ -267,7 +1060,7 @@ class APT(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Delete)
         return code
 
     def autoremove(self, *args, **kwargs) -> int:
@@ -279,61 +1072,198 @@ class APT(PackageManager):
             cmd = ["autoremove"]
         if self.yes:
             cmd.append("-y")
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Autoremove)
         return code
 
     def cleanup(self, *args, **kwargs) -> int:
         """Clean up downloaded packages."""
         cmd = ["clean"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Cleanup)
         return code
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # We *could* configure a 3rd-party audit tool like lynis...
         print("Audit on Debian is not implemented, yet.")
-        return []
+        return PackageTable()
+
+    def catalog_query(self) -> list[str]:
+        """Return the search arguments that match all available packages."""
+        # apt search takes a regular expression.
+        return ["."]
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages."""
+        index = self._index()
+        if index is None:
+            raise NotImplementedError("apt has not downloaded any package lists")
+        return PackageTable(index.installed_packages())
+
+    def updates(self) -> PackageTable:
+        """Return the installed packages a newer version is available for."""
+        index = self._index()
+        if index is None:
+            raise NotImplementedError("apt has not downloaded any package lists")
+        return PackageTable(index.updates())
+
+    def compare_versions(self, a: str, b: str) -> int:
+        """Compare two versions the way dpkg does."""
+        from sloth import aptindex  # pylint: disable-msg=C0415
+        return aptindex.compare_versions(a, b)
+
+    def rollback(self, plan: 'Plan') -> int:
+        """Carry out a Plan to return to an earlier snapshot.
+
+        apt install removes the packages that carry a trailing minus, so a
+        single call does it all.
+        """
+        cmd = ["install", "--allow-downgrades"]
+        if self.yes:
+            cmd.append("-y")
+        cmd.extend(self.version_spec(c.name, c.new or "") for c in plan.install + plan.downgrade)
+        cmd.extend(f"{c.name}-" for c in plan.remove)
+        _, code = self._run(cmd, op=Operation.Rollback)
+        return code
 
-    def search(self, *args, **kwargs) -> list[Package]:
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
         """Search for available packages."""
         self.log.debug("Search %s", BLANK.join(args))
+        index = self._index()
+        if index is not None:
+            yield from index.search(*args)
+            return
         cmd: list[str] = ["search"]
         cmd.extend(args)
-        self._run(cmd, True)
-        m = aptPat.findall(self.output[0])
-        results: list[Package] = []
-        if len(m) == 0:
-            self.log.error("Cannot parse output of APT:\n%s\n%s",
-                           self.output[0],
+        cnt: int = 0
+        for p in perf.timed_iter("parse.apt", self.parser().parse(self._stream(cmd, op=Operation.Search))):
+            cnt += 1
+            yield p
+        if cnt == 0:
+            self.log.error("Cannot parse output of APT:\n%s",
                            self.output[1])
-        else:
-            for group in m:
-                info: str = ""
-                match group[3].lower():
-                    case "installiert":
-                        info = "i"
-                    case "installiert,automatisch":
-                        info = "i+"
-                    case "":
-                        pass
-                    case _:
-                        self.log.debug("Unexpected info field for %s: '%s'",
-                                       group[0],
-                                       group[3])
-                p: Package = Package(name=group[0],
-                                     desc=group[4],
-                                     kind=group[1],
-                                     info=info,
-                                     version=group[2],)
-                results.append(p)
-        return results
 
 
-zyppPat: Final[re.Pattern] = re.compile(r"^ ([^-|\n]+) \| \s+ (\S+) \s+ \| \s+ ([^|]+) \s+ \| \s+ (\S+) \s* $", re.X | re.M)
+# With --xmlout, zypper prints one element per package, and the status as
+# a word instead of the letters in the first column of the table.
+ZYPPER_STATUS: Final[dict[str, str]] = {
+    "installed": "i",
+    "other-version": "v",
+    "not-installed": "",
+}
+
+
+# zypper keeps the names of the packages it installed as dependencies in
+# this file, one per line, below a comment.
+ZYPPER_AUTOINSTALLED: Final[str] = "var/lib/zypp/AutoInstalled"
+
+
+def zypper_autoinstalled(root: Optional[str] = None) -> set[str]:
+    """Return the names of the packages zypper installed as dependencies."""
+    try:
+        with open(os.path.join(root or "/", ZYPPER_AUTOINSTALLED), "r", encoding="utf-8") as fh:
+            return {line.strip() for line in fh if line.strip() and not line.startswith("#")}
+    except FileNotFoundError:
+        return set()
+
+
+def zypper_xml(lines: Iterable[str], tags: frozenset[str]) -> Iterator[ElementTree.Element]:
+    """Yield the elements with the given tags from zypper's XML output.
+
+    Each element is yielded as soon as it is complete, and thrown away
+    afterwards, along with its children, so we never hold more than one
+    package in memory, no matter how much zypper prints.
+    """
+    pull: Final[ElementTree.XMLPullParser] = ElementTree.XMLPullParser(events=("start", "end"))
+    # The elements that have been opened, but not closed, yet.
+    open_elements: list[ElementTree.Element] = []
+
+    def events() -> Iterator[ElementTree.Element]:
+        for event, elem in pull.read_events():
+            if event == "start":
+                open_elements.append(elem)
+                continue
+            open_elements.pop()
+            if elem.tag in tags:
+                yield elem
+                elem.clear()
+                if len(open_elements) > 0:
+                    open_elements[-1].remove(elem)
+
+    for line in lines:
+        pull.feed(line)
+        yield from events()
+    pull.close()
+    yield from events()
+
+
+def _zypper_message(elem: ElementTree.Element) -> None:
+    if elem.get("type") == "error":
+        common.get_logger("zypper").error("%s", elem.text)
+
+
+def parse_zypper_xml(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of zypper --xmlout search."""
+    for elem in zypper_xml(lines, frozenset({"solvable", "message"})):
+        if elem.tag == "message":
+            _zypper_message(elem)
+            continue
+        yield Package(name=elem.get("name", ""),
+                      desc=elem.get("summary", ""),
+                      kind=elem.get("kind"),
+                      version=elem.get("edition"),
+                      info=ZYPPER_STATUS.get(elem.get("status", ""), ""),
+                      arch=elem.get("arch"))
+
+
+def _zypper_update(elem: ElementTree.Element) -> tuple[str, str]:
+    """Return the summary and the repository of an update."""
+    summary: Final[Optional[ElementTree.Element]] = elem.find("summary")
+    source: Final[Optional[ElementTree.Element]] = elem.find("source")
+    return ("" if summary is None else (summary.text or "").strip(),
+            "" if source is None else source.get("alias", ""))
+
+
+def parse_zypper_updates(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of zypper --xmlout list-updates."""
+    for elem in zypper_xml(lines, frozenset({"update", "message"})):
+        if elem.tag == "message":
+            _zypper_message(elem)
+            continue
+        summary, repo = _zypper_update(elem)
+        yield Package(name=elem.get("name", ""),
+                      desc=summary,
+                      kind=repo,
+                      version=elem.get("edition"),
+                      info="i",
+                      arch=elem.get("arch"))
+
+
+def parse_zypper_patches(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of zypper --xmlout list-patches.
+
+    The kind of a patch is its category, e.g. security, the info is its
+    status, e.g. needed.
+    """
+    for elem in zypper_xml(lines, frozenset({"update", "message"})):
+        if elem.tag == "message":
+            _zypper_message(elem)
+            continue
+        summary, _ = _zypper_update(elem)
+        yield Package(name=elem.get("name", ""),
+                      desc=summary,
+                      kind=elem.get("category", ""),
+                      version=elem.get("edition"),
+                      info=elem.get("status", ""))
 
 
 class Zypper(PackageManager):
-    """Zypper is the package manager used by openSUSE."""
+    """Zypper is the package manager used by openSUSE.
+
+    We ask zypper for XML (--xmlout), rather than the table it prints for
+    humans, and read it as it comes in.
+    """
+
+    marks_dependencies: ClassVar[bool] = True
 
     def pkg_cmd(self, _op: Optional[Operation] = None) -> list[str]:
         """Return the command to execute the package manager."""
@@ -341,6 +1271,12 @@ class Zypper(PackageManager):
         cmd.append("zypper")
         return cmd
 
+    def root_args(self) -> list[str]:
+        """Return the arguments that make zypper operate on self.root."""
+        if self.root is None:
+            return []
+        return ["--root", self.root]
+
     def refresh(self, **kwargs) -> int:
         """Update the local list of packages."""
         cmd = ["ref"]
@@ -348,7 +1284,7 @@ class Zypper(PackageManager):
         if "force" in kwargs and kwargs["force"]:
             cmd.append("-f")
 
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Refresh)
         return code
 
     def upgrade(self, **kwargs) -> int:
@@ -356,7 +1292,14 @@ class Zypper(PackageManager):
         cmd: list[str] = ["dup"] if self.platform.name == "opensuse-tumbleweed" else ["up"]
         if self.yes:
             cmd.append("-y")
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Upgrade)
+        return code
+
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates without installing them."""
+        cmd: list[str] = ["dup"] if self.platform.name == "opensuse-tumbleweed" else ["up"]
+        cmd.extend(["--download-only", "-y"])
+        _, code = self._run(cmd, op=Operation.Prefetch)
         return code
 
     def install(self, *args, **kwargs) -> int:
@@ -367,7 +1310,7 @@ class Zypper(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Install)
         return code
 
     def remove(self, *args, **kwargs) -> int:
@@ -376,7 +1319,7 @@ class Zypper(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Delete)
         return code
 
     def autoremove(self, *args, **kwargs) -> int:
@@ -387,54 +1330,171 @@ class Zypper(PackageManager):
     def cleanup(self, *args, **kwargs) -> int:
         """Clean up downloaded packages."""
         cmd = ["clean", "--all"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Cleanup)
         return code
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # We *could* configure a 3rd-party audit tool like lynis...
         print("Audit on openSUSE is not implemented, yet.")
-        return []
+        return PackageTable()
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages, the ones installed as dependencies are marked with "i+"."""
+        cmd: Final[list[str]] = ["--xmlout", "se", "--installed-only", "--details", "--type", "package"]
+        packages: Final[PackageTable] = \
+            PackageTable(perf.timed_iter("parse.zypper", parse_zypper_xml(self._stream(cmd, op=Operation.Search))))
+        auto: Final[set[str]] = zypper_autoinstalled(self.root)
+        for idx in packages.installed():
+            if packages.names[idx] in auto:
+                packages.set_info(idx, "i+")
+        return packages
+
+    def updates(self) -> PackageTable:
+        """Return the installed packages a newer version is available for."""
+        cmd: Final[list[str]] = ["--xmlout", "list-updates"]
+        return PackageTable(perf.timed_iter("parse.zypper", parse_zypper_updates(self._stream(cmd, op=Operation.Search))))
+
+    def rollback(self, plan: 'Plan') -> int:
+        """Carry out a Plan to return to an earlier snapshot.
+
+        zypper install removes the packages prefixed with an exclamation
+        mark, so a single call does it all.
+        """
+        cmd = ["install", "--oldpackage"]
+        if self.yes:
+            cmd.append("-y")
+        cmd.extend(self.version_spec(c.name, c.new or "") for c in plan.install + plan.downgrade)
+        cmd.extend(f"!{c.name}" for c in plan.remove)
+        _, code = self._run(cmd, op=Operation.Rollback)
+        return code
 
-    def search(self, *args, **kwargs) -> list[Package]:
+    def patches(self) -> PackageTable:
+        """Return the patches that are not installed, yet."""
+        cmd: Final[list[str]] = ["--xmlout", "list-patches"]
+        return PackageTable(perf.timed_iter("parse.zypper", parse_zypper_patches(self._stream(cmd, op=Operation.Search))))
+
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
         """Search the package database."""
         self.log.debug("Search %s", BLANK.join(args))
-        cmd: list[str] = []
-        cmd.append("se")
+        cmd: list[str] = ["--xmlout", "se"]
         cmd.extend(args)
-        if not self._run(cmd, True):
+        cnt: int = 0
+        for p in perf.timed_iter("parse.zypper", parse_zypper_xml(self._stream(cmd, op=Operation.Search))):
+            cnt += 1
+            yield p
+        if cnt == 0:
             self.log.error("Search for '%s' failed:\n%s",
                            BLANK.join(args),
                            self.output[1])
-            return []
 
-        m = zyppPat.findall(self.output[0])
-        results: list[Package] = []
-        if len(m) == 0:
-            self.log.error("Cannot parse output of zypper:\n%s",
-                           self.output[0])
-        else:
-            # First match contains the column headers, so we skip those
-            for group in m[1:]:
-                p: Package = Package(name=group[1],
-                                     desc=group[2].strip(),
-                                     kind=group[3],
-                                     info=group[0].strip())
-                results.append(p)
-        return results
 
+class PacmanParser(Parser):
+    """PacmanParser understands the output of pacman -Ss.
+
+    Each package is a line with repository, name, version, and optionally
+    the groups and whether it is installed, followed by an indented
+    description:
+
+    extra/emacs 29.4-3 (editors) [installed]
+        The extensible, customizable, self-documenting real-time display editor
+    """
 
-pacPat: Final[re.Pattern] = re.compile(r"""
-^([^/]+) / (\S+) \s+   # repo, package name
-(.*?)                  # version
-(?: \s+ \[(\w+)\])?    # installed?
-\n\s+ (.*)             # description
-""",
-                                       re.X | re.M)
+    __slots__ = ["pending"]
+
+    pending: Optional[Package]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending = None
+
+    def reset(self) -> None:
+        self.pending = None
+
+    def feed(self, line: str) -> Optional[Package]:
+        if line == "":
+            return None
+        if line[0].isspace():
+            p, self.pending = self.pending, None
+            if p is not None:
+                p.desc = line.strip()
+            return p
+
+        done: Final[Optional[Package]] = self.pending
+        self.pending = None
+        fields: Final[list[str]] = line.split(None, 2)
+        repo, slash, name = fields[0].partition("/")
+        if slash == "" or len(fields) < 2:
+            return done
+        # "[installed]", or "[installed: 1.2-3]" if a different version is installed
+        installed: Final[bool] = len(fields) > 2 and "[installed" in fields[2]
+        self.pending = Package(name=name,
+                               desc="",
+                               version=fields[1],
+                               kind=repo,
+                               info="i" if installed else "")
+        return done
+
+    def finish(self) -> Optional[Package]:
+        p, self.pending = self.pending, None
+        return p
+
+
+def parse_pacman(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of pacman -Ss."""
+    return PacmanParser().parse(lines)
 
 
 class Pacman(PackageManager):
-    """Pacman is a frontend to Arch Linux' pacman"""
+    """Pacman is a frontend to Arch Linux' pacman
+
+    Searches, and the lists of installed packages and pending updates, are
+    answered from pacman's sync databases and the local database, which we
+    read ourselves (see sloth.pacmandb). We only run pacman -Ss if there are
+    no sync databases, or if we cannot read one of them.
+    """
+
+    __slots__ = [
+        "db",
+    ]
+
+    parser: ClassVar[type[Parser]] = PacmanParser
+    # pacman -S installs whatever the sync databases offer.
+    pin_versions: ClassVar[bool] = False
+    marks_dependencies: ClassVar[bool] = True
+    db: Optional['PacmanDB']
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        super().__init__(root)
+        self.db = None
+
+    def detach(self) -> 'PackageManager':
+        """Return a copy of this PackageManager that can be used from another thread."""
+        pm = super().detach()
+        assert isinstance(pm, Pacman)
+        pm.db = None
+        return pm
+
+    def _db(self) -> Optional['PacmanDB']:
+        """Return the package databases, reading those that have changed.
+
+        Returns None if there are no sync databases, or if we cannot read
+        all of them.
+        """
+        from sloth.pacmandb import \
+            PacmanDB  # pylint: disable-msg=C0415
+        if self.db is None:
+            self.db = PacmanDB(self.root)
+        db = self.db
+        if not db.is_current():
+            try:
+                db.load()
+            except OSError as err:
+                self.log.error("Cannot read the pacman databases: %s", err)
+                return None
+        if len(db.repos) == 0 or len(db.unreadable) > 0:
+            return None
+        return db
 
     def pkg_cmd(self, _op: Optional[Operation] = None) -> list[str]:
         """Return the command to execute the package manager."""
@@ -442,82 +1502,142 @@ class Pacman(PackageManager):
             return [self.sudo, "pacman"]
         return ["pacman"]
 
+    def root_args(self) -> list[str]:
+        """Return the arguments that make pacman operate on self.root."""
+        if self.root is None:
+            return []
+        return ["--root", self.root]
+
     def refresh(self, **kwargs) -> int:
         """Update the local package database"""
         cmd = ["-Sy"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Refresh)
         return code
 
     def upgrade(self, **kwargs) -> int:
         """Install pending updates"""
         cmd = ["-Syu"]
-        _, code = self._run(cmd)
+        if self.yes:
+            cmd.append("--noconfirm")
+        _, code = self._run(cmd, op=Operation.Upgrade)
+        return code
+
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates into the package cache without installing them.
+
+        This uses the sync databases as they are, refreshing them is up to
+        refresh.
+        """
+        cmd = ["-Suw", "--noconfirm"]
+        _, code = self._run(cmd, op=Operation.Prefetch)
         return code
 
     def install(self, *args, **kwargs) -> int:
         """Install packages"""
-        cmd = ["-S"] + list(args)
-        _, code = self._run(cmd)
+        cmd = ["-S"]
+        if self.yes:
+            cmd.append("--noconfirm")
+        cmd.extend(args)
+        _, code = self._run(cmd, op=Operation.Install)
         return code
 
     def remove(self, *args, **kwargs) -> int:
         """Remove one or more packages."""
         cmd = ["-R"]
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Delete)
         return code
 
     def autoremove(self, *args, **kwargs) -> int:
         """Remove unneeded packages."""
         cmd = ["-R", "-u"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Autoremove)
         return code
 
     def cleanup(self, *args, **kwargs) -> int:
         """Clean up downloaded packages."""
         cmd = ["-Scc"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Cleanup)
         return code
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # We *could* configure a 3rd-party audit tool like lynis...
         print("Audit on Arch is not implemented, yet.")
-        return []
-
-    def search(self, *args, **kwargs) -> list[Package]:
+        return PackageTable()
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages."""
+        db = self._db()
+        if db is None:
+            raise NotImplementedError("Cannot read the pacman databases")
+        return PackageTable(db.installed_packages())
+
+    def updates(self) -> PackageTable:
+        """Return the installed packages a newer version is available for."""
+        db = self._db()
+        if db is None:
+            raise NotImplementedError("Cannot read the pacman databases")
+        return PackageTable(db.updates())
+
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
         """Search for available packages"""
         self.log.debug("Search %s", BLANK.join(args))
+        db = self._db()
+        if db is not None:
+            yield from db.search(*args)
+            return
         cmd: list[str] = ["-Ss"]
         cmd.extend(args)
-        self._run(cmd, True)
-        m = pacPat.findall(self.output[0])
-        if not m:
+        cnt: int = 0
+        for p in perf.timed_iter("parse.pacman", self.parser().parse(self._stream(cmd, op=Operation.Search))):
+            cnt += 1
+            yield p
+        if cnt == 0:
             self.log.debug("No results were found for '%s'", BLANK.join(args))
-            return []
 
-        results: list[Package] = []
 
-        for group in m:
-            if len(group) == 5:
-                p = Package(name=group[1],
-                            desc=group[4],
-                            version=group[2],
-                            kind=group[0],
-                            info=group[3])
-                results.append(p)
-            else:
-                p = Package(name=group[1],
-                            desc=group[3],
-                            version=group[2],
-                            kind=group[0])
-                results.append(p)
+class DNF(PackageManager):
+    """DNF is the package manager on RHEL, Fedora, and their offspring.
 
-        return results
+    Loading the repository metadata and the rpmdb into a sack takes several
+    seconds, so we keep the sack around for the whole session, and only throw
+    it away when it is outdated, i.e. after a refresh, install, or remove.
+    """
 
+    __slots__ = [
+        "sack_base",
+        "sack_lock",
+        "keep_warm",
+        "warmer",
+        "warm_lock",
+    ]
 
-class DNF(PackageManager):
-    """DNF is the package manager on RHEL, Fedora, and their offspring."""
+    marks_dependencies: ClassVar[bool] = True
+    sack_base: Optional[Any]
+    sack_lock: threading.Lock
+    keep_warm: bool
+    warmer: Optional[threading.Thread]
+    warm_lock: threading.Lock
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        super().__init__(root)
+        self.sack_base = None
+        self.sack_lock = threading.Lock()
+        self.keep_warm = False
+        self.warmer = None
+        self.warm_lock = threading.Lock()
+
+    def detach(self) -> 'PackageManager':
+        """Return a copy of this PackageManager that can be used from another thread."""
+        pm = super().detach()
+        assert isinstance(pm, DNF)
+        pm.sack_base = None
+        pm.sack_lock = threading.Lock()
+        pm.keep_warm = False
+        pm.warmer = None
+        pm.warm_lock = threading.Lock()
+        return pm
 
     def pkg_cmd(self, _op: Optional[Operation] = None) -> list[str]:
         """Return the command to execute the package manager."""
@@ -525,12 +1645,24 @@ class DNF(PackageManager):
             return [self.sudo, "dnf"]
         return ["dnf"]
 
+    def root_args(self) -> list[str]:
+        """Return the arguments that make dnf operate on self.root."""
+        if self.root is None:
+            return []
+        return [f"--installroot={self.root}"]
+
     def refresh(self, **kwargs) -> int:
         """Update the local package database"""
         # dnf does not have an explicit command to refresh its database, as far as I can tell.
         # But I suppose this is a useful approximation.
         cmd = ["--refresh", "check-update"]
-        _, code = self._run(cmd)
+        # check-update exits with 100 if there are updates, which is no
+        # reason to think the refresh failed.
+        ok, code = self._run(cmd, op=Operation.Refresh, ok=(0, 100))
+        self.invalidate()
+        if ok:
+            self.last_code = 0
+            return 0
         return code
 
     def upgrade(self, **kwargs) -> int:
@@ -538,7 +1670,14 @@ class DNF(PackageManager):
         cmd = ["upgrade"]
         if self.yes:
             cmd.append("-y")
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Upgrade)
+        self.invalidate()
+        return code
+
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates without installing them."""
+        cmd = ["upgrade", "--downloadonly", "-y"]
+        _, code = self._run(cmd, op=Operation.Prefetch)
         return code
 
     def install(self, *args, **kwargs) -> int:
@@ -547,7 +1686,8 @@ class DNF(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Install)
+        self.invalidate()
         return code
 
     def remove(self, *args, **kwargs) -> int:
@@ -556,7 +1696,8 @@ class DNF(PackageManager):
         if self.yes:
             cmd.append("-y")
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Delete)
+        self.invalidate()
         return code
 
     def autoremove(self, *args, **kwargs) -> int:
@@ -564,16 +1705,17 @@ class DNF(PackageManager):
         cmd = ["autoremove"]
         if self.yes:
             cmd.append("-y")
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Autoremove)
+        self.invalidate()
         return code
 
     def cleanup(self, *args, **kwargs) -> int:
         """Clean up downloaded packages."""
         cmd = ["clean all"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Cleanup)
         return code
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # Output of "dnf advisory list --updates":
         # Aktualisiere und lade Paketquellen:
@@ -584,38 +1726,221 @@ class DNF(PackageManager):
         # FEDORA-2025-c6d8815d3a bugfix      Moderate selinux-policy-targeted-41.36-1.fc41.noarch 2025-04-09 01:25:12
         if self.platform.name == "fedora":
             cmd = ["advisory", "list", "--updates"]
-            self._run(cmd)
+            self._run(cmd, op=Operation.Audit)
         else:
             print("Audit on Fedora / RHEL is not implemented, yet.")
-        return []
+        return PackageTable()
+
+    def warm_up(self) -> None:
+        """Load the sack in the background, so it is ready when we need it.
+
+        There is at most one thread doing that, if it is running already, it
+        loads the sack again if it was thrown away in the meantime.
+        """
+        self.keep_warm = True
+        with self.warm_lock:
+            if self.warmer is not None:
+                return
+            self.warmer = threading.Thread(target=self.__warm,
+                                           name="dnf-warm-up",
+                                           daemon=True)
+            self.warmer.start()
+
+    def __warm(self) -> None:
+        try:
+            while True:
+                self._sack()
+                with self.warm_lock:
+                    if self.sack_base is not None or not self.keep_warm:
+                        self.warmer = None
+                        return
+        except Exception as err:  # pylint: disable-msg=W0718
+            self.log.error("Cannot load the dnf sack: %s", err)
+            with self.warm_lock:
+                self.warmer = None
+
+    def invalidate(self) -> None:
+        """Throw away the sack, and start loading a fresh one if we are supposed to keep it warm."""
+        with self.sack_lock:
+            if self.sack_base is not None:
+                self.sack_base.close()
+                self.sack_base = None
+        if self.keep_warm:
+            self.warm_up()
+
+    def _sack(self):
+        """Return the dnf.Base holding the sack, loading it if necessary.
+
+        If the sack is currently being loaded by another thread, we wait for it.
+        """
+        with self.sack_lock:
+            if self.sack_base is None:
+                self.sack_base = self._base()
+            return self.sack_base
+
+    def catalog(self) -> Iterator[Package]:
+        """Return all packages available from the configured repositories."""
+        return self._query(lambda q: q.latest())
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages."""
+        return PackageTable(self._query(lambda q: q.installed()))
 
-    def search(self, *args, **kwargs) -> list[Package]:
-        """Search the package database"""
+    def version_spec(self, name: str, version: str) -> str:
+        """Return the argument that tells dnf install to install a specific version of a package."""
+        return f"{name}-{version}"
+
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
+        """Search the package database.
+
+        By default, we look for packages whose name contains all of the search
+        terms. Pass by="summary" to search the summaries, or by="provides" to
+        find the packages that provide a capability, e.g. a file or a library.
+        """
         self.log.debug("Searching for %s", BLANK.join(args))
-        # cmd = ["search"] + args
-        # self._run(cmd, True)
+        by: Final[str] = kwargs.get("by", "name")
+
+        def match(q):
+            for term in args:
+                match by:
+                    case "name":
+                        q = q.filter(name__substr=term)
+                    case "summary":
+                        q = q.filter(summary__substr=term)
+                    case "provides":
+                        q = q.filter(provides__glob=term)
+                    case _:
+                        raise ValueError(f"Cannot search by {by}")
+            return q
+
+        return self._query(match)
+
+    @perf.timed("dnf.query")
+    def _query(self, refine: Callable[[Any], Any]) -> Iterator[Package]:
+        """Run a query against the sack and return the results."""
+        with self.sack_lock:
+            if self.sack_base is None:
+                self.sack_base = self._base()
+            q = refine(self.sack_base.sack.query())
+            # The sack may get closed by invalidate() once we release the lock,
+            # so we collect the results while we hold it.
+            results: list[Package] = list(self._convert(q, self.sack_base.history))
+        return iter(results)
+
+    @perf.timed("dnf.sack")
+    def _base(self):
+        """Create a dnf.Base for self.root and load the package sack."""
+        # Importing dnf takes a while, and it only exists on Fedora / RHEL anyway.
+        import dnf  # pylint: disable-msg=C0415,E0401
+        self.log.debug("Load dnf sack")
         base = dnf.Base()
+        if self.root is not None:
+            base.conf.installroot = self.root
+        base.read_all_repos()
         base.fill_sack()
-        q = base.sack.query().filter(name__substr=args[0])
-        results = []
+        return base
+
+    def _convert(self, q, history) -> Iterator[Package]:
+        """Turn the results of a query against the sack into Packages.
+
+        dnf's history tells us which packages were installed as dependencies,
+        those are marked with "i+".
+        """
         for p in q.run():
-            print(p)
-            pack = Package(
+            info: str = ""
+            if p.installed:
+                info = "i" if history.user_installed(p) else "i+"
+            yield Package(
                 name=p.name,
                 desc=p.summary,
-                version=p.version,
-                info="i" if p.installed else "",
-                kind=p.reponame)
-            results.append(pack)
-        return results
+                # dnf, like rpm, names a package name-version-release.
+                version=f"{p.version}-{p.release}",
+                info=info,
+                kind=p.reponame,
+                arch=p.arch)
+
+
+class PkgParser(Parser):
+    """PkgParser understands the output of pkg search, one package per line.
+
+    emacs-29.4_2,3                 GNU editing macros
+    """
 
+    __slots__: list[str] = []
 
-pkgPat: Final[re.Pattern] = re.compile(r"""^([-_a-zA-Z0-9]+?)-(\d\S+)\s+(.*)""",
-                                       re.M | re.X)
+    def feed(self, line: str) -> Optional[Package]:
+        fields: Final[list[str]] = line.split(None, 1)
+        if len(fields) == 0:
+            return None
+        # Versions never contain a dash, package names often do.
+        name, dash, version = fields[0].rpartition("-")
+        if dash == "" or name == "":
+            return None
+        return Package(name=name,
+                       version=version,
+                       desc=fields[1].strip() if len(fields) > 1 else "")
+
+
+def parse_pkg(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of pkg search."""
+    return PkgParser().parse(lines)
 
 
 class FreeBSD(PackageManager):
-    """FreeBSD provides support for the FreeBSD operating system (hence the name)."""
+    """FreeBSD provides support for the FreeBSD operating system (hence the name).
+
+    Searches, and the lists of installed packages and pending updates, are
+    answered by querying pkg's SQLite databases ourselves (see sloth.pkgdb).
+    In jails, whose databases we cannot locate by name, we run pkg search.
+    """
+
+    __slots__ = [
+        "db",
+    ]
+
+    parser: ClassVar[type[Parser]] = PkgParser
+    # pkg install installs whatever the repositories offer.
+    pin_versions: ClassVar[bool] = False
+    marks_dependencies: ClassVar[bool] = True
+    db: Optional['PkgDB']
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        super().__init__(root)
+        self.db = None
+
+    def detach(self) -> 'PackageManager':
+        """Return a copy of this PackageManager that can be used from another thread."""
+        pm = super().detach()
+        assert isinstance(pm, FreeBSD)
+        pm.db = None
+        return pm
+
+    def _db(self) -> Optional['PkgDB']:
+        """Return the package databases, (re-)opening them if pkg has replaced them.
+
+        Returns None if we are working on a jail, or pkg has not created its
+        databases, yet.
+        """
+        from sloth.pkgdb import \
+            PkgDB  # pylint: disable-msg=C0415
+        if self.root is not None:
+            return None
+        if self.db is None:
+            self.db = PkgDB()
+            # Let queries join against our own history.
+            if os.path.exists(common.path.db()):
+                self.db.attach("sloth", common.path.db())
+        db = self.db
+        if not db.is_current():
+            try:
+                db.open()
+            except sqlite3.Error as err:
+                self.log.error("Cannot open the pkg databases: %s", err)
+                db.close()
+                return None
+        if len(db.repos) == 0:
+            return None
+        return db
 
     def pkg_cmd(self, _op: Optional[Operation] = None) -> list[str]:
         """Return the path to the package manager."""
@@ -623,70 +1948,106 @@ class FreeBSD(PackageManager):
             return [self.sudo, "/usr/sbin/pkg"]
         return ["/usr/sbin/pkg"]
 
+    def root_args(self) -> list[str]:
+        """Return the arguments that make pkg(8) operate on the jail self.root."""
+        if self.root is None:
+            return []
+        return ["-j", self.root]
+
     def refresh(self, **kwargs) -> int:
         """Update the local package database."""
         cmd = ["update"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Refresh)
         return code
 
     def upgrade(self, **kwargs) -> int:
         """Install available updates."""
         cmd = ["upgrade"]
-        _, code = self._run(cmd)
+        if self.yes:
+            cmd.append("-y")
+        _, code = self._run(cmd, op=Operation.Upgrade)
+        return code
+
+    def prefetch(self, **kwargs) -> int:
+        """Download pending updates without installing them."""
+        cmd = ["fetch", "-u", "-y"]
+        _, code = self._run(cmd, op=Operation.Prefetch)
         return code
 
     def install(self, *args, **kwargs) -> int:
         """Install one or more packages."""
-        cmd = ["install"] + list(args)
-        _, code = self._run(cmd)
+        cmd = ["install"]
+        if self.yes:
+            cmd.append("-y")
+        cmd.extend(args)
+        _, code = self._run(cmd, op=Operation.Install)
         return code
 
     def remove(self, *args, **kwargs) -> int:
         """Remove one or more packages."""
         cmd = ["delete"]
         cmd.extend(args)
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Delete)
         return code
 
     def autoremove(self, *args, **kwargs) -> int:
         """Remove unneeded packages."""
         cmd = ["autoremove"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Autoremove)
         return code
 
     def cleanup(self, *args, **kwargs) -> int:
         """Clean up downloaded packages."""
         cmd = ["clean"]
-        _, code = self._run(cmd)
+        _, code = self._run(cmd, op=Operation.Cleanup)
         return code
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # pkg audit -Rjson will print the result in JSON.
         cmd = ["audit", "-F"]
-        self._run(cmd)
-        return []
-
-    def search(self, *args, **kwargs) -> list[Package]:
+        self._run(cmd, op=Operation.Audit)
+        return PackageTable()
+
+    def catalog_query(self) -> list[str]:
+        """Return the search arguments that match all available packages."""
+        # pkg search treats its argument as a regular expression by default.
+        return ["."]
+
+    def installed(self) -> PackageTable:
+        """Return the installed packages."""
+        db = self._db()
+        if db is None:
+            raise NotImplementedError("Cannot open the pkg databases")
+        return PackageTable(db.installed_packages())
+
+    def updates(self) -> PackageTable:
+        """Return the installed packages a newer version is available for."""
+        db = self._db()
+        if db is None:
+            raise NotImplementedError("Cannot open the pkg databases")
+        return PackageTable(db.updates())
+
+    def compare_versions(self, a: str, b: str) -> int:
+        """Compare two versions the way pkg does."""
+        from sloth import pkgdb  # pylint: disable-msg=C0415
+        return pkgdb.vercmp(a, b)
+
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
         """Search for available packages."""
+        db = self._db()
+        if db is not None:
+            yield from db.search(*args)
+            return
         cmd: list[str] = ["search"]
         cmd.extend(args)
-        self._run(cmd, True)
-        m = pkgPat.findall(self.output[0])
-        results: list[Package] = []
-
-        if len(m) == 0:
-            self.log.error("Cannot parse output of pkg(8):\n%s\n%s\n",
-                           self.output[0],
+        cnt: int = 0
+        for p in perf.timed_iter("parse.pkg", self.parser().parse(self._stream(cmd, op=Operation.Search))):
+            cnt += 1
+            yield p
+        if cnt == 0:
+            self.log.error("Cannot parse output of pkg(8):\n%s\n",
                            self.output[1])
-        else:
-            for i in m:
-                p = Package(name=i[0],
-                            version=i[1],
-                            desc=i[2])
-                results.append(p)
-
-        return results
 
 
 # Sample output of pkg_info -Q emacs on OpenBSD 7.6
@@ -704,13 +2065,42 @@ class FreeBSD(PackageManager):
 # xemacs-sumo-21.20100727p1
 # xemacs-sumo-21.20100727p1-mule
 
-openBSDPat: Final[re.Pattern] = re.compile(r"^([-\w]+?)-(\d\S+)(?:\s+\((installed)\))?$",
-                                           re.I | re.X | re.M)
+class OpenBSDParser(Parser):
+    """OpenBSDParser understands the output of pkg_info -Q, one package per line.
+
+    The version starts with the first dash that is followed by a digit,
+    anything after it, e.g. the flavor, is considered part of the version.
+    """
+
+    __slots__: list[str] = []
+
+    def feed(self, line: str) -> Optional[Package]:
+        fields: Final[list[str]] = line.split()
+        if len(fields) == 0:
+            return None
+        ident: Final[str] = fields[0]
+        pos: int = ident.find("-")
+        while pos != -1 and not ident[pos + 1:pos + 2].isdigit():
+            pos = ident.find("-", pos + 1)
+        if pos <= 0:
+            return None
+        return Package(name=ident[:pos],
+                       desc="",
+                       kind="",
+                       info="i" if "(installed)" in fields[1:] else "",
+                       version=ident[pos + 1:])
+
+
+def parse_openbsd(lines: Iterable[str]) -> Iterator[Package]:
+    """Parse the output of pkg_info -Q."""
+    return OpenBSDParser().parse(lines)
 
 
 class OpenBSD(PackageManager):
     """OpenBSD provides support for OpenBSD's pkg_* package management."""
 
+    parser: ClassVar[type[Parser]] = OpenBSDParser
+
     def _cmd(self, op: Operation) -> str:
         """Return the appropriate command for the operation."""
         match op:
@@ -774,41 +2164,33 @@ class OpenBSD(PackageManager):
         self.log.debug("Cleanup is not implemented on OpenBSD.")
         return 0
 
-    def audit(self, *args, **kwargs) -> list[Package]:
+    def audit(self, *args, **kwargs) -> PackageTable:
         """Audit installed packages for known vulnerabilities."""
         # We *could* configure a 3rd-party audit tool like lynis...
         print("Audit on OpenBSD is not implemented, yet.")
-        return []
+        return PackageTable()
 
-    def search(self, *args, **kwargs) -> list[Package]:
+    def catalog(self) -> Iterator[Package]:
+        """Return all packages available from the configured repositories."""
+        # pkg_info -Q requires a search term, and I have not found one that
+        # reliably matches everything, yet. So we always search live.
+        self.log.info("The package catalog is not supported on OpenBSD.")
+        return iter([])
+
+    def search_iter(self, *args, **kwargs) -> Iterator[Package]:
         """Search for available packages."""
         assert len(args) > 0
         argstr: Final[str] = BLANK.join(args)
         self.log.debug("Search for %s", argstr)
         cmd = ["-Q"]
         cmd.extend(args)
-        self._run(cmd, True, op=Operation.Search)
-
-        packages: list[Package] = []
-        m = openBSDPat.findall(self.output[0])
-        if len(m) == 0:
-            self.log.error("Cannot parse output of pkg_info:\n%s\n\n%s\n\n\n",
-                           self.output[0],
+        cnt: int = 0
+        for p in perf.timed_iter("parse.openbsd", self.parser().parse(self._stream(cmd, op=Operation.Search))):
+            cnt += 1
+            yield p
+        if cnt == 0:
+            self.log.error("Cannot parse output of pkg_info:\n%s\n\n\n",
                            self.output[1])
-        else:
-            for group in m:
-                info: str = ""
-                if len(group) == 3:
-                    info = "i" if group[2] == "installed" else ""
-
-                p: Package = Package(name=group[0],
-                                     desc="",
-                                     kind="",
-                                     info=info,
-                                     version=group[1])
-                packages.append(p)
-
-        return packages
 
 # Local Variables: #
 # python-indent: 4 #
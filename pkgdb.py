@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:36:14 krylon>
+#
+# /data/code/python/sloth/pkgdb.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.pkgdb
+
+(c) 2026 Benjamin Walkenhorst
+
+Query the databases of FreeBSD's pkg(8) directly, instead of asking pkg.
+pkg keeps the installed packages in /var/db/pkg/local.sqlite, and the
+catalog of each repository in /var/db/pkg/repo-<name>.sqlite. We open the
+former read-only and attach the latter, so a single query can look at the
+installed and the available packages at once.
+"""
+
+import glob
+import logging
+import os
+import re
+import sqlite3
+from functools import cmp_to_key
+from typing import Final, Iterator, NamedTuple, Optional
+
+from sloth import common, perf
+from sloth.pkg import Package
+
+DB_PATH: Final[str] = "var/db/pkg"
+LOCAL_DB: Final[str] = "local.sqlite"
+REPO_DB: Final[str] = "repo-*.sqlite"
+
+# Characters that have a special meaning in a regular expression.
+REGEX_META: Final[str] = ".^$*+?{}[]\\|()"
+
+
+class Component(NamedTuple):
+    """Component is a part of a version number, the part between two dots."""
+
+    n: int   # the number
+    a: int   # a letter, or a stage like alpha, beta, ...
+    pl: int  # the patch level after the letter
+
+
+# Stages, like in 1.0alpha1, in ascending order. "pl" (patch level) is a
+# special case, it counts as a stage only if it does not follow a number.
+STAGES: Final[list[tuple[str, int]]] = [
+    ("pl", 0),
+    ("alpha", ord("a") - ord("a") + 1),
+    ("beta", ord("b") - ord("a") + 1),
+    ("pre", ord("p") - ord("a") + 1),
+    ("rc", ord("r") - ord("a") + 1),
+]
+
+
+def _isdigit(c: str) -> bool:
+    return c.isascii() and c.isdigit()
+
+
+def _isalpha(c: str) -> bool:
+    return c.isascii() and c.isalpha()
+
+
+def _number(s: str, pos: int) -> tuple[int, int]:
+    """Return the number starting at pos, and the position behind it."""
+    end: int = pos
+    while end < len(s) and _isdigit(s[end]):
+        end += 1
+    return int(s[pos:end]), end
+
+
+def _component(s: str, pos: int, end: int) -> tuple[Component, int]:
+    """Return the component of a version number starting at pos, and where the next one starts."""
+    n: int
+    a: int = 0
+    pl: int = 0
+    has_stage: bool = False
+    if pos < end and _isdigit(s[pos]):
+        n, pos = _number(s, pos)
+    elif pos < end and s[pos] == "*":
+        n = -2
+        while pos < end and s[pos] != "+":
+            pos += 1
+    else:
+        n = -1
+        has_stage = True
+
+    if pos < end and _isalpha(s[pos]):
+        for stage, value in STAGES:
+            stop: int = pos + len(stage)
+            if s[pos:stop].lower() == stage and not (stop < end and _isalpha(s[stop])):
+                if has_stage:
+                    a = value
+                    pos = stop
+                break
+        else:
+            a = ord(s[pos].lower()) - ord("a") + 1
+            while pos < end and _isalpha(s[pos]):
+                pos += 1
+
+    if pos < end and _isdigit(s[pos]):
+        pl, pos = _number(s, pos)
+
+    while pos < end and not (_isdigit(s[pos]) or _isalpha(s[pos]) or s[pos] in "+*"):
+        pos += 1
+    return Component(n, a, pl), pos
+
+
+def _leading_number(s: str) -> int:
+    """Return the number at the start of s, or 0, like strtoul."""
+    end: int = 0
+    while end < len(s) and _isdigit(s[end]):
+        end += 1
+    return int(s[:end] or "0")
+
+
+def _split_version(v: str) -> tuple[str, int, int]:
+    """Split a version into the port version, the epoch, and the revision.
+
+    The syntax is PORTVERSION[_PORTREVISION][,PORTEPOCH]
+    """
+    v = v.rpartition("-")[2]
+    end: int = len(v)
+    revision: int = 0
+    epoch: int = 0
+    underscore: Final[int] = v.rfind("_")
+    if underscore != -1:
+        revision = _leading_number(v[underscore + 1:])
+        end = underscore
+    comma: Final[int] = v.rfind(",", underscore + 1)
+    if comma != -1:
+        epoch = _leading_number(v[comma + 1:])
+        if underscore == -1:
+            end = comma
+    return v[:end], epoch, revision
+
+
+def vercmp(a: str, b: str) -> int:
+    """Compare two versions like pkg version -t does.
+
+    Returns -1 if a is older than b, 0 if they are equal, 1 if a is newer.
+    """
+    va, ea, ra = _split_version(a)
+    vb, eb, rb = _split_version(b)
+    if ea != eb:
+        return -1 if ea < eb else 1
+    if va.lower() != vb.lower():
+        i: int = 0
+        j: int = 0
+        while i < len(va) or j < len(vb):
+            ca: Component = Component(0, 0, 0)
+            cb: Component = Component(0, 0, 0)
+            blocked_a: bool = i >= len(va) or va[i] == "+"
+            blocked_b: bool = j >= len(vb) or vb[j] == "+"
+            if not blocked_a:
+                ca, i = _component(va, i, len(va))
+            if not blocked_b:
+                cb, j = _component(vb, j, len(vb))
+            if blocked_a and blocked_b:
+                i += 1
+                j += 1
+            elif ca != cb:
+                return -1 if ca < cb else 1
+    if ra != rb:
+        return -1 if ra < rb else 1
+    return 0
+
+
+version_key: Final = cmp_to_key(vercmp)
+
+
+def _prefix(term: str) -> str:
+    """Return the literal prefix an anchored regular expression matches, if any."""
+    if not term.startswith("^") or "|" in term:
+        return ""
+    end: int = 1
+    while end < len(term) and term[end] not in REGEX_META:
+        end += 1
+    # In ^emacs?, the s is optional.
+    if end < len(term) and term[end] in "*?{":
+        end -= 1
+    return term[1:end]
+
+
+def _regexp(pattern: str, value: Optional[str]) -> bool:
+    return value is not None and re.search(pattern, value, re.I) is not None
+
+
+class PkgDB:
+    """PkgDB answers queries about the installed and the available packages of a FreeBSD system.
+
+    We keep the connection open, SQLite shows us any changes pkg makes to
+    the databases, but pkg update replaces the repository catalogs with new
+    files, so we reopen the databases when that happens.
+    """
+
+    __slots__ = [
+        "log",
+        "root",
+        "conn",
+        "repos",
+        "stamps",
+        "extra",
+    ]
+
+    log: logging.Logger
+    root: str
+    conn: Optional[sqlite3.Connection]
+    repos: list[str]
+    stamps: dict[str, tuple[int, int]]
+    extra: dict[str, str]
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.log = common.get_logger("pkgdb")
+        self.root = root or "/"
+        self.conn = None
+        self.repos = []
+        self.stamps = {}
+        self.extra = {}
+
+    def path(self, name: str) -> str:
+        """Return the path of one of pkg's databases."""
+        return os.path.join(self.root, DB_PATH, name)
+
+    def catalogs(self) -> dict[str, str]:
+        """Return the repository catalogs, by the name of the repository."""
+        found: Final[dict[str, str]] = {os.path.basename(p)[5:-7]: p for p in glob.glob(self.path(REPO_DB))}
+        return {name: found[name] for name in sorted(found)}
+
+    def __stamps(self) -> dict[str, tuple[int, int]]:
+        stamps: dict[str, tuple[int, int]] = {}
+        for path in [self.path(LOCAL_DB), *self.catalogs().values()]:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_dev, st.st_ino)
+            except FileNotFoundError:
+                pass
+        return stamps
+
+    def is_current(self) -> bool:
+        """Return True if the databases we have opened are still the ones pkg uses."""
+        return self.conn is not None and self.stamps == self.__stamps()
+
+    @perf.timed("pkgdb.open")
+    def open(self) -> 'PkgDB':
+        """Open the local database and attach the repository catalogs, read-only."""
+        self.close()
+        self.stamps = self.__stamps()
+        conn = sqlite3.connect(f"file:{self.path(LOCAL_DB)}?mode=ro", uri=True)
+        conn.create_function("vercmp", 2, vercmp, deterministic=True)
+        conn.create_function("regexp", 2, _regexp, deterministic=True)
+        repos: list[str] = []
+        try:
+            for name, path in self.catalogs().items():
+                conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", f"repo_{name}"))
+                repos.append(name)
+            for schema, path in self.extra.items():
+                conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", schema))
+        except sqlite3.Error:
+            conn.close()
+            raise
+        self.conn = conn
+        self.repos = repos
+        self.log.debug("Opened the local database and %d catalogs", len(repos))
+        return self
+
+    def close(self) -> None:
+        """Close the databases."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def attach(self, schema: str, path: str) -> None:
+        """Attach another database, read-only, e.g. sloth's own, to join against.
+
+        The attachment survives reopening the databases.
+        """
+        self.extra[schema] = path
+        if self.conn is not None:
+            self.conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", schema))
+
+    def query(self, sql: str, args: tuple = ()) -> list[tuple]:
+        """Run a query and return all rows."""
+        assert self.conn is not None
+        return self.conn.execute(sql, args).fetchall()
+
+    @staticmethod
+    def info(automatic: Optional[int]) -> str:
+        """Return the installed state in the format the other backends use."""
+        if automatic is None:
+            return ""
+        return "i+" if automatic else "i"
+
+    def search(self, *terms: str) -> Iterator[Package]:
+        """Yield the packages whose names match all terms.
+
+        Like pkg search, the terms are regular expressions, and the search
+        is not case sensitive. A package is listed once for every repository
+        that has it. Terms that are not valid regular expressions are taken
+        literally.
+        """
+        where: list[str] = []
+        args: list[str] = []
+        for pat in common.search_patterns(terms):
+            term: str = pat.pattern
+            where.append("p.name REGEXP ?")
+            args.append(term)
+            prefix: str = _prefix(term)
+            if prefix != "":
+                # This lets SQLite use the index on the name.
+                where.append("p.name >= ? COLLATE NOCASE AND p.name < ? COLLATE NOCASE")
+                args.extend([prefix, prefix + "\U0010ffff"])
+        cond: Final[str] = " AND ".join(where) or "1"
+        for repo in self.repos:
+            rows = self.query(f"""
+            SELECT p.name, p.version, p.comment, l.automatic
+            FROM "repo_{repo}".packages p
+            LEFT JOIN main.packages l ON l.name = p.name
+            WHERE {cond}
+            ORDER BY p.name
+            """, tuple(args))
+            for name, version, comment, automatic in rows:
+                yield Package(name=name,
+                              desc=comment or "",
+                              kind=repo,
+                              version=version,
+                              info=self.info(automatic))
+
+    def installed_packages(self) -> Iterator[Package]:
+        """Yield the installed packages, with the version that is installed."""
+        for name, version, comment, automatic, arch in self.query(
+                "SELECT name, version, comment, automatic, arch FROM main.packages ORDER BY name"):
+            yield Package(name=name,
+                          desc=comment or "",
+                          kind="installed",
+                          version=version,
+                          info=self.info(automatic),
+                          arch=arch)
+
+    def versions(self, name: str) -> dict[str, str]:
+        """Return the versions of a package, by repository, "installed" for the local one."""
+        result: dict[str, str] = {}
+        for row in self.query("SELECT version FROM main.packages WHERE name = ?", (name,)):
+            result["installed"] = row[0]
+        for repo in self.repos:
+            for row in self.query(f'SELECT version FROM "repo_{repo}".packages WHERE name = ?', (name,)):
+                result[repo] = row[0]
+        return result
+
+    def updates(self) -> Iterator[Package]:
+        """Yield the installed packages a newer version is available for, with the newest version."""
+        candidates: dict[str, Package] = {}
+        for repo in self.repos:
+            for name, version, comment, automatic in self.query(f"""
+            SELECT p.name, p.version, p.comment, l.automatic
+            FROM main.packages l
+            JOIN "repo_{repo}".packages p ON p.name = l.name
+            WHERE vercmp(p.version, l.version) > 0
+            """):
+                old = candidates.get(name)
+                if old is None or vercmp(version, old.version) > 0:
+                    candidates[name] = Package(name=name,
+                                               desc=comment or "",
+                                               kind=repo,
+                                               version=version,
+                                               info=self.info(automatic))
+        for name in sorted(candidates):
+            yield candidates[name]
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
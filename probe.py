@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-10 20:12:31 krylon>
+# Time-stamp: <2026-10-17 07:22:28 krylon>
 #
 # /data/code/python/sloth/probe.py
 # created on 14. 12. 2023
@@ -18,13 +18,18 @@ sloth.probe
 Discover what OS we are running on exactly.
 """
 
+import json
+import os
 import re
 import subprocess as sp
+import tempfile
 from shutil import which
-from typing import Final, NamedTuple, Optional
+from typing import Any, Final, NamedTuple, Optional
 
 import krylib
 
+from sloth import common, perf
+
 
 class Platform(NamedTuple):
     """Platform identifies a combination of hardware architecture, OS, and version.
@@ -51,6 +56,7 @@ def unquote(s: str) -> str:
     return m[1]
 
 
+@perf.timed("probe.guess_os")
 def guess_os(osrel: str = OS_REL) -> Platform:
     """Attempt to determine which platform we are running on."""
     # First step, we try /etc/os-release, if it exists.
@@ -93,6 +99,127 @@ def find_sudo() -> Optional[str]:
             return full_path
     return None
 
+
+PKG_MANAGERS: Final[list[str]] = [
+    "apt",
+    "zypper",
+    "pacman",
+    "dnf",
+    "pkg",
+    "pkg_add",
+]
+
+
+def find_managers() -> dict[str, str]:
+    """Return the full paths of the package managers that are available."""
+    found: dict[str, str] = {}
+    for c in PKG_MANAGERS:
+        full_path: Optional[str] = which(c)
+        if full_path is not None:
+            found[c] = full_path
+    return found
+
+
+class Probe(NamedTuple):
+    """Probe holds everything we find out about the system we are running on."""
+
+    platform: Platform
+    sudo: Optional[str]
+    managers: dict[str, str]
+
+
+def _stat(path: str) -> Optional[list[int]]:
+    """Return the inode and mtime of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+        return [st.st_ino, st.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def fingerprint(osrel: str = OS_REL) -> dict[str, Any]:
+    """Return a fingerprint of the things probing looks at.
+
+    If the fingerprint has not changed, neither has the result of probing.
+    It consists of the inode and mtime of os-release (or uname, if we have to
+    fall back on it), and of the directories in PATH. Installing or removing a
+    binary changes the mtime of the directory it lives in.
+    """
+    search: Final[str] = os.environ.get("PATH", os.defpath)
+    return {
+        "osrel": _stat(osrel),
+        "uname": _stat("/usr/bin/uname"),
+        "path": search,
+        "dirs": [_stat(d) for d in search.split(os.pathsep)],
+    }
+
+
+_probed: Final[dict[str, Probe]] = {}
+
+
+@perf.timed("probe")
+def probe(osrel: str = OS_REL, cache: str = "") -> Probe:
+    """Return the Platform, sudo, and the available package managers.
+
+    Probing the system involves parsing os-release, possibly forking uname,
+    and walking PATH several times, so we cache the result, in memory and on
+    disk. The cached result is used as long as the fingerprint of the system
+    and the binaries we found are unchanged.
+    """
+    if osrel in _probed:
+        return _probed[osrel]
+    if cache == "":
+        cache = common.path.probe_cache()
+
+    key: Final[dict[str, Any]] = fingerprint(osrel)
+    result: Optional[Probe] = _load_cache(cache, osrel, key)
+    if result is None:
+        result = Probe(guess_os(osrel), find_sudo(), find_managers())
+        _save_cache(cache, osrel, key, result)
+    _probed[osrel] = result
+    return result
+
+
+def _load_cache(cache: str, osrel: str, key: dict[str, Any]) -> Optional[Probe]:
+    """Return the cached Probe if it is still valid."""
+    try:
+        with open(cache, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data["osrel"] != osrel or data["key"] != key:
+            return None
+        for path, st in data["binaries"].items():
+            if _stat(path) != st:
+                return None
+        return Probe(Platform(*data["platform"]),
+                     data["sudo"],
+                     data["managers"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_cache(cache: str, osrel: str, key: dict[str, Any], result: Probe) -> None:
+    """Write the result of probing to the cache file."""
+    binaries: list[str] = list(result.managers.values())
+    if result.sudo is not None:
+        binaries.append(result.sudo)
+    data: Final[dict[str, Any]] = {
+        "osrel": osrel,
+        "key": key,
+        "binaries": {b: _stat(b) for b in binaries},
+        "platform": list(result.platform),
+        "sudo": result.sudo,
+        "managers": result.managers,
+    }
+    try:
+        folder: Final[str] = os.path.dirname(cache)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".probe")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, cache)
+    except OSError:
+        # Not being able to write the cache is no reason to fail.
+        pass
+
 # Local Variables: #
 # python-indent: 4 #
 # End: #
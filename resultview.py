@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:04:22 krylon>
+#
+# /data/code/python/sloth/resultview.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.resultview
+
+(c) 2026 Benjamin Walkenhorst
+
+The result view lets the user pick packages from the results of a search,
+to install the ones that are checked and remove the ones that are not.
+A broad search finds thousands of packages, so the view only renders the
+rows that fit on the screen, straight from the columns of the PackageTable.
+The selection is a set of indices into the results.
+
+Typing narrows the results down to the packages whose name or description
+contain all the words typed so far. If the filter only grows, we only look
+at the packages that matched before.
+
+Keys: Up, Down, Page Up, Page Down, Home and End move the cursor, Tab
+checks or unchecks the package under it, Ctrl-A all packages that match
+the filter, Enter accepts, Escape or Ctrl-C cancels.
+
+The View holds the state and does not need a terminal, run shows it with
+prompt_toolkit, which is only imported when it is called.
+"""
+
+from typing import Final, Optional, Sequence
+
+from sloth.pkg import PackageTable
+
+# The rows above and below the results: the title, the text, the filter,
+# the line below it, and the status line.
+CHROME: Final[int] = 5
+
+Fragments = list[tuple[str, str]]
+
+
+class View:
+    """View is the state of the result view: the filter, the selection, the cursor, and which rows are visible."""
+
+    __slots__ = [
+        "packages",
+        "selected",
+        "query",
+        "matches",
+        "cursor",
+        "top",
+        "height",
+    ]
+
+    packages: PackageTable
+    selected: set[int]
+    query: str
+    matches: Sequence[int]
+    cursor: int
+    top: int
+    height: int
+
+    def __init__(self, packages: PackageTable, selected: Optional[set[int]] = None, height: int = 20) -> None:
+        self.packages = packages
+        self.selected = set() if selected is None else selected
+        self.query = ""
+        self.matches = range(len(packages))
+        self.cursor = 0
+        self.top = 0
+        self.height = max(height, 1)
+
+    def set_filter(self, query: str) -> None:
+        """Show only the packages whose name or description contain all words in query."""
+        query = query.lower()
+        if query == self.query:
+            return
+        words: Final[list[str]] = query.split()
+        if len(words) == 0:
+            self.matches = range(len(self.packages))
+        else:
+            # Whatever matches the longer filter matched the shorter one.
+            base: Final[Optional[Sequence[int]]] = self.matches if query.startswith(self.query) else None
+            self.matches = self.packages.where(*words, rows=base)
+        self.query = query
+        self.cursor = 0
+        self.top = 0
+
+    def current(self) -> Optional[int]:
+        """Return the index of the package under the cursor, or None if nothing matches."""
+        if len(self.matches) == 0:
+            return None
+        return self.matches[self.cursor]
+
+    def resize(self, height: int) -> None:
+        """Set the number of rows we have for the results."""
+        self.height = max(height, 1)
+        self.move(0)
+
+    def move(self, delta: int) -> None:
+        """Move the cursor by delta rows, scroll if it leaves the window."""
+        self.cursor = min(max(self.cursor + delta, 0), max(len(self.matches) - 1, 0))
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.height:
+            self.top = self.cursor - self.height + 1
+
+    def toggle(self) -> None:
+        """Check or uncheck the package under the cursor."""
+        idx: Final[Optional[int]] = self.current()
+        if idx is None:
+            return
+        if idx in self.selected:
+            self.selected.discard(idx)
+        else:
+            self.selected.add(idx)
+
+    def toggle_all(self) -> None:
+        """Check all packages that match the filter, or uncheck them if they are all checked."""
+        matches: Final[set[int]] = set(self.matches)
+        if matches <= self.selected:
+            self.selected -= matches
+        else:
+            self.selected |= matches
+
+    def visible(self) -> list[int]:
+        """Return the indices of the packages on the screen."""
+        return list(self.matches[self.top:self.top + self.height])
+
+    def render(self, width: int = 80) -> Fragments:
+        """Return the rows on the screen as formatted text."""
+        lines: Fragments = []
+        cur: Final[Optional[int]] = self.current()
+        names: Final[list[str]] = self.packages.names
+        versions: Final[list[Optional[str]]] = self.packages.versions
+        for idx in self.visible():
+            version: Optional[str] = versions[idx]
+            name: str = names[idx] if not version else f"{names[idx]}-{version}"
+            style: str = "reverse " if idx == cur else ""
+            mark: str = "[x] " if idx in self.selected else "[ ] "
+            rest: int = max(width - len(mark) - len(name) - 3, 0)
+            lines.append((style, mark))
+            lines.append((style + "bold", name))
+            lines.append((style, f" - {self.packages.descs[idx][:rest]}\n"))
+        return lines
+
+    def status(self) -> str:
+        """Return a line that tells where we are."""
+        pages: Final[int] = max((len(self.matches) + self.height - 1) // self.height, 1)
+        page: Final[int] = self.cursor // self.height + 1
+        return f"{len(self.matches)} of {len(self.packages)} shown, {len(self.selected)} selected, " + \
+            f"page {page}/{pages} - Tab: check, Ctrl-A: check all, Enter: accept, Esc: cancel"
+
+
+def run(packages: PackageTable, title: str, text: str, selected: Optional[set[int]] = None) -> Optional[set[int]]:
+    """Let the user check packages, return the indices of the checked ones, or None if the user cancelled."""
+    # pylint: disable-msg=C0415
+    from prompt_toolkit.application import Application, get_app
+    from prompt_toolkit.buffer import Buffer
+    from prompt_toolkit.key_binding import KeyBindings
+    from prompt_toolkit.layout import HSplit, Layout, Window
+    from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+
+    view: Final[View] = View(packages, set() if selected is None else set(selected))
+    query: Final[Buffer] = Buffer(multiline=False,
+                                  on_text_changed=lambda buf: view.set_filter(buf.text))
+
+    def results() -> Fragments:
+        size = get_app().output.get_size()
+        view.resize(size.rows - CHROME)
+        return view.render(size.columns)
+
+    keys: Final[KeyBindings] = KeyBindings()
+
+    @keys.add("up")
+    def _up(_event) -> None:
+        view.move(-1)
+
+    @keys.add("down")
+    def _down(_event) -> None:
+        view.move(1)
+
+    @keys.add("pageup")
+    def _page_up(_event) -> None:
+        view.move(-view.height)
+
+    @keys.add("pagedown")
+    def _page_down(_event) -> None:
+        view.move(view.height)
+
+    @keys.add("home")
+    def _home(_event) -> None:
+        view.move(-len(view.matches))
+
+    @keys.add("end")
+    def _end(_event) -> None:
+        view.move(len(view.matches))
+
+    @keys.add("tab")
+    def _toggle(_event) -> None:
+        view.toggle()
+        view.move(1)
+
+    @keys.add("c-a")
+    def _toggle_all(_event) -> None:
+        view.toggle_all()
+
+    @keys.add("enter")
+    def _accept(event) -> None:
+        event.app.exit(result=view.selected)
+
+    @keys.add("escape", eager=True)
+    @keys.add("c-c")
+    def _cancel(event) -> None:
+        event.app.exit(result=None)
+
+    layout: Final[Layout] = Layout(HSplit([
+        Window(FormattedTextControl([("bold", title)]), height=1),
+        Window(FormattedTextControl(text), height=1),
+        Window(BufferControl(query), height=1, get_line_prefix=lambda *_: "Filter: "),
+        Window(height=1, char="-"),
+        Window(FormattedTextControl(results), wrap_lines=False),
+        Window(FormattedTextControl(lambda: [("reverse", view.status())]), height=1),
+    ]), focused_element=query)
+
+    app: Final[Application] = Application(layout=layout, key_bindings=keys, full_screen=True)
+    return app.run()
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
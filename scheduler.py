@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:54:13 krylon>
+#
+# /data/code/python/sloth/scheduler.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.scheduler
+
+(c) 2026 Benjamin Walkenhorst
+
+The RefreshScheduler makes sure the package cache is refreshed only once,
+however many want it refreshed at the same time. Within a process, whoever
+asks for a refresh while one is in progress waits for it to finish and gets
+its result. Across processes, an exclusive lock on a file serializes the
+refreshes, and a process that had to wait for the lock skips its own refresh
+if the other one succeeded in the meantime. The time of the last successful
+refresh is the modification time of a second file, the stamp, next to the
+lock file.
+
+Optionally, a thread refreshes the cache whenever the refresh interval has
+passed, plus a random delay, so a fleet of hosts that were set up at the
+same time does not hit the mirrors all at once.
+"""
+
+import fcntl
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Final, Optional
+
+from sloth import common
+
+# The job performs the actual refresh and returns the exit status of the
+# package manager.
+Job = Callable[[], int]
+
+
+class RefreshScheduler:
+    """RefreshScheduler coalesces refreshes of the package cache and, if started, performs them periodically."""
+
+    __slots__ = [
+        "log",
+        "job",
+        "lockfile",
+        "stampfile",
+        "interval",
+        "jitter",
+        "cond",
+        "running",
+        "result",
+        "generation",
+        "thread",
+        "wakeup",
+        "stopping",
+    ]
+
+    log: logging.Logger
+    job: Job
+    lockfile: str
+    stampfile: str
+    interval: int
+    jitter: int
+    cond: threading.Condition
+    running: bool
+    result: int
+    generation: int
+    thread: Optional[threading.Thread]
+    wakeup: threading.Event
+    stopping: bool
+
+    def __init__(self, job: Job, lockfile: str = "", interval: int = 86400, jitter: int = 0) -> None:
+        self.log = common.get_logger("scheduler")
+        self.job = job
+        self.lockfile = lockfile or common.path.refresh_lock()
+        self.stampfile = os.path.splitext(self.lockfile)[0] + ".stamp"
+        self.interval = interval
+        self.jitter = jitter
+        self.cond = threading.Condition()
+        self.running = False
+        self.result = 0
+        self.generation = 0
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.stopping = False
+
+    def configure(self, interval: int, jitter: int) -> None:
+        """Change the interval and the jitter, the background thread picks them up right away."""
+        self.interval = interval
+        self.jitter = jitter
+        self.wakeup.set()
+
+    def last_refresh(self) -> float:
+        """Return the time of the last successful refresh by any process, or 0 if there was none."""
+        try:
+            return os.stat(self.stampfile).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def mark(self, timestamp: float) -> None:
+        """Record that the package cache was refreshed at the given time, unless we know of a later refresh."""
+        if timestamp > self.last_refresh():
+            with open(self.stampfile, "a", encoding="utf-8"):
+                pass
+            os.utime(self.stampfile, (timestamp, timestamp))
+
+    def due(self) -> float:
+        """Return the time when the next refresh is due."""
+        return self.last_refresh() + self.interval
+
+    def busy(self) -> bool:
+        """Return True if this process is refreshing the package cache right now."""
+        with self.cond:
+            return self.running
+
+    def wait(self) -> int:
+        """Wait for the refresh in progress, if any, and return its result."""
+        with self.cond:
+            self.cond.wait_for(lambda: not self.running)
+            return self.result
+
+    def refresh(self) -> int:
+        """Refresh the package cache, or wait for the refresh already in progress, and return its result."""
+        with self.cond:
+            if self.running:
+                generation: Final[int] = self.generation
+                self.log.debug("A refresh is in progress, waiting for it")
+                self.cond.wait_for(lambda: self.generation != generation)
+                return self.result
+            self.running = True
+        code: int = -1
+        try:
+            code = self.__refresh_locked()
+        finally:
+            with self.cond:
+                self.running = False
+                self.result = code
+                self.generation += 1
+                self.cond.notify_all()
+        return code
+
+    def __refresh_locked(self) -> int:
+        begin: Final[float] = time.time()
+        fd: Final[int] = os.open(self.lockfile, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.log.info("Another process is refreshing the package cache, waiting for it")
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if self.last_refresh() >= begin:
+                    self.log.debug("The other process has refreshed the package cache, skipping our refresh")
+                    return 0
+            code: Final[int] = self.job()
+            if code == 0:
+                self.mark(time.time())
+            return code
+        finally:
+            # Closing the file releases the lock.
+            os.close(fd)
+
+    def is_active(self) -> bool:
+        """Return True if the background thread is running."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> None:
+        """Start refreshing the package cache in the background."""
+        if self.is_active():
+            return
+        if self.interval <= 0:
+            raise ValueError("Background refreshes need a refresh interval greater than 0")
+        self.stopping = False
+        self.wakeup.clear()
+        self.thread = threading.Thread(target=self.__loop, name="refresh", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, waiting for a refresh in progress to finish."""
+        if self.thread is None:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.thread = None
+
+    def __loop(self) -> None:
+        while not self.stopping:
+            delay: float = max(self.due() - time.time(), 0.0) + random.uniform(0, self.jitter)
+            self.log.debug("Next refresh in %.0f seconds", delay)
+            if self.wakeup.wait(delay):
+                # The settings have changed, or we are asked to stop.
+                self.wakeup.clear()
+                continue
+            if time.time() < self.due():
+                # Another process beat us to it.
+                continue
+            try:
+                code: int = self.refresh()
+                if code != 0:
+                    self.log.error("Background refresh failed with status %d", code)
+                    # Do not try again right away.
+                    self.wakeup.wait(max(self.interval // 24, 60))
+            except Exception as err:  # pylint: disable-msg=W0718
+                self.log.error("Background refresh failed: %s", err)
+                self.wakeup.wait(max(self.interval // 24, 60))
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-20 01:13:39 krylon>
+# Time-stamp: <2026-10-17 08:38:26 krylon>
 #
 # /data/code/python/sloth/shell.py
 # created on 01. 04. 2025
@@ -17,51 +17,101 @@ sloth.shell
 """
 
 import atexit
-import html
 import logging
-import readline
 import shlex
+import subprocess
 import sys
+import threading
+import time
 from cmd import Cmd
 from datetime import datetime, timedelta
-from typing import Final
+from typing import Final, Optional
 
-from prompt_toolkit import HTML
-from prompt_toolkit.shortcuts import checkboxlist_dialog, confirm
-
-from sloth import common, database, pkg
+from sloth import (common, config, database, manifest, perf, pkg, probe,
+                   scheduler, snapshot)
 from sloth.common import BLANK, DATE_FMT_NICE
-from sloth.config import Config
-from sloth.pkg import Operation, Package
+from sloth.pkg import Operation, Package, PackageTable
+
+# prompt_toolkit and readline are only needed when we actually interact with
+# the user, which is not the case when we are run from cron, so we import them
+# when they are needed. Same goes for asyncio, which is pulled in by the fleet.
+
+
+def confirm(question: str) -> bool:
+    """Ask the user a yes/no question."""
+    from prompt_toolkit.shortcuts import \
+        confirm as pt_confirm  # pylint: disable-msg=C0415
+    return pt_confirm(question)
 
 
 class Shell(Cmd):
     """Interactive interface to the package manager."""
 
     __slots__ = [
-        "db",
+        "_db",
+        "_oplog",
         "log",
-        "pk",
+        "_pk",
         "timestamp",
         "refresh_interval",
         "auto_yes",
         "remove_deps",
+        "background_refresh",
+        "scheduler",
+        "refresh_seen",
     ]
 
-    db: database.Database
+    _db: Optional[database.Database]
+    _oplog: Optional[database.OpLogger]
     log: logging.Logger
-    pk: pkg.PackageManager
+    _pk: Optional[pkg.PackageManager]
     timestamp: datetime
     refresh_interval: timedelta
     auto_yes: bool
     remove_deps: bool
+    background_refresh: bool
+    scheduler: scheduler.RefreshScheduler
+    refresh_seen: int
 
     def __init__(self) -> None:
         super().__init__()
         self.log = common.get_logger("Shell")
-        self.db = database.Database()
-        self.pk = pkg.PackageManager.create()
-        self.prompt = f"({self.pk.platform.name} {self.pk.platform.version})>>> "
+        # The database and the PackageManager are created when a command
+        # first needs them.
+        self._db = None
+        self._oplog = None
+        self._pk = None
+        self.scheduler = scheduler.RefreshScheduler(self.__refresh_job)
+        self.refresh_seen = 0
+        self.__process_config()
+
+    @property
+    def db(self) -> database.Database:
+        """Return the database, opening it if necessary."""
+        if self._db is None:
+            self._db = database.Database()
+        return self._db
+
+    @property
+    def oplog(self) -> database.OpLogger:
+        """Return the OpLogger, starting it if necessary."""
+        if self._oplog is None:
+            self._oplog = database.OpLogger()
+        return self._oplog
+
+    @property
+    def pk(self) -> pkg.PackageManager:
+        """Return the PackageManager, creating it if necessary."""
+        if self._pk is None:
+            self._pk = pkg.PackageManager.create()
+        return self._pk
+
+    def preloop(self) -> None:
+        """Prepare the interactive session: set the prompt, load the command history."""
+        import readline  # pylint: disable-msg=C0415
+
+        platform = probe.probe().platform
+        self.prompt = f"({platform.name} {platform.version})>>> "
         try:
             readline.read_history_file(common.path.histfile())
             readline.set_history_length(2000)
@@ -69,17 +119,34 @@ class Shell(Cmd):
             pass
         finally:
             atexit.register(readline.write_history_file, common.path.histfile())
-        self.__process_config()
-
-    def __process_config(self):
-        cfg = Config()
-        self.refresh_interval = timedelta(seconds=cfg.cfg["shell"]["refresh-interval"])
-        self.auto_yes = cfg.cfg["shell"]["say-yes"]
-        self.remove_deps = cfg.cfg["shell"]["remove-dependencies"]
+        self.pk.warm_up()
+        if self.background_refresh:
+            self.start_scheduler()
+
+    def __process_config(self) -> None:
+        svc = config.service()
+        self._apply_settings(svc.settings())
+        svc.subscribe(self._apply_settings)
+
+    def _apply_settings(self, settings: config.Settings) -> None:
+        """Pick up the (possibly changed) settings from the configuration file."""
+        self.refresh_interval = timedelta(seconds=settings.refresh_interval)
+        self.auto_yes = settings.say_yes
+        self.remove_deps = settings.remove_dependencies
+        self.background_refresh = settings.background_refresh
+        self.scheduler.configure(settings.refresh_interval, settings.refresh_jitter)
 
     def precmd(self, line) -> str:
-        """Save the time before executing the command."""
+        """Save the time before executing the command, and check if the configuration has changed."""
         self.timestamp = datetime.now()
+        config.service().check()
+        if self._pk is not None:
+            # Whatever was run outside of an operation, e.g. a search.
+            self._pk.take_stats()
+            if self.scheduler.generation != self.refresh_seen:
+                # The package cache was refreshed in the background.
+                self.refresh_seen = self.scheduler.generation
+                self._pk.invalidate()
         return line
 
     def postcmd(self, stop, line) -> bool:
@@ -87,69 +154,327 @@ class Shell(Cmd):
         after = datetime.now()
         delta = after - self.timestamp
         print(f"Command started at {self.timestamp:%Y-%m-%d %H:%M:%S} and took {delta} to execute")
+        self.profile_report()
         return stop
 
+    def profile_report(self) -> None:
+        """If profiling is enabled, show where the time went and start over."""
+        if not perf.enabled():
+            return
+        print(perf.format_report())
+        perf.reset()
+        if (path := perf.dump_cprofile(common.path.base())) is not None:
+            print(f"cProfile data was saved to {path}")
+
+    def _log_op(self, op: Operation, args: str, code: int, **kwargs) -> database.OpRecord:
+        """Record an operation, along with the resources the package manager used for it."""
+        kwargs.setdefault("stats", self.pk.take_stats())
+        return self.oplog.log_op(op, args, code, platform=self.pk.platform.name, **kwargs)
+
+    def _pk_for(self, root: str) -> pkg.PackageManager:
+        """Return the PackageManager for root, the empty string means the system itself."""
+        return self.pk if root == "" else self.pk.for_root(root)
+
+    def take_snapshot(self, rec: database.OpRecord, root: str = "") -> None:
+        """Record which packages are installed after the operation rec.
+
+        Even if the operation failed, it may have changed something. If
+        nothing has changed, no new snapshot is stored.
+        """
+        pk: Final[pkg.PackageManager] = self._pk_for(root)
+        try:
+            entries = snapshot.inventory(pk.installed())
+            pk.take_stats()
+            sid: Final[int] = self.db.snapshot_add(pk.platform.name, entries, root, rec.uid)
+            self.log.debug("Snapshot %d was taken after %s", sid, rec.op.name)
+        except NotImplementedError as err:
+            self.log.debug("Cannot take a snapshot: %s", err)
+        except Exception as err:  # pylint: disable-msg=W0718
+            self.log.error("Failed to take a snapshot after %s: %s", rec.op.name, err)
+
     def refresh_due(self) -> bool:
         """Return true if a refresh of the local package cache is due."""
+        interval: Final[float] = self.refresh_interval.total_seconds()
+        if time.time() - self.scheduler.last_refresh() <= interval:
+            return False
+        if self._oplog is not None:
+            self._oplog.flush()
         op = self.db.op_get_most_recent(Operation.Refresh)
         if op is None:
             return True
+        # The refresh was done before we kept track of them in the stamp file.
+        self.scheduler.mark(op["timestamp"].timestamp())
         delta = datetime.now() - op["timestamp"]
         return delta > self.refresh_interval
 
+    def refresh(self) -> int:
+        """Refresh the local package cache, log it, and refill the catalog.
+
+        If a refresh is in progress already, in the background or in another
+        process, we wait for it instead of starting another one.
+        """
+        code: Final[int] = self.scheduler.refresh()
+        self.refresh_seen = self.scheduler.generation
+        return code
+
+    def ensure_fresh(self, force: bool = False) -> None:
+        """Before installing anything, make sure the package cache is not outdated.
+
+        A refresh in progress is waited for. If the cache is refreshed in the
+        background, we trust it is fresh enough, otherwise we ask the user.
+        """
+        if self.scheduler.busy():
+            print("Waiting for the refresh in progress to finish.")
+            self.scheduler.wait()
+            self.refresh_seen = self.scheduler.generation
+            self.pk.invalidate()
+            return
+        if force or (not self.scheduler.is_active() and
+                     self.refresh_due() and confirm("Refresh package cache?")):
+            self.refresh()
+
+    def __refresh_job(self) -> int:
+        """Perform a refresh for the scheduler, in our thread or in its own."""
+        background: Final[bool] = threading.current_thread() is not threading.main_thread()
+        # The background thread must not use our PackageManager or database.
+        pk: Final[pkg.PackageManager] = self.pk.detach() if background else self.pk
+        code: Final[int] = pk.refresh()
+        self.oplog.log_op(Operation.Refresh, "", code, platform=pk.platform.name, stats=pk.take_stats())
+        if code == 0 and not background:
+            self.catalog_refill(pk, self.db)
+        elif code == 0:
+            # Nor may it use our connection to the database, so it opens
+            # its own, which must not outlive the refresh.
+            db: Final[database.Database] = database.Database()
+            try:
+                self.catalog_refill(pk, db)
+            finally:
+                db.close()
+        # Other processes look for the refresh in the database.
+        self.oplog.flush()
+        return code
+
+    def catalog_refill(self, pk: Optional[pkg.PackageManager] = None, db: Optional[database.Database] = None) -> None:
+        """Fill the local package catalog with all available packages."""
+        pk = pk or self.pk
+        db = db or self.db
+        try:
+            cnt = db.catalog_refill(pk.platform.name, pk.catalog())
+            self.log.debug("Package catalog holds %d packages", cnt)
+            pk.take_stats()
+        except Exception as err:  # pylint: disable-msg=W0718
+            self.log.error("Failed to refill package catalog: %s", err)
+
+    def start_scheduler(self) -> None:
+        """Start refreshing the package cache in the background."""
+        # Create them here, so the background thread does not race us to it.
+        _ = self.pk, self.oplog
+        try:
+            self.scheduler.start()
+        except ValueError as err:
+            print(err)
+
     def do_refresh(self, _arg: str) -> bool:
         """Refresh the package database."""
-        with self.db:
-            code: int = self.pk.refresh()
-            self.db.op_add(Operation.Refresh, "", code)
+        self.refresh()
+        return False
+
+    def do_scheduler(self, arg: str) -> bool:
+        """Refresh the package cache in the background, whenever the refresh interval has passed.
+
+        Usage: scheduler on|off|status|run
+        The background refresh only runs as long as the shell does, unless
+        background-refresh is set in the configuration file, it has to be
+        turned on in every session. run refreshes in the foreground until
+        it is interrupted, e.g. as a service.
+        """
+        match arg.strip():
+            case "on":
+                self.start_scheduler()
+            case "off":
+                self.scheduler.stop()
+            case "status":
+                state: str = "on" if self.scheduler.is_active() else "off"
+                if self.scheduler.busy():
+                    state += ", refreshing"
+                last: Final[float] = self.scheduler.last_refresh()
+                print(f"Background refresh is {state}.")
+                if last > 0:
+                    print(f"The last refresh was at {datetime.fromtimestamp(last).strftime(DATE_FMT_NICE)}, " +
+                          f"the next one is due at {datetime.fromtimestamp(self.scheduler.due()).strftime(DATE_FMT_NICE)}.")
+            case "run":
+                self.start_scheduler()
+                try:
+                    while self.scheduler.is_active():
+                        time.sleep(1)
+                except KeyboardInterrupt:
+                    self.scheduler.stop()
+            case _:
+                print("Usage: scheduler on|off|status|run")
         return False
 
     def do_search(self, arg: str) -> bool:
-        """Search for packages."""
+        """Search for packages.
+
+        By default, we search the local package catalog that is filled after
+        every refresh, if it is available. Pass -l or --live to query the package
+        manager directly.
+        On Fedora / RHEL, --summary or --provides search the package summaries
+        or the capabilities packages provide instead of their names.
+        What the package manager finds is kept until the next refresh, so the
+        same search again does not have to wait for it. Pass -n or --no-cache
+        to ask the package manager anyway.
+        """
         self.log.debug("Search for %s", arg)
-        packages = self.pk.search(*shlex.split(arg))
+        args: list[str] = shlex.split(arg)
+        live: bool = False
+        use_cache: bool = True
+        kwargs: dict[str, str] = {}
+        for flag in ("-l", "--live"):
+            if flag in args:
+                args.remove(flag)
+                live = True
+        for flag in ("-n", "--no-cache"):
+            if flag in args:
+                args.remove(flag)
+                live = True
+                use_cache = False
+        for flag in ("--summary", "--provides"):
+            if flag in args:
+                args.remove(flag)
+                kwargs["by"] = flag[2:]
+                live = True
+        platform: Final[str] = self.pk.platform.name
+        packages: PackageTable
+        if not live and self.db.catalog_count(platform) > 0:
+            packages = self.db.catalog_search(platform, *args)
+        else:
+            packages = self.search_live(args, kwargs.get("by", ""), use_cache)
         if len(packages) > 0:
-            installed: set[Package] = {x for x in packages if x.info}
-            dlg = checkboxlist_dialog(
-                title="Results",
-                text=f"{len(packages)} Search results for '{arg}'",
-                values=[(x, pkg_fancy(x)) for x in packages],
-                default_values=[x for x in packages if x.info],
-            )
-
-            results = dlg.run()
-            to_install = [r for r in results if r not in installed]
-            to_delete = [r for r in installed if r not in results]
+            from sloth import resultview  # pylint: disable-msg=C0415
+            installed: Final[set[int]] = set(packages.installed())
+            results: Final[Optional[set[int]]] = resultview.run(packages,
+                                                                "Results",
+                                                                f"{len(packages)} Search results for '{arg}'",
+                                                                installed)
+            if results is None:
+                return False
+            to_install = [packages[i] for i in sorted(results - installed)]
+            to_delete = [packages[i] for i in sorted(installed - results)]
 
             if len(to_install) + len(to_delete) == 0:
                 return False
 
-            with self.db:
-                if len(to_install) > 0:
-                    names = BLANK.join([x.name for x in to_install])
-                    code = self.pk.install(*to_install)
-                    self.db.op_add(Operation.Install, names, code)
-
-                if len(to_delete) > 0:
-                    names = BLANK.join([x.name for x in to_delete])
-                    code = self.pk.remove(*[x.name for x in to_delete])
-                    self.db.op_add(Operation.Delete, names, code)
+            if len(to_install) > 0:
+                names = BLANK.join([x.name for x in to_install])
+                code = self.pk.install(*[x.name for x in to_install])
+                self.take_snapshot(self._log_op(Operation.Install, names, code))
+                if code == 0:
+                    self.db.catalog_mark(platform, "i", *[x.name for x in to_install])
+
+            if len(to_delete) > 0:
+                names = BLANK.join([x.name for x in to_delete])
+                code = self.pk.remove(*[x.name for x in to_delete])
+                self.take_snapshot(self._log_op(Operation.Delete, names, code))
+                if code == 0:
+                    self.db.catalog_mark(platform, "", *[x.name for x in to_delete])
         else:
             print("No results were found.")
 
         return False
 
+    def search_live(self, args: list[str], by: str = "", use_cache: bool = True) -> PackageTable:
+        """Ask the package manager to search for packages, unless it has answered the same question since the last refresh.
+
+        The installed state of cached results comes from the most recent
+        snapshot, which is taken after every change we make, so installing
+        or removing packages does not make us search again. Without a
+        snapshot, we ask the package manager which packages are installed,
+        if it cannot tell us, we search again.
+        """
+        platform: Final[str] = self.pk.platform.name
+        key: Final[str] = database.search_key(*args, by=by)
+        if self._oplog is not None:
+            self._oplog.flush()
+        last: Final[Optional[dict]] = self.db.op_get_most_recent(Operation.Refresh)
+        refresh: Final[int] = 0 if last is None else last["id"]
+
+        packages: Optional[PackageTable] = None
+        if use_cache:
+            packages = self.db.search_cache_get(platform, key, refresh)
+        if packages is not None:
+            installed: Final[Optional[set[str]]] = self.__installed_names(platform)
+            if installed is not None:
+                self.log.debug("Found %d cached results for %s", len(packages), key)
+                packages.overlay(installed)
+                return packages
+            self.log.debug("Cannot tell which of the cached results for %s are installed", key)
+
+        # The package manager may take a while, so we show the results
+        # as they come in, the user can start reading before the search
+        # is finished.
+        packages = PackageTable()
+        kwargs: Final[dict[str, str]] = {"by": by} if by else {}
+        # Backends that answer from their databases do not run a command,
+        # so last_code only tells us about this search if we reset it.
+        self.pk.last_code = 0
+        for p in self.pk.search_iter(*args, **kwargs):
+            packages.append(p)
+            print(pkg_plain(p))
+        if self.pk.last_code == 0:
+            self.db.search_cache_put(platform, key, refresh, packages)
+        return packages
+
+    def __installed_names(self, platform: str) -> Optional[set[str]]:
+        """Return the names of the installed packages, or None if we cannot tell."""
+        sid: Final[Optional[int]] = self.db.snapshot_latest(platform)
+        if sid is not None:
+            return {e.name for e in self.db.snapshot_entries(sid)}
+        try:
+            return {p.name for p in self.pk.installed()}
+        except NotImplementedError:
+            return None
+
     def do_upgrade(self, arg: str) -> bool:
         """Install pending updates."""
         self.log.debug("Update existing packages.")
         args = shlex.split(arg)
-        with self.db:
-            if ("-r" in args) or \
-               (self.refresh_due() and confirm("Refresh package cache?")):
-                code = self.pk.refresh()
-                self.db.op_add(Operation.Refresh, "", code)
-            code = self.pk.upgrade()
-            self.db.op_add(Operation.Upgrade, arg, code)
+        self.ensure_fresh("-r" in args)
+        code = self.pk.upgrade()
+        self.take_snapshot(self._log_op(Operation.Upgrade, arg, code))
+        return False
+
+    def do_prefetch(self, arg: str) -> bool:
+        """Download pending updates without installing them, so the next upgrade does not have to wait for them.
+
+        Usage: prefetch [-b]
+        The package cache is refreshed first, if it is due. The download runs
+        with the lowest priority we can get. With -b, it runs in a process of
+        its own, that keeps going after this session ends; that process logs
+        the operation when it is done. From cron, run sloth.shell prefetch.
+        """
+        args: Final[list[str]] = shlex.split(arg)
+        if args not in ([], ["-b"]):
+            print("Usage: prefetch [-b]")
+            return False
+        if "-b" in args:
+            # We do not wait for it, the process is on its own.
+            proc = subprocess.Popen(  # pylint: disable-msg=R1732
+                [sys.executable, "-m", "sloth.shell", "prefetch"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True)
+            print(f"Prefetching updates in the background, PID {proc.pid}")
+            return False
+        if self.refresh_due():
+            self.refresh()
+        try:
+            code: Final[int] = self.pk.prefetch()
+        except NotImplementedError as err:
+            print(err)
+            return False
+        self._log_op(Operation.Prefetch, "", code)
         return False
 
     def do_install(self, arg: str) -> bool:
@@ -158,13 +483,12 @@ class Shell(Cmd):
         packages = shlex.split(arg)
         if len(packages) == 0:
             return False
-        with self.db:
-            if self.refresh_due() and confirm("Refresh package cache?"):
-                code = self.pk.refresh()
-                self.db.op_add(Operation.Refresh, "", code)
-            code = self.pk.install(*packages)
-            self.db.op_add(Operation.Install, arg, code)
-            return False
+        self.ensure_fresh()
+        code = self.pk.install(*packages)
+        self.take_snapshot(self._log_op(Operation.Install, arg, code))
+        if code == 0:
+            self.db.catalog_mark(self.pk.platform.name, "i", *packages)
+        return False
 
     def do_remove(self, arg: str) -> bool:
         """Remove package(s)."""
@@ -172,34 +496,351 @@ class Shell(Cmd):
         packages = shlex.split(arg)
         if len(packages) == 0:
             return False
-        with self.db:
-            code = self.pk.remove(packages)
-            self.db.op_add(Operation.Delete, arg, code)
+        code = self.pk.remove(*packages)
+        self.take_snapshot(self._log_op(Operation.Delete, arg, code))
+        if code == 0:
+            self.db.catalog_mark(self.pk.platform.name, "", *packages)
         return False
 
     def do_autoremove(self, _arg: str) -> bool:
         """Remove unneeded packages."""
         self.log.info("Remove unneeded packages.")
-        with self.db:
-            code = self.pk.autoremove()
-            self.db.op_add(Operation.Autoremove, "", code)
+        code = self.pk.autoremove()
+        self.take_snapshot(self._log_op(Operation.Autoremove, "", code))
         return False
 
     def do_clean(self, _arg: str) -> bool:
         """Clean the package cache."""
         self.log.info("Clean local package cache.")
-        with self.db:
-            code = self.pk.cleanup()
-            self.db.op_add(Operation.Cleanup, "", code)
+        code = self.pk.cleanup()
+        self._log_op(Operation.Cleanup, "", code)
         return False
 
     def do_audit(self, _arg: str) -> bool:
         """Audit installed packages for known vulnerabilities. Not supported on all platforms."""
         self.log.info("Perform audit")
-        with self.db:
-            # I should do something with the results, yes?
-            self.pk.audit()
-            self.db.op_add(Operation.Audit, "", 0)
+        # I should do something with the results, yes?
+        self.pk.audit()
+        self._log_op(Operation.Audit, "", 0)
+        return False
+
+    def do_updates(self, _arg: str) -> bool:
+        """List the installed packages for which a newer version is available."""
+        try:
+            packages: Final[PackageTable] = self.pk.updates()
+        except NotImplementedError as err:
+            print(err)
+            return False
+        for p in packages:
+            print(pkg_plain(p))
+        print(f"{len(packages)} updates are available.")
+        return False
+
+    def do_patches(self, _arg: str) -> bool:
+        """List the patches that are not installed, yet."""
+        try:
+            patches: Final[PackageTable] = self.pk.patches()
+        except NotImplementedError as err:
+            print(err)
+            return False
+        for p in patches:
+            print(f"{p.name:<40} {p.kind or '':<12} {p.desc}")
+        print(f"{len(patches)} patches are available.")
+        return False
+
+    def do_roots(self, arg: str) -> bool:
+        """Refresh, upgrade, prefetch, or audit several chroots / jails / container roots in parallel.
+
+        Usage: roots refresh|upgrade|prefetch|audit [-p <parallel>] [root ...]
+        If no roots are given, the targets from the [roots] section of the
+        configuration file are used.
+        """
+        args: list[str] = shlex.split(arg)
+        ops: Final[dict[str, Operation]] = {
+            "refresh": Operation.Refresh,
+            "upgrade": Operation.Upgrade,
+            "prefetch": Operation.Prefetch,
+            "audit": Operation.Audit,
+        }
+        if len(args) == 0 or args[0] not in ops:
+            print("Usage: roots refresh|upgrade|prefetch|audit [-p <parallel>] [root ...]")
+            return False
+        op: Final[Operation] = ops[args.pop(0)]
+        settings: Final[config.Settings] = config.settings()
+        parallel: int = settings.roots_parallel
+        if len(args) > 0 and args[0] == "-p":
+            try:
+                parallel = int(args[1])
+                if parallel < 1:
+                    raise ValueError(args[1])
+            except (IndexError, ValueError):
+                print("Usage: roots refresh|upgrade|prefetch|audit [-p <parallel>] [root ...]")
+                return False
+            args = args[2:]
+        roots: list[str] = args or list(settings.roots)
+        if len(roots) == 0:
+            print("No roots were given, and none are configured.")
+            return False
+
+        stats: dict[str, pkg.RunStats] = {}
+        results = self.pk.run_roots(op, roots, parallel, stats)
+        for root in roots:
+            rec = self._log_op(op, "", results[root], root=root, stats=stats.get(root))
+            if op == Operation.Upgrade:
+                self.take_snapshot(rec, root)
+        for root in roots:
+            status: str = "OK" if results[root] == 0 else f"FAILED ({results[root]})"
+            print(f"{root:<32} {status}")
+        return False
+
+    def do_fleet(self, arg: str) -> bool:
+        """Perform an operation on many hosts at once.
+
+        Usage: fleet refresh|upgrade|prefetch|audit|autoremove|clean [-p <parallel>] [host ...]
+        If no hosts are given, all hosts from the [fleet.hosts] section of the
+        configuration file are used.
+        """
+        args: list[str] = shlex.split(arg)
+        from sloth import fleet  # pylint: disable-msg=C0415
+        if len(args) == 0 or args[0] not in fleet.OPERATIONS:
+            print(f"Usage: fleet {'|'.join(fleet.OPERATIONS)} [-p <parallel>] [host ...]")
+            return False
+        op: Final[Operation] = fleet.OPERATIONS[args.pop(0)]
+        settings: Final[config.Settings] = config.settings()
+        parallel: int = settings.fleet_parallel
+        if len(args) > 0 and args[0] == "-p":
+            try:
+                parallel = int(args[1])
+                if parallel < 1:
+                    raise ValueError(args[1])
+            except (IndexError, ValueError):
+                print(f"Usage: fleet {'|'.join(fleet.OPERATIONS)} [-p <parallel>] [host ...]")
+                return False
+            args = args[2:]
+        known: dict[str, list[str]] = {h: list(c) for h, c in settings.fleet_hosts.items()}
+        names: list[str] = args or list(known)
+        if len(names) == 0:
+            print("No hosts were given, and none are configured.")
+            return False
+        hosts = {h: known.get(h, fleet.agent_command(h)) for h in names}
+        width: Final[int] = max(len(h) for h in hosts)
+
+        def progress(host: str, line: str) -> None:
+            print(f"{host:<{width}} | {line}")
+
+        runner = fleet.Fleet(self.oplog, hosts, parallel, progress, settings.fleet_timeout)
+        results = runner.run(op)
+        for host in names:
+            status: str = "OK" if results[host] == 0 else f"FAILED ({results[host]})"
+            print(f"{host:<{width}} {status}")
+        return False
+
+    def do_export(self, arg: str) -> bool:
+        """Write the installed packages to a manifest, to install them elsewhere with import.
+
+        Usage: export [-a] <file>
+        By default, only the packages that were installed explicitly are
+        exported, the others get pulled in as dependencies anyway. Pass -a to
+        export all of them.
+        """
+        args: list[str] = shlex.split(arg)
+        everything: bool = "-a" in args
+        args = [a for a in args if a != "-a"]
+        if len(args) != 1:
+            print("Usage: export [-a] <file>")
+            return False
+        if not everything and not self.pk.marks_dependencies:
+            print(f"{self.pk.__class__.__name__} cannot tell which packages were installed as dependencies, " +
+                  "all installed packages are exported.")
+            everything = True
+        try:
+            packages = [p for p in self.pk.installed() if everything or p.info != "i+"]
+        except NotImplementedError as err:
+            print(err)
+            return False
+        platform: Final[probe.Platform] = self.pk.platform
+        cnt: Final[int] = manifest.write(args[0],
+                                         f"{platform.name} {platform.version}",
+                                         snapshot.inventory(packages))
+        print(f"{cnt} packages were written to {args[0]}")
+        return False
+
+    def do_import(self, arg: str) -> bool:
+        """Install the packages from a manifest written by export.
+
+        Usage: import [-n] <file>
+        Packages that are already installed are skipped. The rest are
+        installed in batches, if a batch fails, we find out which packages
+        are to blame and install the others. With -n, only show what would be
+        installed.
+        """
+        args: list[str] = shlex.split(arg)
+        dry_run: Final[bool] = "-n" in args
+        args = [a for a in args if a != "-n"]
+        if len(args) != 1:
+            print("Usage: import [-n] <file>")
+            return False
+        try:
+            header, entries = manifest.read(args[0])
+        except (OSError, ValueError) as err:
+            print(err)
+            return False
+        source: Final[str] = header.get("platform", "")
+        if source.split(BLANK)[0] != self.pk.platform.name:
+            print(f"The manifest was exported on {source or 'an unknown platform'}, " +
+                  "some packages may have different names here.")
+        try:
+            present: set[str] = {p.name for p in self.pk.installed()}
+        except NotImplementedError:
+            present = set()
+        wanted: Final[list[str]] = list(dict.fromkeys(e.name for e in entries if e.name not in present))
+        print(f"{len(wanted)} packages to install, {len(entries) - len(wanted)} are installed already.")
+        if dry_run:
+            for name in wanted:
+                print(name)
+            return False
+        if len(wanted) == 0 or \
+           (not self.auto_yes and not confirm(f"Install {len(wanted)} packages?")):
+            return False
+        # Each batch is one call to the package manager, we do not want to
+        # be asked for each of them.
+        yes: Final[bool] = self.pk.yes
+        self.pk.yes = True
+        try:
+            failed: Final[list[str]] = manifest.install_batched(lambda batch: self.pk.install(*batch),
+                                                                wanted,
+                                                                self.pk.arg_space())
+        finally:
+            self.pk.yes = yes
+        rec: Final[database.OpRecord] = self._log_op(Operation.Install, f"import {args[0]}", int(len(failed) > 0))
+        self.take_snapshot(rec)
+        bad: Final[set[str]] = set(failed)
+        self.db.catalog_mark(self.pk.platform.name, "i", *[n for n in wanted if n not in bad])
+        if len(failed) > 0:
+            print(f"{len(failed)} packages could not be installed: {BLANK.join(failed)}")
+        return False
+
+    def do_history(self, arg: str) -> bool:
+        """List the snapshots of the installed packages, or show what changed between two of them.
+
+        Usage: history [<n>] | history diff <a> <b>
+        Without arguments, the 20 most recent snapshots are listed.
+        """
+        args: Final[list[str]] = shlex.split(arg)
+        try:
+            if len(args) == 3 and args[0] == "diff":
+                return self.__history_diff(int(args[1]), int(args[2]))
+            if len(args) > 1:
+                raise ValueError(arg)
+            limit: Final[int] = int(args[0]) if len(args) == 1 else 20
+        except ValueError:
+            print("Usage: history [<n>] | history diff <a> <b>")
+            return False
+        if self._oplog is not None:
+            self._oplog.flush()
+        for s in self.db.snapshot_list(limit):
+            op: str = "-" if s["op"] is None else s["op"].name
+            print(f"{s['id']:>6} {s['timestamp'].strftime(DATE_FMT_NICE)} {s['platform']:<16} "
+                  f"{s['root'] or '/':<20} {s['count']:>6} packages {s['changes']:>5} changes  {op} {s['args']}")
+        return False
+
+    def __history_diff(self, a: int, b: int) -> bool:
+        try:
+            before: Final[list[snapshot.Entry]] = self.db.snapshot_entries(a)
+            after: Final[list[snapshot.Entry]] = self.db.snapshot_entries(b)
+        except KeyError as err:
+            print(err.args[0])
+            return False
+        changes: Final[list[snapshot.Change]] = snapshot.diff(before, after, self.pk.compare_versions)
+        for c in changes:
+            print(change_plain(c))
+        print(f"{len(changes)} packages differ between snapshot {a} and {b}.")
+        return False
+
+    def do_rollback(self, arg: str) -> bool:
+        """Return to the packages installed at the time of a snapshot.
+
+        Usage: rollback <id>
+        Packages that were not installed at the time get removed, the others
+        are installed in the version from the snapshot, if the package manager
+        can still get hold of it.
+        """
+        try:
+            sid: Final[int] = int(arg)
+        except ValueError:
+            print("Usage: rollback <id>")
+            return False
+        info: Final[Optional[dict]] = self.db.snapshot_get(sid)
+        if info is None:
+            print(f"There is no snapshot {sid}")
+            return False
+        if info["platform"] != self.pk.platform.name:
+            print(f"Snapshot {sid} was taken on {info['platform']}, not {self.pk.platform.name}")
+            return False
+        root: Final[str] = info["root"]
+        pk: Final[pkg.PackageManager] = self._pk_for(root)
+        try:
+            current: Final[list[snapshot.Entry]] = snapshot.inventory(pk.installed())
+        except NotImplementedError as err:
+            print(err)
+            return False
+        plan: Final[snapshot.Plan] = snapshot.plan(current, self.db.snapshot_entries(sid), pk.compare_versions)
+        if plan.is_empty():
+            print(f"The installed packages match snapshot {sid}.")
+            return False
+        for c in plan.changes():
+            print(change_plain(c))
+        if not self.auto_yes and not confirm(f"Roll back {len(plan.changes())} packages to snapshot {sid}?"):
+            return False
+        code: Final[int] = pk.rollback(plan)
+        rec: Final[database.OpRecord] = self._log_op(Operation.Rollback, arg.strip(), code,
+                                                     root=root, stats=pk.take_stats())
+        self.take_snapshot(rec, root)
+        return False
+
+    def do_stats(self, arg: str) -> bool:
+        """Show how long operations took and how often they failed.
+
+        Usage: stats [<days>]
+        Only operations from the last <days> days (30 by default) are counted.
+        """
+        try:
+            days: Final[int] = int(arg) if arg.strip() != "" else 30
+        except ValueError:
+            print("Usage: stats [<days>]")
+            return False
+        if self._oplog is not None:
+            self._oplog.flush()
+        rows = self.db.op_stats(datetime.now() - timedelta(days=days))
+        if len(rows) == 0:
+            print(f"No operations were recorded in the last {days} days.")
+            return False
+        print(f"{'Operation':<12} {'Platform':<16} {'Runs':>6} {'p50':>9} {'p95':>9} {'max':>9} {'Failed':>7} {'MaxRSS':>10}")
+        for row in rows:
+            print(f"{row['op'].name:<12} {row['platform'] or '-':<16} {row['count']:>6} "
+                  f"{row['p50']:>8.1f}s {row['p95']:>8.1f}s {row['max']:>8.1f}s "
+                  f"{row['failure_rate']:>6.0%} {(row['maxrss'] or 0) // 1024:>7} MiB")
+        return False
+
+    def do_profile(self, arg: str) -> bool:
+        """Show how long the phases of each command take.
+
+        Usage: profile on|off|cprofile
+        With cprofile, the data gathered by cProfile is saved to the base
+        directory after each command, in a format the pstats module can read.
+        """
+        match arg.strip():
+            case "on":
+                perf.enable()
+            case "cprofile":
+                perf.enable(cprofile=True)
+            case "off":
+                perf.disable()
+            case _:
+                print("Usage: profile on|off|cprofile")
+                return False
+        # Do not report on the profile command itself.
+        perf.reset()
         return False
 
     def do_EOF(self, _) -> bool:
@@ -209,24 +850,46 @@ class Shell(Cmd):
         return True
 
 
-def pkg_fancy(p: Package) -> HTML:
-    """Return a nicely formatted version of the package's name and description"""
+def pkg_plain(p: Package) -> str:
+    """Return a single line of plain text for the package."""
     name: str = p.name
     if p.version:
         name += f"-{p.version}"
-    s = f"<b>{html.escape(name)}</b> - <u>{html.escape(p.desc)}</u>"
-    return HTML(s)
+    mark: str = "*" if p.info else BLANK
+    return f"{mark} {name} - {p.desc}"
+
+
+def change_plain(c: snapshot.Change) -> str:
+    """Return a single line of plain text for the change to a package."""
+    name: str = c.name if c.arch == "" else f"{c.name}.{c.arch}"
+    match c.action:
+        case snapshot.Action.Install:
+            return f"+ {name} {c.new}"
+        case snapshot.Action.Remove:
+            return f"- {name} {c.old}"
+        case _:
+            return f"{'>' if c.action == snapshot.Action.Upgrade else '<'} {name} {c.old} -> {c.new}"
 
 
 if __name__ == '__main__':
     intro: str = f"{common.APP_NAME} {common.APP_VERSION} (c) 2025 Benjamin Walkenhorst"
+    argv: list[str] = sys.argv[1:]
+    # Profiling has to start before the Shell is created, so it can see the
+    # startup.
+    if "--cprofile" in argv:
+        argv.remove("--cprofile")
+        perf.enable(cprofile=True)
+    if "--profile" in argv:
+        argv.remove("--profile")
+        perf.enable()
     sh = Shell()
-    if len(sys.argv) > 1:
+    if len(argv) > 0:
         before: Final[datetime] = datetime.now()
-        command: Final[str] = BLANK.join(sys.argv[1:])
+        command: Final[str] = BLANK.join(argv)
         sh.onecmd(command)
         timestr: Final[str] = before.strftime(DATE_FMT_NICE)
         print(f"Operation began at {timestr}")
+        sh.profile_report()
     else:
         sh.cmdloop(intro)
 
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:48:44 krylon>
+#
+# /data/code/python/sloth/snapshot.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.snapshot
+
+(c) 2026 Benjamin Walkenhorst
+
+A snapshot is the list of installed packages at some point in time. We take
+one after every operation that installs, removes, or upgrades packages, so
+we can tell what changed between any two of them, and how to get back to an
+earlier one.
+
+The database only holds what changed from one snapshot to the next (see
+Database.snapshot_add), the functions here work on complete snapshots.
+"""
+
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Callable, Final, Iterable, NamedTuple, Optional
+
+from sloth.pkg import Package
+
+# A function to compare two versions, returns a negative number if the
+# first one is older, zero if they are equal, a positive number otherwise.
+VersionCmp = Callable[[str, str], int]
+
+Key = tuple[str, str]
+
+
+class Entry(NamedTuple):
+    """Entry is an installed package. In a delta, a version of None means it was removed."""
+
+    name: str
+    arch: str
+    version: Optional[str]
+    repo: str
+
+    def key(self) -> Key:
+        """Return what identifies the package, regardless of its version."""
+        return (self.name, self.arch)
+
+
+def inventory(packages: Iterable[Package]) -> list[Entry]:
+    """Turn the installed packages into a snapshot, sorted by name and architecture.
+
+    A snapshot holds one version per name and architecture, if several
+    versions of a package are installed side by side, like kernels on
+    Fedora, the last one wins.
+    """
+    entries: Final[dict[Key, Entry]] = {}
+    for p in packages:
+        e = Entry(name=p.name, arch=p.arch or "", version=p.version or "", repo=p.kind or "")
+        entries[e.key()] = e
+    return sorted(entries.values())
+
+
+def delta(old: Iterable[Entry], new: Iterable[Entry]) -> list[Entry]:
+    """Return the Entries that turn the snapshot old into new.
+
+    Packages that were removed are listed with a version of None.
+    """
+    before: Final[dict[Key, Entry]] = {e.key(): e for e in old}
+    changes: list[Entry] = []
+    for e in new:
+        if before.pop(e.key(), None) != e:
+            changes.append(e)
+    changes.extend(e._replace(version=None) for e in before.values())
+    changes.sort()
+    return changes
+
+
+def apply(snapshot: dict[Key, Entry], changes: Iterable[Entry]) -> None:
+    """Apply a delta to a snapshot, in place."""
+    for e in changes:
+        if e.version is None:
+            snapshot.pop(e.key(), None)
+        else:
+            snapshot[e.key()] = e
+
+
+class Action(Enum):
+    """What needs to happen to a package to get from one snapshot to another."""
+
+    Install = auto()
+    Remove = auto()
+    Upgrade = auto()
+    Downgrade = auto()
+
+
+class Change(NamedTuple):
+    """Change is the difference between two snapshots for a single package."""
+
+    action: Action
+    name: str
+    arch: str
+    old: Optional[str]  # The version before, None if it was not installed
+    new: Optional[str]  # The version after, None if it is removed
+
+
+def diff(a: Iterable[Entry], b: Iterable[Entry], vercmp: VersionCmp) -> list[Change]:
+    """Return what changed between the snapshots a and b.
+
+    Both snapshots are sorted, and we walk them side by side, like the merge
+    step of merge sort, so this takes linear time.
+    """
+    left: Final[list[Entry]] = sorted(a)
+    right: Final[list[Entry]] = sorted(b)
+    changes: list[Change] = []
+    i: int = 0
+    j: int = 0
+    while i < len(left) or j < len(right):
+        if j >= len(right) or (i < len(left) and left[i].key() < right[j].key()):
+            e = left[i]
+            changes.append(Change(Action.Remove, e.name, e.arch, e.version, None))
+            i += 1
+        elif i >= len(left) or right[j].key() < left[i].key():
+            e = right[j]
+            changes.append(Change(Action.Install, e.name, e.arch, None, e.version))
+            j += 1
+        else:
+            old, new = left[i].version or "", right[j].version or ""
+            if old != new:
+                cmp: int = vercmp(new, old)
+                if cmp != 0:
+                    action: Action = Action.Upgrade if cmp > 0 else Action.Downgrade
+                    changes.append(Change(action, left[i].name, left[i].arch, old, new))
+            i += 1
+            j += 1
+    return changes
+
+
+@dataclass(slots=True)
+class Plan:
+    """Plan holds the changes that take the system back to a snapshot, grouped by what needs doing."""
+
+    install: list[Change] = field(default_factory=list)
+    remove: list[Change] = field(default_factory=list)
+    downgrade: list[Change] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        """Return True if there is nothing to do."""
+        return len(self.install) + len(self.remove) + len(self.downgrade) == 0
+
+    def changes(self) -> list[Change]:
+        """Return all changes, sorted by name."""
+        return sorted(self.install + self.remove + self.downgrade, key=lambda c: (c.name, c.arch))
+
+
+def plan(current: Iterable[Entry], target: Iterable[Entry], vercmp: VersionCmp) -> Plan:
+    """Plan how to get from the current state of the system to the target snapshot.
+
+    Packages that are missing get installed, in the version from the
+    snapshot, as do packages that are older than in the snapshot. Packages
+    that were not installed at the time get removed, packages that are
+    newer get downgraded.
+    """
+    p: Final[Plan] = Plan()
+    for c in diff(current, target, vercmp):
+        match c.action:
+            case Action.Install | Action.Upgrade:
+                p.install.append(c)
+            case Action.Remove:
+                p.remove.append(c)
+            case Action.Downgrade:
+                p.downgrade.append(c)
+    return p
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:24:01 krylon>
+#
+# /data/code/python/sloth/test_aptindex.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_aptindex
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import time
+import unittest
+from datetime import datetime
+from typing import Final
+
+from sloth import aptindex, common
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_aptindex_%Y%m%d_%H%M%S"))
+
+LIST: Final[str] = "var/lib/apt/lists/deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages"
+
+STATUS: Final[str] = """Package: emacs
+Status: install ok installed
+Priority: optional
+Architecture: all
+Version: 1:28.2+1-15
+Description: GNU Emacs editor (metapackage)
+ GNU Emacs is the extensible self-documenting text editor.
+
+Package: emacs-common
+Status: install ok installed
+Architecture: all
+Version: 1:28.2+1-14
+Description: GNU Emacs editor's shared, architecture independent infrastructure
+
+Package: nano
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 7.2-1
+Description: small, friendly text editor inspired by Pico
+
+Package: local-tool
+Status: install ok installed
+Architecture: amd64
+Version: 1.0
+Description: Something built locally
+
+Package: libfoo1
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Version: 1.0-1
+Description: Foo library
+
+Package: libfoo1
+Status: install ok installed
+Architecture: i386
+Multi-Arch: same
+Version: 1.0-2
+Description: Foo library
+"""
+
+EXTENDED_STATES: Final[str] = """Package: emacs-common
+Architecture: all
+Auto-Installed: 1
+
+Package: libfoo1
+Architecture: i386
+Auto-Installed: 1
+"""
+
+
+def stanza(name: str, version: str, desc: str, arch: str = "amd64") -> str:
+    """Return a stanza of a package list."""
+    return (f"Package: {name}\nVersion: {version}\nInstalled-Size: 42\n"
+            f"Architecture: {arch}\nDescription: {desc}\nDescription-md5: 0123456789abcdef\n\n")
+
+
+def write(path: str, content: str) -> None:
+    """Create a file below TEST_DIR."""
+    path = os.path.join(TEST_DIR, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(content)
+
+
+class AptIndexTest(unittest.TestCase):
+    """Test reading apt's package lists and dpkg's status."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_aptindex_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+        packages: list[str] = [
+            stanza("emacs", "1:28.2+1-15", "GNU Emacs editor (metapackage)", "all"),
+            stanza("emacs-common", "1:28.2+1-15+deb12u3", "GNU Emacs editor's shared infrastructure", "all"),
+            stanza("emacs-common", "1:28.2+1-15", "GNU Emacs editor's shared infrastructure", "all"),
+            stanza("nano", "7.2-1", "small, friendly text editor inspired by Pico"),
+            stanza("libfoo1", "1.0-2", "Foo library"),
+            stanza("libfoo1", "1.0-2", "Foo library", "i386"),
+        ]
+        packages.extend(stanza(f"filler{i}", f"1.{i}", "Padding to make the list large") for i in range(5000))
+        write(LIST, "".join(packages))
+        write(aptindex.DPKG_STATUS, STATUS)
+        write(aptindex.EXTENDED_STATES, EXTENDED_STATES)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_versions(self) -> None:
+        """Compare version numbers the way dpkg does."""
+        older: Final[list[tuple[str, str]]] = [
+            ("1.0", "1.1"),
+            ("1.0~rc1", "1.0"),
+            ("1.0", "1.0-1"),
+            ("1.0-1", "1.0-2"),
+            ("1.9", "1.10"),
+            ("1.0a", "1.0+"),
+            ("9.9", "1:0.1"),
+            ("1:28.2+1-15", "1:28.2+1-15+deb12u3"),
+            ("2.30-1~bpo1", "2.30-1"),
+        ]
+        for a, b in older:
+            self.assertLess(aptindex.compare_versions(a, b), 0, (a, b))
+            self.assertGreater(aptindex.compare_versions(b, a), 0, (a, b))
+        self.assertEqual(aptindex.compare_versions("1.01", "1.1"), 0)
+        self.assertEqual(sorted(["1.10", "1.9", "1.9~1"], key=aptindex.version_key), ["1.9~1", "1.9", "1.10"])
+
+    def test_02_split(self) -> None:
+        """Files are cut into pieces at stanza boundaries, and nothing is lost."""
+        path: Final[str] = os.path.join(TEST_DIR, LIST)
+        ranges = aptindex.split_file(path, 4096)
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(path))
+        records = [r for start, end in ranges for r in aptindex.parse_range(path, start, end)]
+        self.assertEqual(records, aptindex.parse_range(path, 0, os.path.getsize(path)))
+        self.assertEqual(len(records), 5006)
+
+    def test_03_load(self) -> None:
+        """Load the index, in parallel and sequentially, with the same result."""
+        index = aptindex.AptIndex(TEST_DIR, parallel=4, chunk=16384).load()
+        serial = aptindex.AptIndex(TEST_DIR, parallel=1).load()
+        self.assertEqual(index.available, serial.available)
+        self.assertTrue(index.is_current())
+        self.assertEqual(index.available[("emacs-common", "all")].version, "1:28.2+1-15+deb12u3")
+        self.assertEqual(set(index.installed), {("emacs", "all"),
+                                                ("emacs-common", "all"),
+                                                ("libfoo1", "amd64"),
+                                                ("libfoo1", "i386"),
+                                                ("local-tool", "amd64")})
+        self.assertEqual(index.info(("emacs", "all")), "i")
+        self.assertEqual(index.info(("emacs-common", "all")), "i+")
+        self.assertEqual(index.info(("nano", "amd64")), "")
+
+        results = list(index.search("emacs"))
+        self.assertEqual([p.name for p in results], ["emacs", "emacs-common"])
+        self.assertEqual(results[0].kind, "bookworm")
+        self.assertEqual([p.name for p in index.search("EDITOR", "pico")], ["nano"])
+        self.assertEqual([p.name for p in index.search("^local")], ["local-tool"])
+        self.assertEqual([(p.name, p.version) for p in index.updates()],
+                         [("emacs-common", "1:28.2+1-15+deb12u3"), ("libfoo1", "1.0-2")])
+        self.assertEqual([p.name for p in index.installed_packages()],
+                         ["emacs", "emacs-common", "libfoo1", "libfoo1", "local-tool"])
+
+        # Terms that are not valid regular expressions are taken literally.
+        self.assertEqual([p.name for p in index.search("(metapackage")], ["emacs"])
+        self.assertEqual(list(index.search("[")), [])
+
+    def test_04_multiarch(self) -> None:
+        """A package installed for several architectures is listed once for each of them."""
+        index = aptindex.AptIndex(TEST_DIR, parallel=1).load()
+        self.assertEqual([(p.arch, p.version, p.info) for p in index.search("^libfoo")],
+                         [("amd64", "1.0-2", "i"), ("i386", "1.0-2", "i+")])
+        self.assertEqual([(p.arch, p.version) for p in index.installed_packages() if p.name == "libfoo1"],
+                         [("amd64", "1.0-1"), ("i386", "1.0-2")])
+        self.assertEqual([p.arch for p in index.updates() if p.name == "libfoo1"], ["amd64"])
+
+        # After an upgrade, the index is outdated.
+        time.sleep(0.01)
+        write(aptindex.DPKG_STATUS, STATUS.replace("1:28.2+1-14", "1:28.2+1-15+deb12u3").replace("1.0-1", "1.0-2"))
+        self.assertFalse(index.is_current())
+        index.load()
+        self.assertEqual(list(index.updates()), [])
+        write(aptindex.DPKG_STATUS, STATUS)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
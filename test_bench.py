@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:43:52 krylon>
+#
+# /data/code/python/sloth/test_bench.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_bench
+
+(c) 2026 Benjamin Walkenhorst
+
+The parser benchmarks run on 1000 packages per backend here, and are held
+to the baseline that comes with sloth. To hold them to one recorded with
+"python3 -m sloth.bench --save" instead, point SLOTH_BENCH_BASELINE at it.
+"""
+
+import os
+import unittest
+from datetime import datetime
+from typing import Final
+
+from sloth import bench, common
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_bench_%Y%m%d_%H%M%S"))
+
+BASELINE: Final[str] = os.environ.get("SLOTH_BENCH_BASELINE", bench.BASELINE)
+THRESHOLD: Final[float] = float(os.environ.get("SLOTH_BENCH_THRESHOLD", "0.25"))
+
+
+class BenchTest(unittest.TestCase):
+    """Test the parser benchmarks, and keep an eye on the parsers' performance."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_bench_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_generate(self) -> None:
+        """The synthetic outputs are reproducible, and every package in them is found."""
+        for backend, (_, parser) in bench.BACKENDS.items():
+            lines = bench.generate(backend, 200)
+            self.assertEqual(lines, bench.generate(backend, 200))
+            packages = list(parser(lines))
+            self.assertEqual(len(packages), 200, backend)
+            self.assertEqual(len({p.name for p in packages}), 200, backend)
+
+    def test_02_compare(self) -> None:
+        """Regressions beyond the threshold are reported, smaller changes are not."""
+        r = bench.Result(backend="apt", size=1000, seconds=0.01, rate=100000.0, throughput=10.0, peak=1000)
+        path: Final[str] = os.path.join(TEST_DIR, "bench.json")
+        bench.save_baseline(path, [r])
+        baseline = bench.load_baseline(path)
+        self.assertEqual(bench.compare([r], baseline, 0.25), [])
+        self.assertEqual(bench.compare([r._replace(rate=80000.0, peak=1200)], baseline, 0.25), [])
+        self.assertEqual(len(bench.compare([r._replace(rate=70000.0)], baseline, 0.25)), 1)
+        self.assertEqual(len(bench.compare([r._replace(rate=70000.0, peak=1300)], baseline, 0.25)), 2)
+        self.assertEqual(bench.compare([r._replace(backend="pkg")], baseline, 0.25),
+                         ["pkg/1000: there is no baseline to compare to"])
+
+        # Without a baseline, the benchmark fails instead of passing silently.
+        self.assertNotEqual(bench.main(["--backends", "apt", "--sizes", "100",
+                                        "--baseline", os.path.join(TEST_DIR, "nothing.json")]), 0)
+
+    def test_03_parsers(self) -> None:
+        """The parsers are not slower, nor hungrier, than the baseline."""
+        results = [bench.measure(b, 1000) for b in bench.BACKENDS]
+        for r in results:
+            self.assertGreater(r.rate, 0)
+            self.assertGreater(r.peak, 0)
+        baseline = bench.load_baseline(BASELINE)
+        self.assertNotEqual(baseline, {}, f"There is no baseline in {BASELINE}")
+        regressions = bench.compare(results, baseline, THRESHOLD)
+        self.assertEqual(regressions, [])
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:16:41 krylon>
+#
+# /data/code/python/sloth/test_config.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_config
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import unittest
+from datetime import datetime
+from typing import Optional
+
+from sloth import common, config
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_config_%Y%m%d_%H%M%S"))
+
+
+def rewrite(path: str, old: str, new: str) -> None:
+    """Replace old with new in the file at path."""
+    with open(path, "r", encoding="utf-8") as fh:
+        content = fh.read()
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(content.replace(old, new))
+
+
+class ConfigTest(unittest.TestCase):
+    """Test the configuration service."""
+
+    svc: Optional[config.ConfigService] = None
+    seen: list[config.Settings] = []
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_config_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    @classmethod
+    def notify(cls, settings: config.Settings) -> None:
+        """Record the settings we were notified about."""
+        cls.seen.append(settings)
+
+    def test_01_defaults(self) -> None:
+        """A fresh configuration file holds the default settings."""
+        svc = config.service()
+        ConfigTest.svc = svc
+        self.assertIs(config.service(), svc)
+        self.assertTrue(os.path.isfile(common.path.config()))
+        self.assertEqual(svc.settings(), config.Settings())
+        self.assertFalse(svc.check())
+
+    def test_02_reload(self) -> None:
+        """Changes to the file are picked up and announced."""
+        svc = ConfigTest.svc
+        assert svc is not None
+        svc.subscribe(ConfigTest.notify)
+        rewrite(svc.path, "refresh-interval = 86400", "refresh-interval = 3600")
+        self.assertTrue(svc.check())
+        self.assertEqual(svc.settings().refresh_interval, 3600)
+        self.assertEqual(len(ConfigTest.seen), 1)
+        self.assertEqual(ConfigTest.seen[0].refresh_interval, 3600)
+
+    def test_03_invalid(self) -> None:
+        """Invalid settings are rejected, and the previous ones stay in effect."""
+        svc = ConfigTest.svc
+        assert svc is not None
+        rewrite(svc.path, "nice = true", 'nice = "very"')
+        self.assertFalse(svc.check())
+        self.assertTrue(svc.settings().nice)
+        self.assertEqual(len(ConfigTest.seen), 1)
+        with self.assertRaises(ValueError):
+            config.Settings.from_dict({"roots": {"parallel": 0}})
+        with self.assertRaises(ValueError):
+            config.Settings.from_dict({"shell": {"refresh-interval": True}})
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Time-stamp: <2025-04-01 19:43:08 krylon>
+# Time-stamp: <2026-10-17 08:38:26 krylon>
 #
 # /data/code/python/sloth/test_database.py
 # created on 20. 12. 2023
@@ -17,13 +17,16 @@ sloth.test_database
 """
 
 
+import io
 import os
 import unittest
-from datetime import datetime
-from typing import Optional
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
 
-from sloth import common, database
-from sloth.pkg import Operation
+from sloth import common, database, pkg, shell
+from sloth.pkg import Operation, Package, PackageTable, RunStats
+from sloth.snapshot import Entry
 
 TEST_DIR: str = os.path.join(
     datetime.now().strftime("sloth_test_database_%Y%m%d_%H%M%S"))
@@ -81,6 +84,271 @@ class DatabaseTest(unittest.TestCase):
             self.assertIsInstance(ops, list)
             self.assertEqual(len(ops), len(Operation))
 
+    def test_04_catalog_refill(self) -> None:
+        """Fill the package catalog."""
+        db = DatabaseTest.db()
+        packages: list[Package] = [
+            Package(name="emacs", desc="The extensible, self-documenting editor", version="29.4"),
+            Package(name="emacs-nox", desc="Emacs without X11 support", version="29.4"),
+            Package(name="vim", desc="Vi IMproved, a programmer's text editor", info="i"),
+            Package(name="python3-requests", desc="HTTP library for Python"),
+        ]
+        cnt = db.catalog_refill("debian", packages)
+        self.assertEqual(cnt, len(packages))
+        self.assertEqual(db.catalog_count("debian"), len(packages))
+        self.assertEqual(db.catalog_count("arch"), 0)
+        # Refilling replaces the previous contents.
+        cnt = db.catalog_refill("debian", packages)
+        self.assertEqual(cnt, len(packages))
+
+    def test_05_catalog_search(self) -> None:
+        """Search the package catalog."""
+        db = DatabaseTest.db()
+        results = db.catalog_search("debian", "emacs")
+        self.assertEqual(len(results), 2)
+        # Matches in the name rank higher than matches in the description.
+        self.assertEqual(results[0].name, "emacs")
+        results = db.catalog_search("debian", "edit")
+        self.assertEqual({p.name for p in results}, {"emacs", "vim"})
+        results = db.catalog_search("debian", "python3-req")
+        self.assertEqual([p.name for p in results], ["python3-requests"])
+        results = db.catalog_search("debian", 'text "editor')
+        self.assertEqual([p.name for p in results], ["vim"])
+        self.assertEqual(results[0].info, "i")
+        self.assertEqual(db.catalog_search("arch", "emacs"), [])
+
+    def test_06_catalog_mark(self) -> None:
+        """Update the installed state of packages in the catalog."""
+        db = DatabaseTest.db()
+        db.catalog_mark("debian", "i", "emacs")
+        db.catalog_mark("debian", "", "vim")
+        results = db.catalog_search("debian", "editor")
+        installed = {p.name: p.info for p in results}
+        self.assertEqual(installed["emacs"], "i")
+        self.assertEqual(installed["vim"], "")
+
+    def test_07_op_root(self) -> None:
+        """Log operations performed on a chroot or jail."""
+        db = DatabaseTest.db()
+        with db:
+            op_id = db.op_add(Operation.Refresh, "", 1, "/srv/chroot/bookworm")
+            self.assertNotEqual(op_id, 0)
+            op = db.op_get_most_recent(Operation.Refresh, "/srv/chroot/bookworm")
+            self.assertIsNotNone(op)
+            assert op is not None
+            self.assertEqual(op["id"], op_id)
+            self.assertEqual(op["status"], 1)
+            op = db.op_get_most_recent(Operation.Refresh)
+            self.assertIsNotNone(op)
+            assert op is not None
+            self.assertNotEqual(op["id"], op_id)
+            self.assertEqual(op["root"], "")
+
+    def test_08_oplog(self) -> None:
+        """Operations queued to the OpLogger end up in the database."""
+        db = DatabaseTest.db()
+        before: int = len(db.op_get_recent())
+        oplog = database.OpLogger(linger=0.01)
+        for i in range(10):
+            oplog.log_op(Operation.Install, f"pkg{i}", 0)
+        oplog.flush()
+        self.assertEqual(len(db.op_get_recent()), before + 10)
+        self.assertFalse(os.path.exists(oplog.spool))
+        oplog.close()
+        self.assertFalse(oplog.writer.is_alive())
+
+    def test_09_oplog_replay(self) -> None:
+        """Operations left in the spool by a crashed process are replayed exactly once."""
+        db = DatabaseTest.db()
+        before: int = len(db.op_get_recent())
+        rec = database.OpRecord(op=Operation.Delete, args="crashed", status=0)
+        db.op_add_records([rec])
+        spool_dir: str = common.path.spool()
+        os.makedirs(spool_dir, exist_ok=True)
+        # No process will ever have this pid.
+        spool: str = os.path.join(spool_dir, "99999999.spool")
+        with open(spool, "w", encoding="utf-8") as fh:
+            fh.write(rec.dump() + "\n")
+            fh.write(database.OpRecord(op=Operation.Delete, args="lost", status=1).dump() + "\n")
+            fh.write('{"op": 2, "ar')
+        oplog = database.OpLogger()
+        oplog.close()
+        self.assertFalse(os.path.exists(spool))
+        ops = db.op_get_recent()
+        self.assertEqual(len(ops), before + 2)
+        self.assertEqual({o["args"] for o in ops[:2]}, {"crashed", "lost"})
+
+    def test_10_op_stats(self) -> None:
+        """Summarize the resources used by operations."""
+        db = DatabaseTest.db()
+        records: list[database.OpRecord] = [
+            database.OpRecord(op=Operation.Upgrade,
+                              args="",
+                              status=int(i % 4 == 0),
+                              platform="debian",
+                              stats=RunStats(wall=float(i), maxrss=i * 1024))
+            for i in range(1, 21)
+        ]
+        # Too old to be counted
+        records.append(database.OpRecord(op=Operation.Upgrade,
+                                         args="",
+                                         status=0,
+                                         platform="debian",
+                                         stats=RunStats(wall=1000.0),
+                                         timestamp=0))
+        # Not measured
+        records.append(database.OpRecord(op=Operation.Upgrade, args="", status=1, platform="debian"))
+        records.append(database.OpRecord(op=Operation.Refresh, args="", status=0, platform="arch",
+                                         stats=RunStats(wall=3.0)))
+        db.op_add_records(records)
+        stats = db.op_stats(datetime.now() - timedelta(days=1))
+        self.assertEqual(len(stats), 2)
+        refresh, upgrade = stats[0], stats[1]
+        self.assertEqual((refresh["op"], refresh["platform"], refresh["count"]),
+                         (Operation.Refresh, "arch", 1))
+        self.assertEqual(refresh["p95"], 3.0)
+        self.assertEqual(upgrade["count"], 20)
+        self.assertEqual(upgrade["p50"], 10.0)
+        self.assertEqual(upgrade["p95"], 19.0)
+        self.assertEqual(upgrade["max"], 20.0)
+        self.assertAlmostEqual(upgrade["failure_rate"], 0.25)
+        self.assertEqual(upgrade["maxrss"], 20 * 1024)
+
+    def test_11_snapshot(self) -> None:
+        """Store snapshots as deltas and piece them back together."""
+        db = DatabaseTest.db()
+        states: list[list[Entry]] = []
+        ids: list[int] = []
+        for i in range(database.SNAPSHOT_KEYFRAME_INTERVAL + 5):
+            # One package gets upgraded, one comes and goes.
+            entries: list[Entry] = [Entry(f"pkg{n:03d}", "x86_64", f"1.{i if n == 1 else 0}", "core")
+                                    for n in range(10)]
+            if i % 2 == 0:
+                entries.append(Entry("zzz", "noarch", "0.1", "extra"))
+            states.append(entries)
+            ids.append(db.snapshot_add("arch", entries))
+        self.assertEqual(len(set(ids)), len(ids))
+        # Nothing changed, so there is no new snapshot.
+        self.assertEqual(db.snapshot_add("arch", states[-1]), ids[-1])
+        # Other roots have snapshots of their own.
+        other = db.snapshot_add("arch", states[0][:3], root="/srv/jail")
+        self.assertEqual(db.snapshot_entries(other), states[0][:3])
+
+        for sid, entries in zip(ids, states):
+            self.assertEqual(db.snapshot_entries(sid), sorted(entries))
+        first = db.snapshot_get(ids[0])
+        second = db.snapshot_get(ids[1])
+        assert first is not None and second is not None
+        self.assertEqual((first["keyframe"], first["changes"]), (ids[0], 11))
+        self.assertEqual((second["keyframe"], second["count"], second["changes"]), (ids[0], 10, 2))
+        keyframes = {db.snapshot_get(sid)["keyframe"] for sid in ids}  # type: ignore
+        self.assertEqual(len(keyframes), 2)
+        self.assertEqual(len(db.snapshot_list(5)), 5)
+        self.assertIsNone(db.snapshot_get(-1))
+        with self.assertRaises(KeyError):
+            db.snapshot_entries(-1)
+        self.assertEqual(db.snapshot_latest("arch"), ids[-1])
+        self.assertIsNone(db.snapshot_latest("arch", "/nonexistent"))
+
+    def test_12_search_cache(self) -> None:
+        """Cache search results until the next refresh, evict the least recently used."""
+        db = DatabaseTest.db()
+        self.assertEqual(database.search_key("Emacs  nox", "lisp"), database.search_key("lisp", "emacs", "NOX"))
+        results: list[Package] = [Package(name=f"emacs-{i}", desc=f"Emacs {i}", version="29.4", info="i" if i == 0 else "")
+                                  for i in range(10)]
+        key: str = database.search_key("emacs")
+        self.assertIsNone(db.search_cache_get("debian", key, 1))
+        self.assertTrue(db.search_cache_put("debian", key, 1, results, limit=25))
+        self.assertEqual(db.search_cache_get("debian", key, 1), results)
+        # A refresh makes the results useless.
+        self.assertIsNone(db.search_cache_get("debian", key, 2))
+        # Storing the same search again replaces the old results.
+        self.assertTrue(db.search_cache_put("debian", key, 1, results[:5], limit=25))
+        self.assertEqual(db.search_cache_get("debian", key, 1), results[:5])
+
+        vim: str = database.search_key("vim")
+        self.assertTrue(db.search_cache_put("debian", vim, 1, results, limit=25))
+        # Using the emacs results makes the vim results the least recently used.
+        db.search_cache_get("debian", key, 1)
+        self.assertTrue(db.search_cache_put("debian", "nano", 1, results + results[:2], limit=25))
+        self.assertIsNone(db.search_cache_get("debian", vim, 1))
+        self.assertIsNotNone(db.search_cache_get("debian", key, 1))
+        self.assertFalse(db.search_cache_put("debian", "huge", 1, results * 3, limit=25))
+
+        # Results from before the last refresh are dropped.
+        self.assertTrue(db.search_cache_put("debian", vim, 2, results, limit=25))
+        self.assertIsNone(db.search_cache_get("debian", key, 1))
+        cur = db.db.cursor()
+        cur.execute("SELECT COUNT(*) FROM search_cache_entry")
+        self.assertEqual(cur.fetchone()[0], 10)
+
+    def test_13_oplog_failure(self) -> None:
+        """If the database cannot be opened, flush does not hang, and the operations are written later."""
+        path: str = os.path.join(TEST_DIR, "13.db")
+        spool_dir: str = os.path.join(TEST_DIR, "13.spool")
+        # A directory is not a database.
+        os.mkdir(path)
+        oplog = database.OpLogger(path=path, spool_dir=spool_dir, linger=0.01)
+        for i in range(3):
+            oplog.log_op(Operation.Install, f"pkg{i}", 0)
+        self.assertTrue(oplog.flush(timeout=10))
+        self.assertTrue(oplog.writer.is_alive())
+        with open(oplog.spool, "r", encoding="utf-8") as fh:
+            self.assertEqual(len(fh.readlines()), 3)
+
+        os.rmdir(path)
+        oplog.log_op(Operation.Install, "pkg3", 0)
+        self.assertTrue(oplog.flush(timeout=10))
+        self.assertFalse(os.path.exists(oplog.spool))
+        oplog.close()
+        self.assertEqual(len(database.Database(path).op_get_recent()), 4)
+        # Without a writer, there is nothing to wait for.
+        self.assertTrue(oplog.flush())
+        oplog.queue.put(database.OpRecord(op=Operation.Install, args="late", status=0))
+        self.assertFalse(oplog.flush())
+
+    def test_14_search_live(self) -> None:
+        """Search results are cached whatever ran before, and look the same when they come from the cache."""
+        class Index(pkg.OpenBSD):
+            """Answers searches from memory, like the backends that read the databases themselves."""
+
+            searches: int = 0
+            present: set[str] = {"sloth-a"}
+
+            def search_iter(self, *args, **kwargs) -> Iterator[Package]:
+                Index.searches += 1
+                for name in ("sloth-a", "sloth-b"):
+                    yield Package(name=name, desc="Test package", info="i" if name in self.present else "")
+
+            def installed(self) -> PackageTable:
+                return PackageTable(Package(name=n, desc="Test package", info="i") for n in self.present)
+
+        class Blind(Index):
+            """Cannot tell which packages are installed."""
+
+            def installed(self) -> PackageTable:
+                raise NotImplementedError("Blind cannot list installed packages")
+
+        def search(sh: shell.Shell) -> list[tuple[str, Optional[str]]]:
+            with redirect_stdout(io.StringIO()):
+                return [(p.name, p.info) for p in sh.search_live(["sloth-test-14"])]
+
+        sh = shell.Shell()
+        sh._pk = Index()  # pylint: disable-msg=W0212
+        # Whatever failed before has nothing to do with this search.
+        sh.pk.last_code = 1
+        self.assertEqual(search(sh), [("sloth-a", "i"), ("sloth-b", "")])
+        self.assertEqual(search(sh), [("sloth-a", "i"), ("sloth-b", "")])
+        self.assertEqual(Index.searches, 1)
+        # Without a snapshot, the installed state comes from the package manager.
+        Index.present = {"sloth-b"}
+        self.assertEqual(search(sh), [("sloth-a", ""), ("sloth-b", "i")])
+        self.assertEqual(Index.searches, 1)
+        # If it cannot tell, we search again.
+        sh._pk = Blind()  # pylint: disable-msg=W0212
+        self.assertEqual(search(sh), [("sloth-a", ""), ("sloth-b", "i")])
+        self.assertEqual(Index.searches, 2)
+
 # Local Variables: #
 # python-indent: 4 #
 # End: #
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:38:56 krylon>
+#
+# /data/code/python/sloth/test_engine.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_engine
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Final
+
+from sloth import engine
+
+
+def python(code: str) -> list[str]:
+    """Return a command that runs a piece of Python code."""
+    return [sys.executable, "-c", code]
+
+
+def alive(pid: int) -> bool:
+    """Return True if a process with the given pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class EngineTest(unittest.TestCase):
+    """Test running commands."""
+
+    def test_01_capture(self) -> None:
+        """Capture both pipes, even if the command fills both of them."""
+        size: Final[int] = 1 << 20
+        res = engine.run(python(
+            "import sys\n"
+            f"for _ in range({size // 1024}):\n"
+            "    sys.stderr.write('e' * 1023 + '\\n')\n"
+            "    sys.stdout.write('o' * 1023 + '\\n')\n"
+            "sys.exit(3)\n"), capture=True, timeout=30)
+        self.assertEqual(res.code, 3)
+        self.assertFalse(res.timed_out)
+        self.assertEqual(res.out_bytes, size)
+        self.assertEqual(res.err_bytes, size)
+        assert res.stdout is not None
+        self.assertEqual(len(res.stdout), size)
+
+        lines: list[str] = []
+        res = engine.run(python("import sys; print('out'); print('err', file=sys.stderr)"),
+                         sink=lines.append)
+        self.assertEqual(res.code, 0)
+        self.assertEqual(sorted(lines), ["err", "out"])
+
+    def test_02_timeout(self) -> None:
+        """A command that runs out of time is terminated, along with its children."""
+        with tempfile.NamedTemporaryFile("r", encoding="utf-8") as pidfile:
+            begin: Final[float] = time.monotonic()
+            res = engine.run(python(
+                "import subprocess, sys, time\n"
+                "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+                f"open({pidfile.name!r}, 'w').write(str(child.pid))\n"
+                "time.sleep(60)\n"), capture=True, timeout=1)
+            self.assertTrue(res.timed_out)
+            self.assertNotEqual(res.code, 0)
+            self.assertLess(time.monotonic() - begin, 10)
+            child: Final[int] = int(pidfile.read())
+        # The grandchild is an orphan now, give init a moment to reap it.
+        for _ in range(50):
+            if not alive(child):
+                break
+            time.sleep(0.1)
+        self.assertFalse(alive(child))
+
+    def test_03_threads(self) -> None:
+        """Commands run side by side from several threads."""
+        begin: Final[float] = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda i: engine.run(python(f"import time; time.sleep(0.5); print({i})"), capture=True),
+                                    range(4)))
+        self.assertLess(time.monotonic() - begin, 1.8)
+        self.assertEqual([r.stdout for r in results], [f"{i}\n" for i in range(4)])
+
+    def test_04_lines(self) -> None:
+        """Read the output while the command is running, stop it if we are not interested anymore."""
+        results: list[engine.Result] = []
+        it = engine.lines(python("import time\nfor i in range(1000):\n    print(i, flush=True)\n    time.sleep(0.01)\n"),
+                          results)
+        self.assertEqual(next(it), "0\n")
+        self.assertEqual(next(it), "1\n")
+        it.close()
+        self.assertEqual(len(results), 1)
+        self.assertNotEqual(results[0].code, 0)
+
+        results.clear()
+        out = list(engine.lines(python("import sys; print('a'); print('b', file=sys.stderr); sys.exit(1)"), results))
+        self.assertEqual(out, ["a\n"])
+        self.assertEqual(results[0].code, 1)
+        self.assertEqual(results[0].stderr, "b\n")
+
+    def test_05_lines_exit(self) -> None:
+        """A command that closes its output before it exits is waited for, not terminated."""
+        for _ in range(50):
+            results: list[engine.Result] = []
+            self.assertEqual(list(engine.lines(["printf", "a\nb\n"], results)), ["a\n", "b\n"])
+            self.assertEqual(results[0].code, 0)
+        results = []
+        self.assertEqual(list(engine.lines(["sh", "-c", "echo x; exec >&-; sleep .3; exit 3"], results)), ["x\n"])
+        self.assertEqual(results[0].code, 3)
+        self.assertFalse(results[0].timed_out)
+        # It still has to exit within the timeout.
+        results = []
+        self.assertEqual(list(engine.lines(["sh", "-c", "echo x; exec >&-; sleep 30"], results, timeout=0.5)), ["x\n"])
+        self.assertTrue(results[0].timed_out)
+        self.assertLess(results[0].code, 0)
+
+    def test_06_decoder(self) -> None:
+        """Lines are split and translated across chunks."""
+        dec = engine.Decoder()
+        self.assertEqual(dec.feed(b"one\r"), [])
+        self.assertEqual(dec.feed(b"\ntw\xc3"), ["one\n"])
+        self.assertEqual(dec.feed(b"\xb6\nthree"), ["tw\u00f6\n"])
+        self.assertEqual(dec.feed(b"", True), ["three"])
+        self.assertEqual(dec.size, 15)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
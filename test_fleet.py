@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:37:23 krylon>
+#
+# /data/code/python/sloth/test_fleet.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_fleet
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import io
+import os
+import sys
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Final
+
+from sloth import common, database, fleet, shell
+from sloth.pkg import Operation
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_fleet_%Y%m%d_%H%M%S"))
+
+# STANDIN plays the part of the agent, without touching any package manager.
+# It answers each request with two lines of output and the exit status
+# given on its command line.
+STANDIN: Final[str] = """
+import json, struct, sys
+inp, out = sys.stdin.buffer, sys.stdout.buffer
+def send(msg):
+    body = json.dumps(msg).encode()
+    out.write(struct.pack("!I", len(body)) + body)
+    out.flush()
+send({"t": "hello", "p": ["standin", "1.0", "noarch"]})
+while (hdr := inp.read(4)):
+    req = json.loads(inp.read(struct.unpack("!I", hdr)[0]))
+    send({"t": "out", "l": "Performing " + req["op"]})
+    print("a warning on stderr", file=sys.stderr, flush=True)
+    send({"t": "out", "l": "Done"})
+    send({"t": "exit", "s": int(sys.argv[1]), "r": {"wall": 1.5, "maxrss": 2048}})
+"""
+
+
+# CHATTY sends a frame of a type we do not know, then keeps talking until
+# it is stopped, HUNG never answers at all.
+CHATTY: Final[str] = """
+import json, struct, sys
+out = sys.stdout.buffer
+def send(msg):
+    body = json.dumps(msg).encode()
+    out.write(struct.pack("!I", len(body)) + body)
+    out.flush()
+send({"t": "gossip"})
+while True:
+    send({"t": "out", "l": "x" * 1024})
+"""
+HUNG: Final[str] = "import time; time.sleep(60)"
+
+
+def standin(status: int) -> list[str]:
+    """Return the command to start a stand-in agent."""
+    return [sys.executable, "-c", STANDIN, str(status)]
+
+
+class FleetTest(unittest.TestCase):
+    """Test the fleet runner and its protocol."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_fleet_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_frames(self) -> None:
+        """Write and read back a couple of frames."""
+        msgs: Final[list[dict]] = [
+            {"t": "req", "op": "Upgrade", "a": ""},
+            {"t": "out", "l": "Ümläute und ßo weiter"},
+            {"t": "exit", "s": 100},
+        ]
+        buf = io.BytesIO()
+        for m in msgs:
+            fleet.write_frame(buf, m)
+        buf.seek(0)
+        for m in msgs:
+            self.assertEqual(fleet.read_frame(buf), m)
+        self.assertIsNone(fleet.read_frame(buf))
+
+    def test_02_truncated(self) -> None:
+        """A truncated frame is an error, not EOF."""
+        data: Final[bytes] = fleet.encode_frame({"t": "out", "l": "abc"})
+        with self.assertRaises(fleet.ProtocolError):
+            fleet.read_frame(io.BytesIO(data[:-1]))
+        with self.assertRaises(fleet.ProtocolError):
+            fleet.read_frame(io.BytesIO(b"\xff\xff\xff\xff"))
+
+    def test_03_run(self) -> None:
+        """Drive a few stand-in agents."""
+        db = database.Database(common.path.db())
+        oplog = database.OpLogger()
+        lines: list[tuple[str, str]] = []
+        hosts: Final[dict[str, list[str]]] = {
+            "alpha": standin(0),
+            "beta": standin(0),
+            "gamma": standin(100),
+            "nowhere": ["/nonexistent/agent"],
+        }
+        runner = fleet.Fleet(oplog, hosts, 2, lambda h, line: lines.append((h, line)))
+        results = runner.run(Operation.Upgrade)
+        self.assertEqual(results, {"alpha": 0, "beta": 0, "gamma": 100, "nowhere": -1})
+        self.assertEqual(runner.platforms["alpha"], ("standin", "1.0", "noarch"))
+        self.assertIn(("beta", "Performing Upgrade"), lines)
+        self.assertIn(("gamma", "a warning on stderr"), lines)
+        self.assertEqual(runner.stats["beta"].wall, 1.5)
+        self.assertNotIn("nowhere", runner.stats)
+
+        oplog.close()
+        ops = db.op_get_recent()
+        self.assertEqual(len(ops), len(hosts))
+        status = {o["host"]: o["status"] for o in ops}
+        self.assertEqual(status, results)
+
+    def test_04_usage(self) -> None:
+        """A bad number of parallel hosts gets the usage, not an exception."""
+        sh = shell.Shell()
+        for arg in ("upgrade -p x", "upgrade -p 0", "upgrade -p"):
+            out = io.StringIO()
+            with redirect_stdout(out):
+                self.assertFalse(sh.do_fleet(arg))
+            self.assertTrue(out.getvalue().startswith("Usage: fleet "), arg)
+
+    def test_05_misbehaving(self) -> None:
+        """Agents that do not stick to the protocol or never answer do not hold up the others."""
+        oplog = database.OpLogger()
+        hosts: Final[dict[str, list[str]]] = {
+            "alpha": standin(0),
+            "chatty": [sys.executable, "-c", CHATTY],
+            "hung": [sys.executable, "-c", HUNG],
+        }
+        runner = fleet.Fleet(oplog, hosts, 3, timeout=2)
+        start: Final[float] = time.monotonic()
+        try:
+            self.assertEqual(runner.run(Operation.Refresh), {"alpha": 0, "chatty": -1, "hung": -1})
+        finally:
+            oplog.close()
+        self.assertLess(time.monotonic() - start, 10)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
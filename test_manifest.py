@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:27:18 krylon>
+#
+# /data/code/python/sloth/test_manifest.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_manifest
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import ClassVar, Final
+
+from sloth import common, manifest, pkg, shell
+from sloth.pkg import Package, PackageTable
+from sloth.snapshot import Entry
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_manifest_%Y%m%d_%H%M%S"))
+
+
+class ManifestTest(unittest.TestCase):
+    """Test exporting and importing package sets."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_manifest_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_roundtrip(self) -> None:
+        """Write a manifest and read it back."""
+        path: Final[str] = os.path.join(TEST_DIR, "packages.manifest")
+        entries: Final[list[Entry]] = [
+            Entry("emacs", "amd64", "1:29.4+1-4", "bookworm"),
+            Entry("fonts-dejavu", "all", "2.37-6", "bookworm"),
+        ]
+        self.assertEqual(manifest.write(path, "debian 12", entries), 2)
+        header, result = manifest.read(path)
+        self.assertEqual(header["platform"], "debian 12")
+        self.assertEqual(result, [e._replace(repo="") for e in entries])
+
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write("\n# Added by hand\nvim\n")
+        _, result = manifest.read(path)
+        self.assertEqual(result[-1], Entry("vim", "", "", ""))
+
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("emacs\n")
+        with self.assertRaises(ValueError):
+            manifest.read(path)
+
+    def test_02_batches(self) -> None:
+        """Batches fit into the space we have."""
+        names: Final[list[str]] = [f"package-{i:04d}" for i in range(1000)]
+        cost: Final[int] = manifest.arg_cost(names[0])
+        result = list(manifest.batches(names, cost * 100, limit=300))
+        self.assertEqual([len(b) for b in result], [100] * 10)
+        self.assertEqual(sum(result, []), names)
+        self.assertEqual([len(b) for b in manifest.batches(names, cost * 1000, limit=300)], [300, 300, 300, 100])
+        with self.assertRaises(ValueError):
+            list(manifest.batches(["x" * 100], 50))
+        self.assertGreater(manifest.arg_space(["sudo", "apt-get"]), 0)
+
+    def test_03_bisect(self) -> None:
+        """A failing batch is split until the bad names are found."""
+        names: Final[list[str]] = [f"package-{i:04d}" for i in range(256)]
+        bad: Final[set[str]] = {"package-0013", "package-0200"}
+        calls: list[list[str]] = []
+        installed: set[str] = set()
+
+        def install(batch: list[str]) -> int:
+            calls.append(batch)
+            if bad & set(batch):
+                return 100
+            installed.update(batch)
+            return 0
+
+        failed = manifest.install_batched(install, names, 1 << 20, limit=128)
+        self.assertEqual(failed, sorted(bad))
+        self.assertEqual(installed, set(names) - bad)
+        # Each bad name costs two calls per level of bisection, 128 = 2^7
+        self.assertEqual(len(calls), 2 * (1 + 2 * 7))
+
+    def test_04_export(self) -> None:
+        """Packages installed as dependencies are left out, unless the backend cannot tell them apart."""
+        class Installed(pkg.OpenBSD):
+            """Lists an explicitly installed package and one of its dependencies."""
+
+            marks_dependencies: ClassVar[bool] = False
+
+            def installed(self) -> PackageTable:
+                return PackageTable([Package(name="emacs", desc="", version="29.4", info="i"),
+                                     Package(name="libgccjit", desc="", version="14.1", info="i+")])
+
+        class Marked(Installed):
+            """Knows which packages were installed as dependencies."""
+
+            marks_dependencies: ClassVar[bool] = True
+
+        path: Final[str] = os.path.join(TEST_DIR, "export.manifest")
+        sh = shell.Shell()
+        for backend, names in ((Marked, ["emacs"]), (Installed, ["emacs", "libgccjit"])):
+            sh._pk = backend()  # pylint: disable-msg=W0212
+            out = io.StringIO()
+            with redirect_stdout(out):
+                sh.do_export(path)
+            self.assertEqual([e.name for e in manifest.read(path)[1]], names)
+            self.assertEqual("cannot tell" in out.getvalue(), backend is Installed)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
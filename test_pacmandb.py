@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:24:41 krylon>
+#
+# /data/code/python/sloth/test_pacmandb.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_pacmandb
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import io
+import os
+import tarfile
+import time
+import unittest
+from datetime import datetime
+from typing import Final
+
+from sloth import common, pacmandb
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_pacmandb_%Y%m%d_%H%M%S"))
+
+CONF: Final[str] = """[options]
+HoldPkg = pacman glibc
+
+[core]
+Include = /etc/pacman.d/mirrorlist
+
+[extra]
+Include = /etc/pacman.d/mirrorlist
+"""
+
+
+def desc(name: str, version: str, text: str, reason: str = "") -> str:
+    """Return the contents of a desc file."""
+    content: str = f"%FILENAME%\n{name}-{version}-x86_64.pkg.tar.zst\n\n%NAME%\n{name}\n\n" + \
+        f"%VERSION%\n{version}\n\n%DESC%\n{text}\n\n%ARCH%\nx86_64\n\n%DEPENDS%\nglibc\nlibgccjit\n\n"
+    if reason != "":
+        content += f"%REASON%\n{reason}\n\n"
+    return content
+
+
+def write_sync(repo: str, packages: list[tuple[str, str, str]]) -> None:
+    """Create a sync database below TEST_DIR."""
+    path: Final[str] = os.path.join(TEST_DIR, pacmandb.DB_PATH, "sync", f"{repo}.db")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tarfile.open(path, "w:gz") as tar:
+        for name, version, text in packages:
+            data = desc(name, version, text).encode("utf-8")
+            info = tarfile.TarInfo(f"{name}-{version}/desc")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def write_local(name: str, version: str, text: str, reason: str = "") -> None:
+    """Create an entry in the local database below TEST_DIR."""
+    folder: Final[str] = os.path.join(TEST_DIR, pacmandb.DB_PATH, "local", f"{name}-{version}")
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "desc"), "w", encoding="utf-8") as fh:
+        fh.write(desc(name, version, text, reason))
+
+
+class PacmanDBTest(unittest.TestCase):
+    """Test reading pacman's databases."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_pacmandb_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+        os.makedirs(os.path.join(TEST_DIR, "etc"), exist_ok=True)
+        with open(os.path.join(TEST_DIR, pacmandb.CONF_PATH), "w", encoding="utf-8") as fh:
+            fh.write(CONF)
+        write_sync("core", [
+            ("gcc", "14.1.1+r58+gfc9fb69ad62-1", "The GNU Compiler Collection"),
+            ("pacman", "6.1.0-3", "A library-based package manager with dependency support"),
+        ])
+        write_sync("extra", [
+            ("emacs", "29.4-3", "The extensible, customizable, self-documenting real-time display editor"),
+            ("emacs-nox", "29.4-3", "The extensible, customizable editor (without X11 support)"),
+            ("pacman", "6.2.0-1", "Newer, but core comes first"),
+            ("notmuch", "0.38.3-3", "Notmuch is not much of an email program"),
+        ])
+        write_local("emacs", "29.4-2", "The extensible, customizable, self-documenting real-time display editor")
+        write_local("gcc", "14.1.1+r58+gfc9fb69ad62-1", "The GNU Compiler Collection", pacmandb.REASON_DEPEND)
+        write_local("pacman", "6.1.0-3", "A library-based package manager with dependency support")
+        write_local("yay", "12.3.5-1", "Yet another yogurt, from the AUR")
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_vercmp(self) -> None:
+        """Compare version numbers the way pacman does."""
+        older: Final[list[tuple[str, str]]] = [
+            ("1.0", "1.1"),
+            ("1.0a", "1.0"),
+            ("1.0alpha", "1.0.1"),
+            ("1.0", "1.0.1"),
+            ("1.9", "1.10"),
+            ("1.0-1", "1.0-2"),
+            ("29.4-2", "29.4-3"),
+            ("9.9-1", "1:0.1-1"),
+            ("1.0.0", "1.0..0"),
+            ("1.0a", "1.0b"),
+            ("1.0rc1", "1.0"),
+        ]
+        for a, b in older:
+            self.assertEqual(pacmandb.vercmp(a, b), -1, (a, b))
+            self.assertEqual(pacmandb.vercmp(b, a), 1, (a, b))
+        self.assertEqual(pacmandb.vercmp("1.01", "1.1"), 0)
+        self.assertEqual(pacmandb.vercmp("1.0", "1.0-5"), 0)
+        self.assertEqual(pacmandb.vercmp("0:1.0-1", "1.0-1"), 0)
+        self.assertEqual(sorted(["1.10", "1.9", "1.9rc1"], key=pacmandb.version_key), ["1.9rc1", "1.9", "1.10"])
+
+    def test_02_load(self) -> None:
+        """Search, list installed packages and updates, without running pacman."""
+        db = pacmandb.PacmanDB(TEST_DIR, parallel=1).load()
+        self.assertTrue(db.is_current())
+        self.assertEqual(db.repos, ["core", "extra"])
+        self.assertEqual(db.unreadable, set())
+
+        results = [(p.kind, p.name, p.info) for p in db.search("EMACS")]
+        self.assertEqual(results, [("extra", "emacs", "i"), ("extra", "emacs-nox", "")])
+        self.assertEqual([(p.kind, p.version) for p in db.search("^pacman$")], [("core", "6.1.0-3"), ("extra", "6.2.0-1")])
+        self.assertEqual([p.name for p in db.search("email", "program")], ["notmuch"])
+        # Terms that are not valid regular expressions are taken literally.
+        self.assertEqual([p.name for p in db.search("(without")], ["emacs-nox"])
+        self.assertEqual([p.name for p in db.search("emacs", "[")], [])
+        self.assertEqual([(p.name, p.version, p.kind) for p in db.updates()], [("emacs", "29.4-3", "extra")])
+        self.assertEqual([(p.name, p.kind, p.info) for p in db.installed_packages()], [
+            ("emacs", "extra", "i"),
+            ("gcc", "core", "i+"),
+            ("pacman", "core", "i"),
+            ("yay", "local", "i"),
+        ])
+
+        # Reading the databases in parallel gives the same result.
+        self.assertEqual(pacmandb.PacmanDB(TEST_DIR, parallel=2).load().sync, db.sync)
+
+    def test_03_cache(self) -> None:
+        """Only the databases that have changed are read again."""
+        db = pacmandb.PacmanDB(TEST_DIR, parallel=1).load()
+        core = db.sync["core"]
+        extra = db.sync["extra"]
+        time.sleep(0.01)
+        write_sync("extra", [("emacs", "29.4-4", "The extensible editor")])
+        self.assertFalse(db.is_current())
+        db.load()
+        self.assertIs(db.sync["core"], core)
+        self.assertIsNot(db.sync["extra"], extra)
+        self.assertEqual([p.version for p in db.updates()], ["29.4-4"])
+
+        # A database we cannot read is remembered as such.
+        with open(os.path.join(TEST_DIR, pacmandb.DB_PATH, "sync", "multilib.db"), "wb") as fh:
+            fh.write(b"\x28\xb5\x2f\xfd not really zstd")
+        db.load()
+        self.assertEqual(db.unreadable, {"multilib"})
+        self.assertEqual(db.repos, ["core", "extra", "multilib"])
+        self.assertTrue(db.is_current())
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:22:28 krylon>
+#
+# /data/code/python/sloth/test_perf.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_perf
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import pstats
+import time
+import unittest
+from datetime import datetime
+
+from sloth import common, perf
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_perf_%Y%m%d_%H%M%S"))
+
+
+@perf.timed("outer")
+def outer() -> int:
+    """Spend some time, half of it in a nested span."""
+    time.sleep(0.02)
+    with perf.span("inner"):
+        time.sleep(0.02)
+    return 42
+
+
+def slow_items(n: int):
+    """Yield n items, taking a while for each."""
+    for i in range(n):
+        time.sleep(0.005)
+        yield i
+
+
+class PerfTest(unittest.TestCase):
+    """Test the profiler."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_perf_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        perf.disable()
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_disabled(self) -> None:
+        """Nothing is recorded while profiling is disabled."""
+        perf.disable()
+        self.assertEqual(outer(), 42)
+        items = [1, 2]
+        self.assertIs(perf.timed_iter("items", items), items)
+        self.assertEqual(perf.report(), [])
+
+    def test_02_nested(self) -> None:
+        """The own time of a span excludes the spans nested inside it."""
+        perf.enable()
+        self.assertEqual(outer(), 42)
+        self.assertEqual(list(perf.timed_iter("items", slow_items(4))), [0, 1, 2, 3])
+        phases = {p.name: p for p in perf.report()}
+        self.assertEqual(set(phases), {"outer", "inner", "items"})
+        self.assertEqual(phases["outer"].calls, 1)
+        self.assertGreaterEqual(phases["outer"].total, 0.04)
+        self.assertLess(phases["outer"].own, phases["outer"].total - 0.015)
+        self.assertGreaterEqual(phases["items"].total, 0.02)
+        self.assertIn("outer", perf.format_report())
+        perf.reset()
+        self.assertEqual(perf.report(), [])
+
+    def test_03_cprofile(self) -> None:
+        """cProfile data is saved to a file pstats can read."""
+        perf.enable(cprofile=True)
+        outer()
+        path = perf.dump_cprofile(TEST_DIR)
+        self.assertIsNotNone(path)
+        assert path is not None
+        stats = pstats.Stats(path)
+        self.assertGreater(stats.total_calls, 0)  # type: ignore
+        perf.disable()
+        self.assertIsNone(perf.dump_cprofile(TEST_DIR))
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:41:53 krylon>
+#
+# /data/code/python/sloth/test_pkg.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_pkg
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+import unittest
+from datetime import datetime
+from typing import Final, Iterator, Optional
+
+from sloth import common, pkg
+from sloth.pkg import Package
+
+HERE: Final[str] = os.path.dirname(os.path.abspath(__file__))
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_pkg_%Y%m%d_%H%M%S"))
+
+
+def fixture(name: str) -> list[str]:
+    """Return the lines of a sample output."""
+    with open(os.path.join(HERE, name), "r", encoding="utf-8") as fh:
+        return fh.readlines()
+
+
+def summary(packages: list[Package]) -> list[tuple]:
+    """Return the interesting fields of each Package."""
+    return [(p.name, p.version, p.info) for p in packages]
+
+
+class ParserTest(unittest.TestCase):
+    """Test the parsers for the output of the package managers."""
+
+    def test_01_apt(self) -> None:
+        """Parse the output of apt search, in the C locale and in German."""
+        packages = list(pkg.AptParser().parse(fixture("apt_search_emacs.txt")))
+        self.assertEqual(summary(packages), [
+            ("elpa-magit", "3.3.0-3", ""),
+            ("emacs", "1:28.2+1-15", "i"),
+            ("emacs-common", "1:28.2+1-15", "i+"),
+            ("emacs-gtk", "1:28.2+1-15", "i+"),
+            ("emacs-nox", "1:28.2+1-15", ""),
+            ("emacs-el", "1:28.2+1-15", "i"),
+            ("vim", "2:9.0.1378-2", "i"),
+        ])
+        self.assertEqual(packages[1].desc, "GNU Emacs editor (metapackage)")
+        self.assertEqual(packages[1].kind, "stable,now")
+
+        packages = list(pkg.parse_apt(fixture("apt_search_emacs_de.txt")))
+        self.assertEqual([p.info for p in packages], ["i", "i+", ""])
+
+    def test_02_pacman(self) -> None:
+        """Parse the output of pacman -Ss."""
+        packages = list(pkg.PacmanParser().parse(fixture("pacman_Ss_emacs.txt")))
+        self.assertEqual(summary(packages), [
+            ("emacs", "29.4-3", "i"),
+            ("emacs-nativecomp", "29.4-3", ""),
+            ("emacs-nox", "29.4-3", "i"),
+            ("emacs-wayland", "29.4-3", ""),
+            ("notmuch", "0.38.3-3", ""),
+            ("gcc", "14.1.1+r58+gfc9fb69ad62-1", "i"),
+        ])
+        self.assertEqual(packages[4].kind, "extra")
+        self.assertEqual(packages[4].desc, "Notmuch is not much of an email program")
+
+    def test_03_pkg(self) -> None:
+        """Parse the output of pkg search on FreeBSD."""
+        packages = list(pkg.PkgParser().parse(fixture("pkg_search_emacs.txt")))
+        self.assertEqual([(p.name, p.version) for p in packages], [
+            ("emacs", "29.4_2,3"),
+            ("emacs-devel", "30.0.50.20240630,3"),
+            ("emacs-nox", "29.4_2,3"),
+            ("font-misc-75dpi", "1.0.3_6"),
+            ("notmuch-emacs", "0.38.3"),
+            ("py311-emacs-hy", "1.0"),
+        ])
+        self.assertEqual(packages[3].desc, "X.Org miscellaneous 75dpi fonts")
+
+    def test_04_openbsd(self) -> None:
+        """Parse the output of pkg_info -Q on OpenBSD."""
+        packages = list(pkg.OpenBSDParser().parse(fixture("pkg_info_emacs.txt")))
+        self.assertEqual(len(packages), 13)
+        self.assertEqual(summary(packages[:7]), [
+            ("debug-emacs", "29.4p0-gtk2", ""),
+            ("debug-emacs", "29.4p0-gtk3", ""),
+            ("debug-emacs", "29.4p0-no_x11", ""),
+            ("emacs", "29.4p0-gtk2", ""),
+            ("emacs", "29.4p0-gtk3", ""),
+            ("emacs", "29.4p0-no_x11", "i"),
+            ("emacs-anthy", "9100hp9", ""),
+        ])
+        self.assertEqual(packages[-1].name, "xemacs-sumo")
+
+    def test_05_reuse(self) -> None:
+        """A Parser starts from scratch on each run."""
+        parser = pkg.AptParser()
+        lines = fixture("apt_search_emacs.txt")
+        # Leave a package half done, as if the consumer had stopped early.
+        self.assertIsNone(parser.feed(lines[2].rstrip("\n")))
+        self.assertEqual(list(parser.parse(lines)), list(pkg.parse_apt(lines)))
+
+    def test_06_linear(self) -> None:
+        """Garbage does not make the parsers slow."""
+        garbage: Final[list[str]] = [
+            "a/" + "x " * 100000 + "\n",
+            " " * 100000 + "\n",
+            "-" * 100000 + "+\n",
+            "|" * 100000 + "\n",
+            "a-" * 100000 + "\n",
+        ] * 5
+        for parser in (pkg.AptParser, pkg.PacmanParser, pkg.PkgParser, pkg.OpenBSDParser):
+            start = time.perf_counter()
+            list(parser().parse(garbage))
+            self.assertLess(time.perf_counter() - start, 1.0, parser.__name__)
+
+    def test_07_c_locale(self) -> None:
+        """Messages are switched to the C locale, the character set is not."""
+        saved: Final[dict[str, str]] = dict(os.environ)
+        try:
+            os.environ["LC_ALL"] = "de_DE.UTF-8"
+            os.environ["LANGUAGE"] = "de"
+            env = pkg.c_locale()
+            self.assertNotIn("LC_ALL", env)
+            self.assertNotIn("LANGUAGE", env)
+            self.assertEqual(env["LC_MESSAGES"], "C")
+            self.assertEqual(env["LC_CTYPE"], "de_DE.UTF-8")
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+
+    def test_08_zypper_xml(self) -> None:
+        """Read zypper's XML output for search, list-updates, and list-patches."""
+        packages = list(pkg.parse_zypper_xml(fixture("zypper_search_emacs.xml")))
+        self.assertEqual([(p.name, p.info, p.kind) for p in packages], [
+            ("emacs", "i", "package"),
+            ("emacs-info", "i", "package"),
+            ("emacs-nox", "", "package"),
+            ("emacs-x11", "v", "package"),
+            ("emacs", "", "srcpackage"),
+            ("emacs-apel", "", "package"),
+            ("patterns-devel-emacs", "", "pattern"),
+        ])
+        self.assertEqual(packages[5].desc, "A Portable Emacs Library | APEL")
+        self.assertEqual(packages[6].desc, "Emacs development & tools")
+
+        updates = list(pkg.parse_zypper_updates(fixture("zypper_list_updates.xml")))
+        self.assertEqual(summary(updates), [
+            ("emacs", "29.4-2.1", "i"),
+            ("libgit2-1_7", "1.7.2-150600.3.3.1", "i"),
+        ])
+        self.assertEqual((updates[1].desc, updates[1].kind), ("C git library", "repo-sle-update"))
+
+        patches = list(pkg.parse_zypper_patches(fixture("zypper_list_patches.xml")))
+        self.assertEqual([(p.name, p.kind, p.info) for p in patches], [
+            ("openSUSE-SLE-15.6-2024-2345", "security", "needed"),
+            ("openSUSE-SLE-15.6-2024-2371", "recommended", "needed"),
+        ])
+        self.assertEqual(patches[0].desc, "Security update for emacs")
+
+    def test_09_zypper_xml_memory(self) -> None:
+        """Reading zypper's XML takes the same memory, however many packages there are."""
+        def output(count: int) -> Iterator[str]:
+            yield "<?xml version='1.0'?>\n<stream>\n<search-result version=\"0.0\">\n<solvable-list>\n"
+            for i in range(count):
+                yield f'<solvable status="not-installed" name="package{i}" summary="Package number {i}" kind="package"/>\n'
+            yield "</solvable-list>\n</search-result>\n</stream>\n"
+
+        peaks: list[int] = []
+        for count in (1000, 20000):
+            tracemalloc.start()
+            try:
+                self.assertEqual(sum(1 for _ in pkg.parse_zypper_xml(output(count))), count)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        self.assertLess(peaks[1], peaks[0] * 2)
+
+
+class ShellCommand(pkg.OpenBSD):
+    """A PackageManager that runs its arguments with the shell, so we can run anything through it."""
+
+    def pkg_cmd(self, op: Optional[pkg.Operation] = None) -> list[str]:
+        return ["sh", "-c"]
+
+
+class RunTest(unittest.TestCase):
+    """Test running the package manager."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_pkg_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_exit_code(self) -> None:
+        """A command that closes its output before it exits reports its own exit code."""
+        pm = ShellCommand()
+        for _ in range(20):
+            self.assertEqual(list(pm._stream(["printf 'a\\nb\\n'"])), ["a\n", "b\n"])
+            self.assertEqual(pm.last_code, 0)
+        self.assertEqual(list(pm._stream(["echo x; echo y >&2; exec >&-; sleep .3; exit 3"])), ["x\n"])
+        self.assertEqual(pm.last_code, 3)
+        self.assertEqual(pm.output[1], "y\n")
+
+    def test_02_dnf_refresh(self) -> None:
+        """dnf check-update exits with 100 if updates are pending, the refresh still succeeded."""
+        class CheckUpdate(pkg.DNF):
+            """Exits with the status given in the environment, like dnf check-update would."""
+
+            def pkg_cmd(self, op: Optional[pkg.Operation] = None) -> list[str]:
+                return ["sh", "-c", 'exit "$STATUS"', "dnf"]
+
+        pm = CheckUpdate()
+        for status, code in (("0", 0), ("100", 0), ("1", 1)):
+            os.environ["STATUS"] = status
+            try:
+                self.assertEqual(pm.refresh(), code)
+            finally:
+                del os.environ["STATUS"]
+
+    def test_04_dnf_warm_up(self) -> None:
+        """Throwing the sack away again and again keeps one thread busy loading it, not one for each time."""
+        class Base:
+            """Stands in for dnf.Base."""
+
+            def __init__(self) -> None:
+                time.sleep(0.05)
+
+            def close(self) -> None:
+                """Nothing to close."""
+
+        class Sack(pkg.DNF):
+            """Loads a sack that takes a moment, without dnf."""
+
+            def _base(self):
+                return Base()
+
+        pm = Sack()
+        pm.warm_up()
+        for _ in range(20):
+            pm.invalidate()
+            self.assertLessEqual(sum(t.name == "dnf-warm-up" for t in threading.enumerate()), 1)
+        for _ in range(50):
+            if pm.warmer is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(pm.warmer)
+        self.assertIsNotNone(pm.sack_base)
+
+    def test_05_dnf_versions(self) -> None:
+        """Packages from the sack carry the release in their version, like dnf prints it."""
+        class Installed:
+            """Stands in for a package in the sack."""
+
+            name = "emacs"
+            summary = "GNU Emacs text editor"
+            version = "29.4"
+            release = "5.fc41"
+            installed = True
+            reponame = "@System"
+            arch = "x86_64"
+
+        class History:
+            """Stands in for dnf's history."""
+
+            def user_installed(self, _p) -> bool:
+                return False
+
+        class Query:
+            """Stands in for a query against the sack."""
+
+            def run(self) -> list:
+                return [Installed()]
+
+        packages = list(pkg.DNF()._convert(Query(), History()))  # pylint: disable-msg=W0212
+        self.assertEqual([(p.name, p.version, p.info) for p in packages], [("emacs", "29.4-5.fc41", "i+")])
+
+    def test_03_zypper_dependencies(self) -> None:
+        """The packages zypper installed as dependencies are marked with i+."""
+        class Search(pkg.Zypper):
+            """Prints the output of zypper search instead of running zypper."""
+
+            def pkg_cmd(self, op: Optional[pkg.Operation] = None) -> list[str]:
+                return ["sh", "-c", 'cat "$0"', os.path.join(HERE, "zypper_search_emacs.xml")]
+
+        root: Final[str] = os.path.join(TEST_DIR, "zypper")
+        pm = Search(root)
+        self.assertTrue(pm.marks_dependencies)
+        self.assertEqual(pkg.zypper_autoinstalled(root), set())
+        os.makedirs(os.path.join(root, os.path.dirname(pkg.ZYPPER_AUTOINSTALLED)))
+        with open(os.path.join(root, pkg.ZYPPER_AUTOINSTALLED), "w", encoding="utf-8") as fh:
+            fh.write("# Automatically generated by libzypp.\n# 1 package(s) installed as dependency.\nemacs-info\n")
+        self.assertEqual(pkg.zypper_autoinstalled(root), {"emacs-info"})
+        marks: Final[dict[str, Optional[str]]] = {p.name: p.info for p in pm.installed() if p.info}
+        self.assertEqual(marks, {"emacs": "i", "emacs-info": "i+", "emacs-x11": "v"})
+
+
+def packages(count: int) -> Iterator[Package]:
+    """Yield Packages the way a parser does, every field a string of its own."""
+    for i in range(count):
+        yield Package(name=f"package-{i % (count // 2)}",
+                      desc=f"Package number {i}",
+                      version=f"{i % 7}.0-1",
+                      kind="".join(["ext", "ra"] if i % 3 else ["co", "re"]),
+                      info="i" if i % 5 == 0 else "",
+                      arch="".join(["x86", "_64"]))
+
+
+class PackageTableTest(unittest.TestCase):
+    """Test the columnar PackageTable."""
+
+    def test_01_rows(self) -> None:
+        """Rows come back the way they went in, and hash the same."""
+        rows: Final[list[Package]] = list(packages(100))
+        table = pkg.PackageTable(rows)
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table, rows)
+        self.assertEqual(table[42], rows[42])
+        self.assertEqual(list(table[10:20]), rows[10:20])
+        self.assertEqual(list(table.hashes), [hash(p) for p in rows])
+        self.assertEqual(table.find(rows[73]), 73)
+        self.assertIn(rows[99], table)
+        self.assertNotIn(Package(name="package-1", desc="Package number 2"), table)
+        # Rows added after a lookup are found as well, duplicates at their first position.
+        late: Final[Package] = Package(name="late", desc="Added after a lookup")
+        table.append(late)
+        table.append(rows[73])
+        self.assertEqual(table.find(late), 100)
+        self.assertEqual(table.find(rows[73]), 73)
+        table = pkg.PackageTable(rows)
+        # Same names are the same object, repeated fields are stored once.
+        self.assertIs(table.names[1], table.names[51])
+        self.assertEqual(table.archs.values, [None, "x86_64"])
+        self.assertEqual(len(table.kinds.values), 3)
+
+        table.overlay({"package-0", "package-1"})
+        self.assertEqual(table.installed(), [0, 1, 50, 51])
+        self.assertEqual(table[0].info, "i")
+        self.assertEqual(table[5].info, "")
+
+    def test_02_where(self) -> None:
+        """Filter and sort on the columns."""
+        table = pkg.PackageTable(packages(1000))
+        self.assertEqual(table.where("NUMBER 99"), [99, 990, 991, 992, 993, 994, 995, 996, 997, 998, 999])
+        self.assertEqual(table.where("package-49", "549"), [549])
+        self.assertEqual(table.where("package-49", rows=[49, 50, 549]), [49, 549])
+        names = table.sorted()
+        self.assertEqual(names.names[:4], ["package-0", "package-0", "package-1", "package-1"])
+        self.assertEqual(names.sorted(by="kind")[0].kind, "core")
+        self.assertEqual(table.take(table.argsort(by="version", reverse=True))[0].version, "6.0-1")
+        with self.assertRaises(ValueError):
+            table.argsort(by="desc")
+
+    def test_03_memory(self) -> None:
+        """A table takes less memory than a list of Packages."""
+        sizes: list[int] = []
+        for container in (list, pkg.PackageTable):
+            tracemalloc.start()
+            try:
+                result = container(packages(20000))
+                sizes.append(tracemalloc.get_traced_memory()[0])
+                self.assertEqual(len(result), 20000)
+                del result
+            finally:
+                tracemalloc.stop()
+        self.assertLess(sizes[1], sizes[0] * 0.8)
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:36:14 krylon>
+#
+# /data/code/python/sloth/test_pkgdb.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_pkgdb
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import sqlite3
+import unittest
+from datetime import datetime
+from typing import Final
+
+from sloth import common, pkgdb
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_pkgdb_%Y%m%d_%H%M%S"))
+
+# The parts of pkg's schema we use.
+SCHEMA: Final[str] = """
+CREATE TABLE packages (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    arch TEXT NOT NULL DEFAULT 'FreeBSD:14:amd64',
+    automatic INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX packages_name ON packages(name COLLATE NOCASE);
+"""
+
+
+def create(name: str, packages: list[tuple[str, str, str, int]]) -> str:
+    """Create one of pkg's databases below TEST_DIR, return its path."""
+    path: Final[str] = os.path.join(TEST_DIR, pkgdb.DB_PATH, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp: Final[str] = path + ".tmp"
+    conn = sqlite3.connect(tmp)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO packages (origin, name, version, comment, automatic) VALUES (?, ?, ?, ?, ?)",
+                     [(f"misc/{n}", n, v, c, a) for n, v, c, a in packages])
+    conn.commit()
+    conn.close()
+    # Like pkg update, replace the file.
+    os.replace(tmp, path)
+    return path
+
+
+class PkgDBTest(unittest.TestCase):
+    """Test querying pkg's databases."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_pkgdb_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+        create(pkgdb.LOCAL_DB, [
+            ("emacs", "29.4_1,3", "GNU editing macros", 0),
+            ("gettext-runtime", "0.22.5", "GNU gettext runtime libraries and programs", 1),
+            ("pkg", "1.21.3", "Package manager", 0),
+        ])
+        create("repo-FreeBSD.sqlite", [
+            ("emacs", "29.4_2,3", "GNU editing macros", 0),
+            ("emacs-nox", "29.4_2,3", "GNU editing macros (no X11)", 0),
+            ("gettext-runtime", "0.22.5", "GNU gettext runtime libraries and programs", 0),
+            ("notmuch-emacs", "0.38.3", "Emacs support for notmuch", 0),
+            ("pkg", "1.21.3", "Package manager", 0),
+        ])
+        create("repo-FreeBSD-kmods.sqlite", [
+            ("pkg", "1.22.0.a1", "Package manager, prerelease", 0),
+        ])
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_vercmp(self) -> None:
+        """Compare version numbers the way pkg does."""
+        older: Final[list[tuple[str, str]]] = [
+            ("1.0", "1.0.1"),
+            ("1.0", "1.0a"),
+            ("1.0alpha1", "1.0"),
+            ("1.0alpha", "1.0beta"),
+            ("1.0pre1", "1.0rc1"),
+            ("1.0", "1.0_1"),
+            ("2.0", "1.0,1"),
+            ("29.4_1,3", "29.4_2,3"),
+            ("1.9", "1.10"),
+            ("1.21.3", "1.22.0.a1"),
+        ]
+        for a, b in older:
+            self.assertEqual(pkgdb.vercmp(a, b), -1, (a, b))
+            self.assertEqual(pkgdb.vercmp(b, a), 1, (a, b))
+        self.assertEqual(pkgdb.vercmp("1.0.0", "1.0"), 0)
+        self.assertEqual(pkgdb.vercmp("1.0RC1", "1.0rc1"), 0)
+        self.assertEqual(pkgdb.vercmp("emacs-29.4_2,3", "29.4_2,3"), 0)
+        self.assertEqual(sorted(["1.10", "1.9", "1.9rc1"], key=pkgdb.version_key), ["1.9rc1", "1.9", "1.10"])
+
+    def test_02_query(self) -> None:
+        """Search, list installed packages and updates, without running pkg."""
+        db = pkgdb.PkgDB(TEST_DIR).open()
+        self.assertTrue(db.is_current())
+        self.assertEqual(db.repos, ["FreeBSD", "FreeBSD-kmods"])
+
+        self.assertEqual([(p.name, p.info) for p in db.search("EMACS")],
+                         [("emacs", "i"), ("emacs-nox", ""), ("notmuch-emacs", "")])
+        self.assertEqual([p.name for p in db.search("^emacs")], ["emacs", "emacs-nox"])
+        self.assertEqual([p.name for p in db.search("^emacs-?n")], ["emacs-nox"])
+        self.assertEqual([p.name for p in db.search("^emacs$|^pkg$")], ["emacs", "pkg", "pkg"])
+        self.assertEqual([(p.kind, p.version) for p in db.search("^pkg$")], [("FreeBSD", "1.21.3"), ("FreeBSD-kmods", "1.22.0.a1")])
+        # Terms that are not valid regular expressions are taken literally.
+        self.assertEqual([p.name for p in db.search("emacs(")], [])
+        self.assertEqual([p.name for p in db.search("^emacs", "[")], [])
+        self.assertEqual([(p.name, p.info) for p in db.installed_packages()],
+                         [("emacs", "i"), ("gettext-runtime", "i+"), ("pkg", "i")])
+        self.assertEqual([(p.name, p.version, p.kind) for p in db.updates()],
+                         [("emacs", "29.4_2,3", "FreeBSD"), ("pkg", "1.22.0.a1", "FreeBSD-kmods")])
+        self.assertEqual(db.versions("pkg"), {"installed": "1.21.3", "FreeBSD": "1.21.3", "FreeBSD-kmods": "1.22.0.a1"})
+
+        # Other databases can be joined against.
+        other: Final[str] = os.path.join(TEST_DIR, "history.db")
+        conn = sqlite3.connect(other)
+        conn.execute("CREATE TABLE op (name TEXT)")
+        conn.execute("INSERT INTO op (name) VALUES ('emacs')")
+        conn.commit()
+        conn.close()
+        db.attach("history", other)
+        rows = db.query("SELECT l.name, l.version FROM main.packages l JOIN history.op o ON o.name = l.name")
+        self.assertEqual(rows, [("emacs", "29.4_1,3")])
+
+        # pkg update replaces the catalogs.
+        create("repo-FreeBSD.sqlite", [("emacs", "30.1,3", "GNU editing macros", 0)])
+        self.assertFalse(db.is_current())
+        db.open()
+        self.assertEqual([p.version for p in db.updates()], ["30.1,3", "1.22.0.a1"])
+        self.assertEqual(len(db.query("SELECT * FROM history.op")), 1)
+        db.close()
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
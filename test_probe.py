@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:15:38 krylon>
+#
+# /data/code/python/sloth/test_probe.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_probe
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import os
+import shutil
+import unittest
+from datetime import datetime
+from typing import Final
+
+from sloth import common, probe
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_probe_%Y%m%d_%H%M%S"))
+
+HERE: Final[str] = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProbeTest(unittest.TestCase):
+    """Test probing the system and caching the results."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_probe_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_guess_os(self) -> None:
+        """Recognize the systems from the sample os-release files."""
+        samples: Final[dict[str, tuple[str, str, str]]] = {
+            "debian": ("debian", "12", "unknown"),
+            "raspbian": ("debian", "12", "raspberry-pi"),
+            "freebsd": ("freebsd", "13.2", "unknown"),
+            "opensuse-leap": ("opensuse-leap", "15.5", "unknown"),
+            "arch": ("arch", "n/a", "unknown"),
+        }
+        for name, expect in samples.items():
+            p = probe.guess_os(os.path.join(HERE, f"os-release-{name}"))
+            self.assertEqual(tuple(p), expect)
+
+    def test_02_cache(self) -> None:
+        """The results of probing are cached until os-release changes."""
+        osrel: Final[str] = os.path.join(TEST_DIR, "os-release")
+        cache: Final[str] = os.path.join(TEST_DIR, "probe.json")
+        shutil.copy(os.path.join(HERE, "os-release-debian"), osrel)
+
+        first = probe.probe(osrel, cache)
+        self.assertEqual(first.platform.name, "debian")
+        self.assertTrue(os.path.isfile(cache))
+        # Same process: memoized, no need to look at the disk at all.
+        self.assertIs(probe.probe(osrel, cache), first)
+
+        # A new process would find it in the cache file.
+        probe._probed.clear()  # pylint: disable-msg=W0212
+        self.assertEqual(probe.probe(osrel, cache), first)
+        loaded = probe._load_cache(cache, osrel, probe.fingerprint(osrel))  # pylint: disable-msg=W0212
+        self.assertEqual(loaded, first)
+
+        # After a "distro upgrade", the cache is stale.
+        probe._probed.clear()  # pylint: disable-msg=W0212
+        shutil.copy(os.path.join(HERE, "os-release-opensuse-leap"), osrel)
+        os.utime(osrel, ns=(0, 0))
+        self.assertIsNone(probe._load_cache(cache, osrel, probe.fingerprint(osrel)))  # pylint: disable-msg=W0212
+        second = probe.probe(osrel, cache)
+        self.assertEqual(second.platform.name, "opensuse-leap")
+        probe._probed.clear()  # pylint: disable-msg=W0212
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:04:22 krylon>
+#
+# /data/code/python/sloth/test_resultview.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_resultview
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import unittest
+from typing import Final
+
+from sloth import resultview
+from sloth.pkg import Package, PackageTable
+
+PACKAGES: Final[PackageTable] = PackageTable(Package(name=f"lib{n}-{i}",
+                                                     desc=f"The {n} library, part {i}",
+                                                     version="1.0")
+                                             for n in ("foo", "bar", "baz")
+                                             for i in range(1000))
+
+
+class ResultViewTest(unittest.TestCase):
+    """Test the state of the result view."""
+
+    def test_01_window(self) -> None:
+        """Only the rows on the screen are rendered."""
+        view = resultview.View(PACKAGES, height=10)
+        self.assertEqual(view.visible(), list(range(10)))
+        self.assertEqual(len(view.render()), 30)
+        view.move(15)
+        self.assertEqual(view.current(), 15)
+        self.assertEqual(view.visible(), list(range(6, 16)))
+        view.move(-100)
+        self.assertEqual((view.cursor, view.top), (0, 0))
+        view.move(len(PACKAGES) * 2)
+        self.assertEqual(view.current(), len(PACKAGES) - 1)
+        self.assertIn("page 300/300", view.status())
+
+    def test_02_filter(self) -> None:
+        """Filter on all words, narrow down what matched before when the filter grows."""
+        view = resultview.View(PACKAGES.take(range(len(PACKAGES))))
+        view.set_filter("BAR")
+        self.assertEqual(len(view.matches), 1000)
+        matched: Final = view.matches
+        # Only the packages that matched "bar" are looked at again.
+        assert view.packages.keys is not None
+        view.packages.keys = [k if i in set(matched) else "bar 999 bogus" for i, k in enumerate(view.packages.keys)]
+        view.set_filter("bar 999")
+        self.assertEqual([PACKAGES[i].name for i in view.matches], ["libbar-999"])
+        view.set_filter("")
+        self.assertEqual(len(view.matches), len(PACKAGES))
+        view.set_filter("nothing")
+        self.assertIsNone(view.current())
+        view.toggle()
+        self.assertEqual(view.render(), [])
+
+    def test_03_select(self) -> None:
+        """Keep the selection across filters."""
+        view = resultview.View(PACKAGES, {0})
+        view.set_filter("libbaz-1")
+        view.toggle()
+        self.assertEqual(view.selected, {0, 2001})
+        view.toggle_all()
+        self.assertEqual(len(view.selected), 1 + len(view.matches))
+        view.toggle_all()
+        self.assertEqual(view.selected, {0})
+        view.set_filter("")
+        view.toggle()
+        self.assertEqual(view.selected, set())
+
+    def test_04_run(self) -> None:
+        """Drive the view with keys."""
+        # pylint: disable-msg=C0415
+        from prompt_toolkit.application import create_app_session
+        from prompt_toolkit.input import create_pipe_input
+        from prompt_toolkit.output import DummyOutput
+
+        with create_pipe_input() as inp, create_app_session(input=inp, output=DummyOutput()):
+            inp.send_text("libfoo-99\t\x1b[B\x1b[B\t\r")
+            self.assertEqual(resultview.run(PACKAGES, "Results", "test", {5}), {5, 99, 992})
+        with create_pipe_input() as inp, create_app_session(input=inp, output=DummyOutput()):
+            inp.send_text("\t\x03")
+            self.assertIsNone(resultview.run(PACKAGES, "Results", "test"))
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
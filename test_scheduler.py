@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 08:28:58 krylon>
+#
+# /data/code/python/sloth/test_scheduler.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_scheduler
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import fcntl
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Final, Iterator
+
+from sloth import common, pkg, scheduler, shell
+from sloth.pkg import Package
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_scheduler_%Y%m%d_%H%M%S"))
+
+
+class SchedulerTest(unittest.TestCase):
+    """Test coalescing and scheduling refreshes."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_scheduler_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_coalesce(self) -> None:
+        """Whoever asks for a refresh while one is in progress gets its result."""
+        calls: list[int] = []
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def job() -> int:
+            calls.append(1)
+            started.set()
+            proceed.wait(5)
+            return 42
+
+        sched = scheduler.RefreshScheduler(job, os.path.join(TEST_DIR, "01.lock"))
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            first = pool.submit(sched.refresh)
+            started.wait(5)
+            self.assertTrue(sched.busy())
+            others = [pool.submit(sched.refresh) for _ in range(3)]
+            time.sleep(0.2)
+            proceed.set()
+            self.assertEqual([f.result() for f in [first] + others], [42] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(sched.busy())
+        # A failed refresh does not count as one.
+        self.assertEqual(sched.last_refresh(), 0.0)
+
+    def test_02_other_process(self) -> None:
+        """If another process refreshed while we waited for the lock, we do not refresh again."""
+        lockfile: str = os.path.join(TEST_DIR, "02.lock")
+        calls: list[int] = []
+        sched = scheduler.RefreshScheduler(lambda: calls.append(1) or 0, lockfile)
+
+        # A lock on a file descriptor of its own behaves like another process.
+        fd = os.open(lockfile, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        waiter = threading.Thread(target=sched.refresh)
+        waiter.start()
+        time.sleep(0.05)
+        sched.mark(time.time())
+        os.close(fd)
+        waiter.join(5)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(sched.refresh(), 0)
+        self.assertEqual(calls, [1])
+        self.assertAlmostEqual(sched.last_refresh(), time.time(), delta=5)
+
+    def test_03_background(self) -> None:
+        """Refresh in the background when the interval has passed."""
+        lockfile: str = os.path.join(TEST_DIR, "03.lock")
+        done = threading.Event()
+        sched = scheduler.RefreshScheduler(lambda: done.set() or 0, lockfile, interval=3600, jitter=0)
+        sched.mark(time.time() - 7200)
+        sched.start()
+        try:
+            self.assertTrue(sched.is_active())
+            self.assertTrue(done.wait(5))
+            self.assertEqual(sched.wait(), 0)
+            self.assertGreater(sched.due(), time.time() + 3000)
+        finally:
+            sched.stop()
+        self.assertFalse(sched.is_active())
+        with self.assertRaises(ValueError):
+            scheduler.RefreshScheduler(lambda: 0, lockfile, interval=0).start()
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Needs /proc to count open files")
+    def test_04_background_db(self) -> None:
+        """A refresh in the background does not leave a connection to the database open."""
+        class Refresh(pkg.OpenBSD):
+            """Refreshes successfully without doing anything."""
+
+            def refresh(self, **kwargs) -> int:
+                return 0
+
+            def catalog(self) -> Iterator[Package]:
+                return iter([Package(name="emacs", desc="GNU Emacs", version="29.4")])
+
+        def connections() -> int:
+            db: Final[str] = os.path.realpath(common.path.db())
+            cnt: int = 0
+            for fd in os.listdir("/proc/self/fd"):
+                try:
+                    cnt += os.readlink(f"/proc/self/fd/{fd}") == db
+                except OSError:
+                    pass
+            return cnt
+
+        sh = shell.Shell()
+        sh._pk = Refresh()  # pylint: disable-msg=W0212
+        job = sh._Shell__refresh_job  # pylint: disable-msg=W0212
+
+        def refresh() -> None:
+            thread = threading.Thread(target=job)
+            thread.start()
+            thread.join()
+
+        try:
+            # The first refresh creates the database and starts the OpLogger.
+            refresh()
+            before: Final[int] = connections()
+            for _ in range(3):
+                refresh()
+            self.assertEqual(connections(), before)
+            self.assertEqual(sh.db.catalog_count(sh.pk.platform.name), 1)
+        finally:
+            sh.oplog.close()
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
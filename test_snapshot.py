@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:48:44 krylon>
+#
+# /data/code/python/sloth/test_snapshot.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_snapshot
+
+(c) 2026 Benjamin Walkenhorst
+"""
+
+import unittest
+from typing import Final
+
+from sloth import pacmandb, snapshot
+from sloth.pkg import Package
+from sloth.snapshot import Action, Change, Entry
+
+BEFORE: Final[list[Entry]] = [
+    Entry("bash", "x86_64", "5.2.026-2", "core"),
+    Entry("emacs", "x86_64", "29.4-3", "extra"),
+    Entry("gcc", "x86_64", "14.1.1-1", "core"),
+    Entry("vim", "x86_64", "9.1-1", "extra"),
+]
+
+AFTER: Final[list[Entry]] = [
+    Entry("bash", "x86_64", "5.2.026-2", "core"),
+    Entry("emacs", "x86_64", "29.3-1", "extra"),
+    Entry("gcc", "x86_64", "14.2.1-1", "core"),
+    Entry("lib32-gcc-libs", "x86_64", "14.2.1-1", "multilib"),
+]
+
+
+class SnapshotTest(unittest.TestCase):
+    """Test comparing snapshots and planning rollbacks."""
+
+    def test_01_inventory(self) -> None:
+        """Turn Packages into a sorted snapshot, one entry per name and architecture."""
+        entries = snapshot.inventory([
+            Package(name="vim", desc="", version="9.1-1", kind="extra", arch="x86_64"),
+            Package(name="kernel", desc="", version="6.9.4", kind="fedora", arch="x86_64"),
+            Package(name="kernel", desc="", version="6.10.2", kind="updates", arch="x86_64"),
+            Package(name="bash", desc=""),
+        ])
+        self.assertEqual(entries, [
+            Entry("bash", "", "", ""),
+            Entry("kernel", "x86_64", "6.10.2", "updates"),
+            Entry("vim", "x86_64", "9.1-1", "extra"),
+        ])
+
+    def test_02_delta(self) -> None:
+        """A delta holds what changed, and applying it yields the new snapshot."""
+        changes = snapshot.delta(BEFORE, AFTER)
+        self.assertEqual([(e.name, e.version) for e in changes], [
+            ("emacs", "29.3-1"),
+            ("gcc", "14.2.1-1"),
+            ("lib32-gcc-libs", "14.2.1-1"),
+            ("vim", None),
+        ])
+        state = {e.key(): e for e in BEFORE}
+        snapshot.apply(state, changes)
+        self.assertEqual(sorted(state.values()), AFTER)
+        self.assertEqual(snapshot.delta(AFTER, AFTER), [])
+
+    def test_03_diff(self) -> None:
+        """Walk two snapshots side by side."""
+        self.assertEqual(snapshot.diff(BEFORE, AFTER, pacmandb.vercmp), [
+            Change(Action.Downgrade, "emacs", "x86_64", "29.4-3", "29.3-1"),
+            Change(Action.Upgrade, "gcc", "x86_64", "14.1.1-1", "14.2.1-1"),
+            Change(Action.Install, "lib32-gcc-libs", "x86_64", None, "14.2.1-1"),
+            Change(Action.Remove, "vim", "x86_64", "9.1-1", None),
+        ])
+        # Versions that only differ in their spelling are the same.
+        self.assertEqual(snapshot.diff([Entry("a", "", "1.01", "")], [Entry("a", "", "1.1", "")], pacmandb.vercmp), [])
+        self.assertEqual(len(snapshot.diff([], AFTER, pacmandb.vercmp)), len(AFTER))
+
+    def test_04_plan(self) -> None:
+        """Plan the way back from AFTER to BEFORE."""
+        p = snapshot.plan(AFTER, BEFORE, pacmandb.vercmp)
+        self.assertEqual([(c.name, c.new) for c in p.install], [("emacs", "29.4-3"), ("vim", "9.1-1")])
+        self.assertEqual([c.name for c in p.remove], ["lib32-gcc-libs"])
+        self.assertEqual([(c.name, c.old, c.new) for c in p.downgrade], [("gcc", "14.2.1-1", "14.1.1-1")])
+        self.assertEqual([c.name for c in p.changes()], ["emacs", "gcc", "lib32-gcc-libs", "vim"])
+        self.assertTrue(snapshot.plan(BEFORE, BEFORE, pacmandb.vercmp).is_empty())
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #
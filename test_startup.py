@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time-stamp: <2026-10-17 07:14:51 krylon>
+#
+# /data/code/python/sloth/test_startup.py
+# created on 17. 10. 2026
+# (c) 2026 Benjamin Walkenhorst
+#
+# This file is part of the Sloth Meta Package Manager. It is distributed under the
+# terms of the GNU General Public License 3. See the file LICENSE for details
+# or find a copy online at https://www.gnu.org/licenses/gpl-3.0
+
+"""
+sloth.test_startup
+
+(c) 2026 Benjamin Walkenhorst
+
+Make sure starting the shell stays cheap, e.g. when it is run from cron.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+from typing import Final
+
+import sloth
+from sloth import common, shell
+
+TEST_DIR: str = os.path.join(
+    datetime.now().strftime("sloth_test_startup_%Y%m%d_%H%M%S"))
+
+# Modules that must not be loaded just by importing the shell.
+HEAVY: Final[list[str]] = [
+    "prompt_toolkit",
+    "tomlkit",
+    "readline",
+    "dnf",
+    "asyncio",
+    "sloth.fleet",
+]
+
+# The time it may take to import sloth.shell, in milliseconds. Slow machines
+# can raise it via the environment.
+BUDGET: Final[int] = int(os.environ.get("SLOTH_IMPORT_BUDGET_MS", "150"))
+
+IMPORT_PAT: Final[re.Pattern] = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| sloth\.shell$", re.M)
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    """Run a fresh interpreter that can import sloth."""
+    env = dict(os.environ)
+    parent: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(sloth.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (parent, env.get("PYTHONPATH")) if p)
+    return subprocess.run([sys.executable, *args],
+                          capture_output=True,
+                          text=True,
+                          check=True,
+                          env=env)
+
+
+class StartupTest(unittest.TestCase):
+    """Keep an eye on what it costs to start the shell."""
+
+    @classmethod
+    def setUpClass(cls) -> None:  # noqa: D102
+        root: str = "/tmp"
+        if os.path.isdir("/data/ram"):
+            root = "/data/ram"
+        global TEST_DIR  # pylint: disable-msg=W0603
+        TEST_DIR = os.path.join(
+            root,
+            datetime.now().strftime("sloth_test_startup_%Y%m%d_%H%M%S"))
+        common.set_basedir(TEST_DIR)
+
+    @classmethod
+    def tearDownClass(cls) -> None:  # noqa: D102
+        os.system(f'rm -rf "{TEST_DIR}"')
+
+    def test_01_lazy_imports(self) -> None:
+        """Importing the shell does not load any heavy modules."""
+        proc = python("-c", "import sys, sloth.shell; print(' '.join(sys.modules))")
+        loaded: Final[set[str]] = set(proc.stdout.split())
+        for mod in HEAVY:
+            self.assertNotIn(mod, loaded)
+
+    def test_02_import_budget(self) -> None:
+        """Importing the shell stays within its time budget."""
+        best: int = sys.maxsize
+        for _ in range(3):
+            proc = python("-X", "importtime", "-c", "import sloth.shell")
+            m = IMPORT_PAT.search(proc.stderr)
+            self.assertIsNotNone(m)
+            assert m is not None
+            best = min(best, int(m[1]))
+        self.assertLess(best // 1000, BUDGET)
+
+    def test_03_deferred_construction(self) -> None:
+        """Creating the Shell neither opens the database nor probes the system."""
+        sh = shell.Shell()
+        self.assertIsNone(sh._db)  # pylint: disable-msg=W0212
+        self.assertIsNone(sh._pk)  # pylint: disable-msg=W0212
+
+# Local Variables: #
+# python-indent: 4 #
+# End: #